@@ -1,16 +1,32 @@
-import os
 from decimal import Decimal
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from sqlalchemy import text
+from sqlalchemy.orm import joinedload, contains_eager
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
+from werkzeug.http import parse_content_range_header
 
 from extensions import db, csrf
-from models import User, Event, Category, Theme, ThemeColors
+from models import User, Event, Category, Theme, ThemeColors, EVENT_SORT_KEYS, EVENT_CATEGORY_SORT_KEY
+from utils.theme_manager import bump_theme_generation
+from utils.page_cache import invalidate_pages, EVENTS_CHANNEL, CATEGORIES_CHANNEL
+from utils.jobs import enqueue, job_summary
+from utils.image_variants import apply_image_metadata
+from utils.user_cache import forget_user
+from utils.pagination import InvalidCursor, keyset_page, estimate_count
+from utils.uploads import (UploadError, save_upload, claim_upload, create_session,
+                           session_status, append_chunk, release_event_media, direct_upload)
 
 admin_bp = Blueprint('admin_custom', __name__)
 
+DASHBOARD_PAGE_SIZE = 50
+
+@admin_bp.context_processor
+def inject_upload_options():
+    # The event form hashes files in the browser and uploads them straight to
+    # the store when the storage backend allows it
+    return {'direct_upload': current_app.extensions['storage'].supports_direct_upload}
+
 @admin_bp.route('/admin')
 @login_required
 def dashboard():
@@ -20,20 +36,31 @@ def dashboard():
     
     categories = Category.query.order_by(Category.name).all()
     category_id = request.args.get('category', 'all')
+    per_page = min(max(request.args.get('per_page', DASHBOARD_PAGE_SIZE, type=int), 1), 500)
     
     query = Event.query
     
     if category_id != 'all':
         try:
             category_id = int(category_id)
-            query = query.filter_by(category_id=category_id).order_by(Event.sequence.nullslast(), Event.date.desc())
+            query = query.filter_by(category_id=category_id) \
+                .options(joinedload(Event.category))
+            keys = EVENT_SORT_KEYS
         except (ValueError, TypeError):
             category_id = 'all'
-    else:
-        query = query.join(Category).order_by(Category.name, Event.sequence.nullslast(), Event.date.desc())
+    if category_id == 'all':
+        query = query.join(Category).options(contains_eager(Event.category))
+        keys = (EVENT_CATEGORY_SORT_KEY,) + EVENT_SORT_KEYS
     
-    events = query.all()
-    return render_template('admin/dashboard.html', events=events, categories=categories)
+    try:
+        page = keyset_page(query, keys, request.args.get('after'), per_page)
+    except InvalidCursor as e:
+        current_app.logger.warning(f"Ignoring dashboard cursor: {str(e)}")
+        page = keyset_page(query, keys, None, per_page)
+    total, exact = estimate_count(query, f"dashboard:{category_id}", EVENTS_CHANNEL)
+    return render_template('admin/dashboard.html', events=page.items, next_cursor=page.next_cursor,
+                           total_events=total, total_exact=exact, per_page=per_page,
+                           categories=categories, jobs=job_summary())
 
 @admin_bp.route('/admin/login', methods=['GET', 'POST'])
 def login():
@@ -67,6 +94,7 @@ def login():
 @admin_bp.route('/admin/logout')
 @login_required
 def logout():
+    forget_user(current_user.get_id())
     logout_user()
     return redirect(url_for('index'))
 
@@ -95,12 +123,13 @@ def new_theme():
                 flash('Theme name is required', 'danger')
                 return render_template('admin/theme_form.html')
                 
-            # Create new theme
+            # Create new theme; activation happens below so the single
+            # active theme index is never violated mid-transaction
             theme = Theme(
                 name=theme_name,
                 slug=theme_name.lower().replace(' ', '-'),
                 is_custom=True,
-                is_active=request.form.get('is_active') == 'true'
+                is_active=False
             )
             db.session.add(theme)
             db.session.flush()  # Get the theme ID
@@ -114,8 +143,16 @@ def new_theme():
             )
             db.session.add(colors)
             
+            if request.form.get('is_active') == 'true':
+                db.session.execute(text("UPDATE theme SET is_active = FALSE"))
+                db.session.execute(
+                    text("UPDATE theme SET is_active = TRUE WHERE id = :theme_id"),
+                    {"theme_id": theme.id}
+                )
+            
             db.session.add(theme)
             db.session.commit()
+            bump_theme_generation()
             flash('Theme created successfully')
             return redirect(url_for('admin_custom.list_themes'))
         except Exception as e:
@@ -204,6 +241,7 @@ def edit_theme(id):
                 
                 # Commit all changes
                 db.session.commit()
+                bump_theme_generation()
                 flash('Theme updated successfully', 'success')
                 return redirect(url_for('admin_custom.list_themes'))
                 
@@ -235,6 +273,7 @@ def delete_theme(id):
             
         db.session.delete(theme)
         db.session.commit()
+        bump_theme_generation()
         flash('Theme deleted successfully', 'success')
         
     except Exception as e:
@@ -253,23 +292,26 @@ def delete_file(id, file_type):
         return redirect(url_for('index'))
 
     event = Event.query.get_or_404(id)
+    released = {}
     try:
         if file_type == 'image':
             if event.image_path:
-                file_path = os.path.join(current_app.static_folder, event.image_path)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                released['image'] = (event.image_path, event.image_variants)
                 event.image_path = None
+                event.image_variants = None
                 flash('Image deleted successfully')
         elif file_type == 'video':
             if event.video_path:
-                file_path = os.path.join(current_app.static_folder, event.video_path)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                released['video'] = (event.video_path, event.video_variants)
                 event.video_path = None
+                event.video_status = None
+                event.video_variants = None
                 flash('Video deleted successfully')
 
         db.session.commit()
+        invalidate_pages(EVENTS_CHANNEL)
+        # Files may be shared with other events, so only drop them once unused
+        release_event_media(event.id, **released)
     except Exception as e:
         flash(f'Error deleting file: {str(e)}', 'error')
         db.session.rollback()
@@ -292,36 +334,15 @@ def new_event():
             return render_template('admin/event_form.html', categories=categories)
 
         try:
-            # Ensure upload directories exist with proper permissions
-            upload_base = os.path.join(current_app.static_folder, 'uploads')
-            images_dir = os.path.join(upload_base, 'images')
-            videos_dir = os.path.join(upload_base, 'videos')
-            
-            for directory in [upload_base, images_dir, videos_dir]:
-                try:
-                    if not os.path.exists(directory):
-                        os.makedirs(directory, mode=0o755)
-                    else:
-                        current_mode = os.stat(directory).st_mode & 0o777
-                        if current_mode != 0o755:
-                            os.chmod(directory, 0o755)
-                except OSError as e:
-                    flash(f'Error managing upload directory {directory}: {str(e)}')
-                    return render_template('admin/event_form.html', categories=categories)
-
-            # Handle image upload with improved validation
+            # Handle image upload: either already sent through a chunked
+            # upload session, or streamed from the form
             try:
-                image = request.files['image']
-                current_app.logger.info(f"Processing image upload: {image.filename}")
-                
-                Event.validate_image(image)
-                image_filename = secure_filename(image.filename)
-                image_path = os.path.join('uploads', 'images', image_filename)
-                full_image_path = os.path.join(current_app.static_folder, image_path)
-                
-                current_app.logger.info(f"Saving image to: {full_image_path}")
-                image.save(full_image_path)
-                os.chmod(full_image_path, 0o644)
+                image_path = claim_upload('image', request.form.get('image_upload'))
+                if not image_path:
+                    image = request.files.get('image')
+                    Event.validate_image(image)
+                    current_app.logger.info(f"Processing image upload: {image.filename}")
+                    image_path = save_upload(image, 'image')
                 current_app.logger.info(f"Image saved successfully")
             except (ValueError, OSError) as e:
                 current_app.logger.error(f"Error uploading image: {str(e)}")
@@ -330,19 +351,14 @@ def new_event():
 
             # Handle optional video upload
             video_path = None
-            if 'video' in request.files and request.files['video'].filename:
+            if request.form.get('video_upload') or ('video' in request.files and request.files['video'].filename):
                 try:
-                    video = request.files['video']
-                    current_app.logger.info(f"Processing video upload: {video.filename}")
-                    
-                    Event.validate_video(video)
-                    video_filename = secure_filename(video.filename)
-                    video_path = os.path.join('uploads', 'videos', video_filename)
-                    full_video_path = os.path.join(current_app.static_folder, video_path)
-                    
-                    current_app.logger.info(f"Saving video to: {full_video_path}")
-                    video.save(full_video_path)
-                    os.chmod(full_video_path, 0o644)
+                    video_path = claim_upload('video', request.form.get('video_upload'))
+                    if not video_path:
+                        video = request.files['video']
+                        current_app.logger.info(f"Processing video upload: {video.filename}")
+                        Event.validate_video(video)
+                        video_path = save_upload(video, 'video')
                     current_app.logger.info(f"Video saved successfully")
                 except (ValueError, OSError) as e:
                     current_app.logger.error(f"Error uploading video: {str(e)}")
@@ -384,7 +400,13 @@ def new_event():
             
         try:
             db.session.add(event)
+            db.session.flush()
+            enqueue('image_variants', event_id=event.id, image_path=event.image_path)
+            if event.video_path:
+                event.video_status = 'pending'
+                enqueue('video_variants', event_id=event.id, video_path=event.video_path)
             db.session.commit()
+            invalidate_pages(EVENTS_CHANNEL)
             flash('Event created successfully')
             return redirect(url_for('admin_custom.dashboard'))
         except Exception as e:
@@ -449,39 +471,41 @@ def edit_event(id):
                 return render_template('admin/event_form.html', event=event, categories=categories)
 
             # Handle image upload if new image is provided
-            if 'image' in request.files and request.files['image'].filename:
+            image_path = claim_upload('image', request.form.get('image_upload'))
+            if not image_path and 'image' in request.files and request.files['image'].filename:
                 image = request.files['image']
                 Event.validate_image(image)
-                image_filename = secure_filename(image.filename)
-                image_path = os.path.join('uploads', 'images', image_filename)
-                full_image_path = os.path.join(current_app.static_folder, image_path)
-                image.save(full_image_path)
-                os.chmod(full_image_path, 0o644)
-                
+                image_path = save_upload(image, 'image')
+            # Previous files are released after the commit, if nothing else uses them
+            released = {}
+            if image_path and image_path != event.image_path:
                 if event.image_path:
-                    old_image_path = os.path.join(current_app.static_folder, event.image_path)
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
+                    released['image'] = (event.image_path, event.image_variants)
                 event.image_path = image_path
+                # Serve the original until the job has built the new variants
+                enqueue('image_variants', event_id=event.id, image_path=image_path)
+                event.image_variants = None
+                apply_image_metadata(event, None)
 
             # Handle video upload if new video is provided
-            if 'video' in request.files and request.files['video'].filename:
+            video_path = claim_upload('video', request.form.get('video_upload'))
+            if not video_path and 'video' in request.files and request.files['video'].filename:
                 video = request.files['video']
                 Event.validate_video(video)
-                video_filename = secure_filename(video.filename)
-                video_path = os.path.join('uploads', 'videos', video_filename)
-                full_video_path = os.path.join(current_app.static_folder, video_path)
-                video.save(full_video_path)
-                os.chmod(full_video_path, 0o644)
-                
+                video_path = save_upload(video, 'video')
+            if video_path and video_path != event.video_path:
                 if event.video_path:
-                    old_video_path = os.path.join(current_app.static_folder, event.video_path)
-                    if os.path.exists(old_video_path):
-                        os.remove(old_video_path)
+                    released['video'] = (event.video_path, event.video_variants)
                 event.video_path = video_path
+                # Serve the original until the job has built the web MP4
+                enqueue('video_variants', event_id=event.id, video_path=video_path)
+                event.video_status = 'pending'
+                event.video_variants = None
 
             try:
                 db.session.commit()
+                invalidate_pages(EVENTS_CHANNEL)
+                release_event_media(event.id, **released)
                 current_app.logger.info(f"Event {id} updated successfully")
                 flash('Event updated successfully', 'success')
                 return redirect(url_for('admin_custom.dashboard'))
@@ -502,6 +526,43 @@ def edit_event(id):
 
     return render_template('admin/event_form.html', event=event, categories=categories)
 
+@admin_bp.route('/admin/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    if not current_user.is_admin:
+        return jsonify(error='Admin privileges required'), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('sha256') and current_app.extensions['storage'].supports_direct_upload:
+            return jsonify(direct_upload(data.get('kind'), data.get('filename'), data.get('size'), data['sha256'])), 201
+        return jsonify(create_session(data.get('kind'), data.get('filename'), data.get('size'))), 201
+    except UploadError as e:
+        current_app.logger.warning(f"Rejected upload session: {str(e)}")
+        return jsonify(error=str(e)), e.status
+
+@admin_bp.route('/admin/uploads/<upload_id>', methods=['GET', 'PUT'])
+@login_required
+def upload_chunk(upload_id):
+    if not current_user.is_admin:
+        return jsonify(error='Admin privileges required'), 403
+
+    try:
+        if request.method == 'GET':
+            return jsonify(session_status(upload_id))
+
+        content_range = parse_content_range_header(request.headers.get('Content-Range'))
+        if content_range is None or content_range.units != 'bytes' or content_range.length is None:
+            return jsonify(error='A Content-Range header is required'), 400
+        return jsonify(append_chunk(upload_id, request.stream, content_range.start,
+                                    content_range.stop, content_range.length))
+    except UploadError as e:
+        current_app.logger.warning(f"Upload {upload_id} chunk rejected: {str(e)}")
+        body = {'error': str(e)}
+        if e.status == 409:
+            body.update(session_status(upload_id))
+        return jsonify(body), e.status
+
 @admin_bp.route('/admin/event/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_event(id):
@@ -511,8 +572,12 @@ def delete_event(id):
 
     try:
         event = Event.query.get_or_404(id)
+        released = {'image': (event.image_path, event.image_variants),
+                    'video': (event.video_path, event.video_variants)}
         db.session.delete(event)
         db.session.commit()
+        invalidate_pages(EVENTS_CHANNEL)
+        release_event_media(id, **released)
         flash('Event deleted successfully', 'success')
     except Exception as e:
         current_app.logger.error(f"Error deleting event {id}: {str(e)}")
@@ -552,6 +617,7 @@ def new_category():
             )
             db.session.add(category)
             db.session.commit()
+            invalidate_pages(CATEGORIES_CHANNEL)
             flash('Category created successfully', 'success')
             return redirect(url_for('admin_custom.list_categories'))
         except Exception as e:
@@ -584,6 +650,7 @@ def edit_category(id):
             
             try:
                 db.session.commit()
+                invalidate_pages(CATEGORIES_CHANNEL)
                 flash('Category updated successfully', 'success')
                 return redirect(url_for('admin_custom.list_categories'))
             except Exception as e:
@@ -613,6 +680,7 @@ def delete_category(id):
 
         db.session.delete(category)
         db.session.commit()
+        invalidate_pages(CATEGORIES_CHANNEL)
         flash('Category deleted successfully', 'success')
     except Exception as e:
         current_app.logger.error(f"Error deleting category {id}: {str(e)}")
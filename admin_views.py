@@ -7,6 +7,8 @@ from wtforms import StringField
 from sqlalchemy import text
 from extensions import db
 from models import User, Category, Event, Testimonial, Contact, Theme, ThemeColors
+from utils.theme_manager import bump_theme_generation
+from utils.page_cache import invalidate_pages, EVENTS_CHANNEL, CATEGORIES_CHANNEL, TESTIMONIALS_CHANNEL
 
 def init_admin(app):
     """Initialize Flask-Admin with secure views."""
@@ -39,12 +41,21 @@ def init_admin(app):
         raise
 
 class SecureModelView(ModelView):
+    # Cached public pages built from this model, invalidated after every write
+    cache_channels = ()
+
     def is_accessible(self):
         return current_user.is_authenticated and current_user.is_admin
 
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for('admin_custom.login'))
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_pages(*self.cache_channels)
+
+    def after_model_delete(self, model):
+        invalidate_pages(*self.cache_channels)
+
 class SecureAdminIndexView(AdminIndexView):
     @expose('/')
     def index(self):
@@ -53,10 +64,12 @@ class SecureAdminIndexView(AdminIndexView):
         return super().index()
 
 class EventModelView(SecureModelView):
+    cache_channels = (EVENTS_CHANNEL,)
     column_list = ('title', 'category', 'date')
     column_searchable_list = ['title']
     column_filters = ['category_id', 'date']
-    form_excluded_columns = ['image_path', 'video_path']
+    form_excluded_columns = ['image_path', 'video_path', 'image_variants', 'image_width', 'image_height',
+                             'image_color', 'image_placeholder', 'video_status', 'video_variants']
     form_overrides = {
         'description': CKEditorField
     }
@@ -64,11 +77,13 @@ class EventModelView(SecureModelView):
     edit_template = 'admin/event_edit.html'
 
 class CategoryModelView(SecureModelView):
+    cache_channels = (CATEGORIES_CHANNEL,)
     column_list = ('name', 'slug')
     column_searchable_list = ['name']
     form_excluded_columns = ['events']
 
 class TestimonialModelView(SecureModelView):
+    cache_channels = (TESTIMONIALS_CHANNEL,)
     column_list = ('client_name', 'event_type', 'date')
     column_searchable_list = ['client_name', 'event_type']
     form_overrides = {
@@ -122,6 +137,10 @@ class ThemeModelView(SecureModelView):
             
             # Store original is_active state before processing
             should_activate = model.is_active
+            if should_activate:
+                # Activation is done below with SQL; flushing is_active=True
+                # first would clash with the single active theme index
+                model.is_active = False
             
             # Process colors first
             for color_field in ['primary_color', 'secondary_color', 'accent_color']:
@@ -229,4 +248,11 @@ class ThemeModelView(SecureModelView):
             db.session.rollback()
             raise ValueError(str(e))
 
+    def after_model_change(self, form, model, is_created):
+        """Invalidate the cached theme once Flask-Admin has committed the change."""
+        bump_theme_generation()
+
+    def after_model_delete(self, model):
+        bump_theme_generation()
+
 # Admin initialization is now handled in app.py's register_extensions function
\ No newline at end of file
@@ -1,13 +1,27 @@
+"""Application factory.
+
+Importing this module builds nothing: ``create_app`` configures the app and
+registers extensions without touching the database, and the work that does
+(checking the connection, creating upload directories, seeding the default
+themes) runs once in ``startup``, before the first request or explicitly from
+``main.py``. Scripts that only need models and an app context can call
+``create_app(views=False)`` to skip the routes and Flask-Admin, and with them
+the ``flask_admin`` and ``flask_ckeditor`` imports, as well as the media
+index, the job queue, media processing and the page cache.
+
+``flask`` finds the factory on its own; gunicorn takes ``"app:create_app()"``.
+"""
 import os
 import logging
+import threading
 from flask import Flask
-from extensions import db, login_manager, csrf, migrate, ckeditor
+from extensions import db, login_manager, csrf, migrate
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def create_app():
+def create_app(config=None, views=True):
+    # Setup logging; set LOG_LEVEL=DEBUG for verbose output
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
     app = Flask(__name__)
     
     # Configuration
@@ -19,6 +33,66 @@ def create_app():
     }
     app.config["TEMPLATES_AUTO_RELOAD"] = True
     app.config["FLASK_ADMIN_SWATCH"] = "cosmo"
+    # Cache invalidation across workers: 'file' (single host), 'local' or 'redis'
+    app.config["INVALIDATION_BACKEND"] = os.environ.get("INVALIDATION_BACKEND", "file")
+    app.config["INVALIDATION_DIR"] = os.environ.get("INVALIDATION_DIR")
+    app.config["INVALIDATION_POLL_INTERVAL"] = float(os.environ.get("INVALIDATION_POLL_INTERVAL", "1.0"))
+    app.config["INVALIDATION_BROKER_URL"] = os.environ.get("INVALIDATION_BROKER_URL")
+    # Seconds between media index reconciliation scans (0 disables them)
+    app.config["MEDIA_INDEX_RECONCILE_INTERVAL"] = int(os.environ.get("MEDIA_INDEX_RECONCILE_INTERVAL", "0"))
+    # Full-page cache for public routes: 'memory', 'disk' or 'null'
+    app.config["PAGE_CACHE_BACKEND"] = os.environ.get("PAGE_CACHE_BACKEND", "memory")
+    app.config["PAGE_CACHE_DIR"] = os.environ.get("PAGE_CACHE_DIR")
+    app.config["PAGE_CACHE_MAX_ENTRIES"] = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "256"))
+    app.config["PAGE_CACHE_DISK_MAX_ENTRIES"] = int(os.environ.get("PAGE_CACHE_DISK_MAX_ENTRIES", "4096"))
+    # Uploads: request bodies are capped while they stream in; large files
+    # go through resumable chunked sessions stored in UPLOAD_SESSION_DIR
+    app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", str(64 * 1024 * 1024)))
+    app.config["UPLOAD_SESSION_DIR"] = os.environ.get("UPLOAD_SESSION_DIR")
+    app.config["UPLOAD_CHUNK_SIZE"] = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+    app.config["UPLOAD_SESSION_TTL"] = int(os.environ.get("UPLOAD_SESSION_TTL", "86400"))
+    # Media storage: "local" (static folder) or "s3" (any S3-compatible store)
+    app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "local")
+    app.config["STORAGE_S3_BUCKET"] = os.environ.get("STORAGE_S3_BUCKET")
+    app.config["STORAGE_S3_ENDPOINT_URL"] = os.environ.get("STORAGE_S3_ENDPOINT_URL")
+    app.config["STORAGE_S3_REGION"] = os.environ.get("STORAGE_S3_REGION")
+    app.config["STORAGE_S3_PUBLIC_URL"] = os.environ.get("STORAGE_S3_PUBLIC_URL")
+    app.config["STORAGE_S3_PRESIGN_TTL"] = int(os.environ.get("STORAGE_S3_PRESIGN_TTL", "3600"))
+    # Let nginx/Apache send media files (X-Sendfile) instead of the worker
+    app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "false").lower() == "true"
+    # Background jobs: worker threads per web process (0 = only `flask jobs worker`)
+    app.config["JOBS_WORKERS"] = int(os.environ.get("JOBS_WORKERS", "2"))
+    app.config["JOBS_POLL_INTERVAL"] = float(os.environ.get("JOBS_POLL_INTERVAL", "5"))
+    app.config["JOBS_RETRY_DELAY"] = int(os.environ.get("JOBS_RETRY_DELAY", "30"))
+    # A running job heartbeats every JOBS_HEARTBEAT_INTERVAL seconds and is
+    # presumed lost after JOBS_TIMEOUT seconds without one
+    app.config["JOBS_HEARTBEAT_INTERVAL"] = int(os.environ.get("JOBS_HEARTBEAT_INTERVAL", "30"))
+    app.config["JOBS_TIMEOUT"] = int(os.environ.get("JOBS_TIMEOUT", "300"))
+    # Video processing (ffmpeg/ffprobe are looked up on PATH when unset)
+    app.config["VIDEO_FFMPEG_PATH"] = os.environ.get("VIDEO_FFMPEG_PATH")
+    app.config["VIDEO_FFPROBE_PATH"] = os.environ.get("VIDEO_FFPROBE_PATH")
+    app.config["VIDEO_PROCESS_TIMEOUT"] = int(os.environ.get("VIDEO_PROCESS_TIMEOUT", "900"))
+    app.config["VIDEO_MAX_WIDTH"] = int(os.environ.get("VIDEO_MAX_WIDTH", "1920"))
+    app.config["VIDEO_POSTER_OFFSET"] = float(os.environ.get("VIDEO_POSTER_OFFSET", "1.0"))
+    # Orphaned media cleanup; the periodic job is opt-in (0 = only `flask media gc`)
+    app.config["MEDIA_GC_INTERVAL"] = int(os.environ.get("MEDIA_GC_INTERVAL", "0"))
+    app.config["MEDIA_GC_GRACE_PERIOD"] = int(os.environ.get("MEDIA_GC_GRACE_PERIOD", "86400"))
+    app.config["MEDIA_GC_BATCH_SIZE"] = int(os.environ.get("MEDIA_GC_BATCH_SIZE", "500"))
+    # Seconds a logged-in user's identity and admin flag are cached (0 disables)
+    app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", "60"))
+    # Logging: one structured record per request, sampled
+    app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO").upper()
+    app.config["REQUEST_LOG_ENABLED"] = os.environ.get("REQUEST_LOG_ENABLED", "true").lower() == "true"
+    app.config["REQUEST_LOG_LEVEL"] = os.environ.get("REQUEST_LOG_LEVEL", "INFO").upper()
+    app.config["REQUEST_LOG_SAMPLE_RATE"] = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "1.0"))
+    app.config["REQUEST_LOG_SLOW_MS"] = float(os.environ.get("REQUEST_LOG_SLOW_MS", "1000"))
+    # Events per portfolio page; further pages load from /api/events on scroll
+    app.config["PORTFOLIO_PAGE_SIZE"] = int(os.environ.get("PORTFOLIO_PAGE_SIZE", "24"))
+    # Per-event dump of the portfolio query results, for debugging only
+    app.config["PORTFOLIO_DEBUG_LOG"] = os.environ.get("PORTFOLIO_DEBUG_LOG", "false").lower() == "true"
+    if config:
+        app.config.update(config)
+    app.logger.setLevel(app.config["LOG_LEVEL"])
     
     try:
         # Initialize extensions
@@ -27,30 +101,90 @@ def create_app():
         login_manager.login_view = 'admin_custom.login'
         csrf.init_app(app)
         migrate.init_app(app, db)
-        ckeditor.init_app(app)
+        
+        # Cache invalidation channel shared by all workers
+        from utils import invalidation
+        invalidation.init_app(app)
+        
+        # Cached logins, dropped in every worker whenever a user is committed
+        from utils import user_cache
+        user_cache.init_app(app)
+        
+        # Per-request SQL statement counting and view query budgets
+        from utils import query_counter
+        query_counter.init_app(app)
+        
+        # Structured per-request log (route, timing, query count, cache outcome)
+        from utils import request_log
+        request_log.init_app(app)
+        
+        # Storage backend for uploaded media (local disk or S3-compatible)
+        from utils import storage
+        storage.init_app(app)
         
         # Configure template settings
         app.jinja_env.add_extension('jinja2.ext.do')
         app.jinja_env.trim_blocks = True
         app.jinja_env.lstrip_blocks = True
         
-        # Test database connection
-        with app.app_context():
-            db.engine.connect()
-            logger.info("Database connection successful")
-        
-        # Register theme context processor
-        from utils.theme_manager import inject_theme
-        app.context_processor(inject_theme)
+        if views:
+            # Media, jobs and the page cache serve the site and the `flask`
+            # commands; scripts only need models, so they don't start the
+            # media index build or wire up processing
+            
+            # Index of uploaded media so templates don't stat the static folder
+            from utils import media_index
+            media_index.init_app(app)
+            
+            # Streaming, resumable admin uploads
+            from utils import uploads
+            uploads.init_app(app)
+            
+            # Database-backed background jobs for media processing
+            from utils import jobs
+            jobs.init_app(app)
+            
+            # Responsive image variants and the `flask images` commands
+            from utils import image_variants
+            image_variants.init_app(app)
+            
+            # Poster frames and faststart MP4s for event videos
+            from utils import video_processing
+            video_processing.init_app(app)
+            
+            # `flask media` commands: orphan cleanup, usage report, permission repair
+            from utils import media_gc
+            media_gc.init_app(app)
+            from utils import media_permissions
+            media_permissions.init_app(app)
+            
+            # `flask events import/export` for moving whole portfolios
+            from utils import bulk_events
+            bulk_events.init_app(app)
+            
+            # Full-page cache for anonymous traffic on public routes
+            from utils import page_cache
+            page_cache.init_app(app)
+            
+            register_extensions(app)
+            
+            # Register theme context processor
+            from utils.theme_manager import inject_theme
+            app.context_processor(inject_theme)
+            
+            # Set default theme colors if not available
+            app.context_processor(lambda: {
+                'theme_colors': {
+                    'primary': '#f8f5f2',
+                    'secondary': '#2c3e50',
+                    'accent': '#e67e22'
+                }
+            })
         
-        # Set default theme colors if not available
-        app.context_processor(lambda: {
-            'theme_colors': {
-                'primary': '#f8f5f2',
-                'secondary': '#2c3e50',
-                'accent': '#e67e22'
-            }
-        })
+        # Database work waits for the first request
+        hook = StartupHook(app)
+        app.extensions['startup'] = hook
+        app.before_request(hook.run)
         
         logger.info("Application created successfully")
         return app
@@ -60,58 +194,30 @@ def create_app():
         logger.exception("Full traceback:")
         raise
 
-app = create_app()
+def setup_upload_directories(app):
+    """Create the upload directories if they are missing.
 
-def setup_upload_directories():
-    logger.info("Setting up upload directories...")
-    
-    # Ensure static folder exists
-    logger.info(f"Checking static folder: {app.static_folder}")
-    if not os.path.exists(app.static_folder):
-        logger.info("Creating static folder...")
-        os.makedirs(app.static_folder, mode=0o755)
-    
-    # Create uploads directory structure
-    upload_base = os.path.join(app.static_folder, 'uploads')
-    logger.info(f"Setting up upload base directory: {upload_base}")
-    
-    for directory in ['images', 'videos']:
-        path = os.path.join(upload_base, directory)
-        logger.info(f"Processing directory: {path}")
-        
-        if not os.path.exists(path):
+    Only the directories are checked, so startup time doesn't grow with the
+    number of uploads. Use `flask media fix-permissions` to repair the
+    permissions of existing files.
+    """
+    directories = [os.path.join(app.static_folder, 'images')]
+    if app.config["STORAGE_BACKEND"] == "local":
+        directories += [os.path.join(app.static_folder, 'uploads', name) for name in ('images', 'videos')]
+    for path in directories:
+        if not os.path.isdir(path):
             logger.info(f"Creating directory: {path}")
-            os.makedirs(path, mode=0o755)
-        else:
-            logger.info(f"Directory exists: {path}")
-            # Ensure correct permissions
-            current_mode = os.stat(path).st_mode & 0o777
-            logger.info(f"Current permissions: {oct(current_mode)}")
-            os.chmod(path, 0o755)
-            logger.info("Updated permissions to 755")
-            
-            # Set permissions for existing files
-            logger.info("Checking existing files...")
-            for file in os.listdir(path):
-                file_path = os.path.join(path, file)
-                if os.path.isfile(file_path):
-                    current_mode = os.stat(file_path).st_mode & 0o777
-                    logger.info(f"File {file}: current permissions {oct(current_mode)}")
-                    os.chmod(file_path, 0o644)
-                    logger.info(f"Updated {file} permissions to 644")
-                    
-    # Create images directory for placeholder if it doesn't exist
-    placeholder_path = os.path.join(app.static_folder, 'images')
-    logger.info(f"Checking placeholder directory: {placeholder_path}")
-    if not os.path.exists(placeholder_path):
-        logger.info("Creating placeholder directory...")
-        os.makedirs(placeholder_path, mode=0o755)
+            os.makedirs(path, mode=0o755, exist_ok=True)
 
 def register_extensions(app):
     """Register Flask extensions and blueprints."""
     try:
         logger.info("Starting extension registration...")
         
+        # Rich text editor for the event and testimonial forms
+        from flask_ckeditor import CKEditor
+        CKEditor(app)
+        
         # Import views and routes here to avoid circular imports
         from admin_routes import admin_bp
         logger.info("Admin blueprint imported")
@@ -126,10 +232,11 @@ def register_extensions(app):
         admin = admin_views.init_admin(app)
         logger.info("Admin views initialized successfully")
         
-        # Import routes last to avoid circular dependencies
-        logger.info("Importing main routes...")
+        # Register routes last to avoid circular dependencies
+        logger.info("Registering main routes...")
         import routes
-        logger.info("Main routes imported successfully")
+        routes.init_app(app)
+        logger.info("Main routes registered successfully")
         
         logger.info("All extensions and blueprints registered successfully")
         return app
@@ -142,42 +249,40 @@ def register_extensions(app):
         logger.exception("Full error traceback:")
         raise
 
-with app.app_context():
-    try:
-        # Import models first to ensure all models are defined
-        import models
-        
-        # Register extensions and blueprints
-        register_extensions(app)
-        logger.info("Extensions registered")
-        
-        # Create all database tables through migration
-        logger.info("Running database migrations...")
+def startup(app):
+    """Check the database, create upload directories and seed the default themes."""
+    with app.app_context():
         try:
             logger.info("Attempting to connect to database...")
-            db.engine.connect()
-            logger.info("Database connection successful")
+            with db.engine.connect():
+                logger.info("Database connection successful")
             
-            logger.info("Database setup complete")
-        except Exception as e:
-            logger.error(f"Error during database initialization: {str(e)}")
-            logger.exception("Full traceback:")
-            raise
-        
-        # Set up required directories
-        setup_upload_directories()
-        logger.info("Upload directories configured")
-        
-        # Initialize theme system after database is ready
-        try:
+            # Set up required directories
+            setup_upload_directories(app)
+            logger.info("Upload directories configured")
+            
+            # Initialize theme system after database is ready
             from utils.theme_manager import initialize_default_themes
             initialize_default_themes()
             logger.info("Theme initialization completed")
+            
+            logger.info("Application initialization complete")
         except Exception as e:
-            logger.error(f"Error initializing themes: {str(e)}")
+            logger.error(f"Error during application initialization: {str(e)}")
             raise
-        
-        logger.info("Application initialization complete")
-    except Exception as e:
-        logger.error(f"Error during application initialization: {str(e)}")
-        raise
+
+class StartupHook:
+    """``before_request`` hook that runs ``startup`` once per app."""
+
+    def __init__(self, app):
+        self.app = app
+        self._done = False
+        self._lock = threading.Lock()
+
+    def run(self):
+        if self._done:
+            return
+        with self._lock:
+            if not self._done:
+                startup(self.app)
+                self._done = True
@@ -0,0 +1,137 @@
+"""Benchmark the portfolio, dashboard and theme queries with and without indexes.
+
+Seeds a database with N events, then prints the query plan and median
+latency of each hot query before and after creating the indexes declared in
+models.py. The schema is dropped and recreated, so it uses BENCH_DATABASE_URL
+(never DATABASE_URL) if set, otherwise a throwaway SQLite file.
+
+    python benchmarks/portfolio_queries.py --events 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, text, insert, true
+
+from models import ORMmetadata, Event, Category, Theme, ThemeColors, EVENT_SORT_KEYS
+from utils.pagination import seek_after
+
+INDEXES = ('ix_event_category_sequence_date', 'ix_event_sequence_date', 'uq_theme_single_active')
+
+def seed(engine, n_events, n_categories):
+    ORMmetadata.drop_all(engine)
+    ORMmetadata.create_all(engine)
+    with engine.begin() as conn:
+        for name in INDEXES:
+            conn.execute(text(f"DROP INDEX {name}"))
+
+        conn.execute(insert(Category.__table__), [
+            {'name': f'Category {i}', 'slug': f'category-{i}', 'columns_per_row': 3}
+            for i in range(n_categories)
+        ])
+        conn.execute(insert(Theme.__table__), [
+            {'name': f'Theme {i}', 'slug': f'theme-{i}', 'is_custom': True, 'is_active': i == 0}
+            for i in range(20)
+        ])
+        conn.execute(insert(ThemeColors.__table__), [
+            {'theme_id': i + 1, 'primary_color': '#ffffff', 'secondary_color': '#333333', 'accent_color': '#007bff'}
+            for i in range(20)
+        ])
+
+        rng = random.Random(42)
+        start = datetime(2015, 1, 1)
+        batch = []
+        for i in range(n_events):
+            batch.append({
+                'title': f'Event {i}',
+                'category_id': rng.randint(1, n_categories),
+                'description': 'Seeded event',
+                'date': start + timedelta(minutes=rng.randint(0, 5_000_000)),
+                'image_path': f'uploads/images/event-{i}.jpg',
+                'sequence': rng.choice([None, round(rng.uniform(0, 100), 3)]),
+            })
+            if len(batch) == 5000:
+                conn.execute(insert(Event.__table__), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Event.__table__), batch)
+
+def hot_queries(category_id):
+    ordering = (Event.sequence.nullslast(), Event.date.desc())
+    joined = select(Event.__table__, Category.name).join(Category, Event.category_id == Category.id)
+    return {
+        'portfolio all (first 50)': joined.order_by(Category.name, *ordering).limit(50),
+        'portfolio all (full)': joined.order_by(Category.name, *ordering),
+        'portfolio category (first 50)': select(Event.__table__)
+            .where(Event.category_id == category_id).order_by(*ordering).limit(50),
+        'portfolio category (full)': select(Event.__table__)
+            .where(Event.category_id == category_id).order_by(*ordering),
+        'dashboard category deep page (keyset, 50)': select(Event.__table__)
+            .where(Event.category_id == category_id, seek_after(EVENT_SORT_KEYS, [50.0, datetime(2020, 1, 1), 0]))
+            .order_by(*(key.order_by() for key in EVENT_SORT_KEYS)).limit(50),
+        'active theme': select(Theme.__table__).where(Theme.is_active == true()),
+    }
+
+def explain(conn, statement):
+    sql = str(statement.compile(conn.engine, compile_kwargs={'literal_binds': True}))
+    if conn.engine.dialect.name == 'postgresql':
+        rows = conn.execute(text(f"EXPLAIN ANALYZE {sql}")).fetchall()
+        return '\n'.join(row[0] for row in rows)
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+def measure(engine, queries, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for label, statement in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(statement).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = (statistics.median(timings), explain(conn, statement))
+    return results
+
+def create_indexes(engine):
+    with engine.begin() as conn:
+        for table in (Event.__table__, Theme.__table__):
+            for index in table.indexes:
+                if index.name in INDEXES:
+                    index.create(conn)
+        conn.execute(text("ANALYZE"))
+
+def report(label, before, after):
+    print(f"\n=== {label}")
+    print(f"before: {before[0]:9.2f} ms   after: {after[0]:9.2f} ms")
+    print("plan before:\n  " + before[1].replace('\n', '\n  '))
+    print("plan after:\n  " + after[1].replace('\n', '\n  '))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--categories', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    url = os.environ.get('BENCH_DATABASE_URL') or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_engine(url)
+    print(f"Seeding {args.events} events into {engine.url.render_as_string(hide_password=True)}")
+    seed(engine, args.events, args.categories)
+
+    queries = hot_queries(category_id=1)
+    before = measure(engine, queries, args.repeat)
+    create_indexes(engine)
+    after = measure(engine, queries, args.repeat)
+
+    for label in queries:
+        report(label, before[label], after[label])
+
+if __name__ == '__main__':
+    main()
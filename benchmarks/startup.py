@@ -0,0 +1,97 @@
+"""Benchmark application startup: import, factory and first request.
+
+Each run starts a fresh interpreter and times the phases a deployment pays:
+
+- import: ``import app`` (must stay cheap, it builds nothing)
+- script: ``create_app(views=False)``, what create_admin.py and cwd.py pay
+- preload: ``create_app()``, what gunicorn --preload pays in the master
+- first request: the one-off ``startup`` work (DB check, upload directories,
+  default themes) plus rendering ``/``, what each worker pays on boot
+
+The database is a throwaway SQLite file unless BENCH_DATABASE_URL is set.
+With --max-preload-ms the script exits with status 1 when import + preload
+exceeds the budget, so it can gate CI.
+
+    python benchmarks/startup.py --repeat 10 --max-preload-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+timings = {}
+started = time.perf_counter()
+import app as app_module
+timings['import'] = time.perf_counter() - started
+heavy = {name: name in sys.modules for name in ('flask_admin', 'flask_ckeditor')}
+
+started = time.perf_counter()
+app_module.create_app(views=False)
+timings['script'] = time.perf_counter() - started
+heavy_after_script = {name: name in sys.modules for name in heavy}
+
+started = time.perf_counter()
+app = app_module.create_app()
+timings['preload'] = time.perf_counter() - started
+
+from extensions import db
+with app.app_context():
+    db.create_all()
+client = app.test_client()
+started = time.perf_counter()
+status = client.get('/').status_code
+timings['first request'] = time.perf_counter() - started
+started = time.perf_counter()
+client.get('/')
+timings['second request'] = time.perf_counter() - started
+
+print(json.dumps({'timings': timings, 'status': status, 'modules': len(sys.modules),
+                  'heavy_after_import': heavy, 'heavy_after_script': heavy_after_script}))
+'''
+
+PHASES = ('import', 'script', 'preload', 'first request', 'second request')
+
+def run_once(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, LOG_LEVEL='WARNING',
+               JOBS_WORKERS='0', REQUEST_LOG_ENABLED='false',
+               INVALIDATION_DIR=tempfile.mkdtemp(), PAGE_CACHE_BACKEND='null')
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-preload-ms', type=float,
+                        help='fail if the median import + preload time exceeds this')
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.repeat):
+        # A fresh database per run so the first request really seeds the themes
+        url = os.environ.get('BENCH_DATABASE_URL') or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        runs.append(run_once(url))
+
+    print(f"{args.repeat} runs, {runs[-1]['modules']} modules loaded, first request status {runs[-1]['status']}")
+    medians = {}
+    for phase in PHASES:
+        medians[phase] = statistics.median(run['timings'][phase] for run in runs) * 1000
+        print(f"{phase:>15}: {medians[phase]:9.2f} ms")
+    for label in ('heavy_after_import', 'heavy_after_script'):
+        loaded = [name for name, present in runs[-1][label].items() if present]
+        print(f"{label.replace('_', ' ')}: {', '.join(loaded) or 'none'}")
+
+    preload = medians['import'] + medians['preload']
+    if args.max_preload_ms is not None and preload > args.max_preload_ms:
+        print(f"import + preload {preload:.2f} ms exceeds budget {args.max_preload_ms:.2f} ms")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
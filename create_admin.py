@@ -1,8 +1,9 @@
 from extensions import db
-from app import app
+from app import create_app
 from models import User
 
 def create_admin_user():
+    app = create_app(views=False)
     with app.app_context():
         # Check if admin user already exists
         admin = User.query.filter_by(username='admin').first()
@@ -1,4 +1,4 @@
-from app import app
+from app import create_app
 from models import User
 from extensions import db
 import argparse
@@ -9,6 +9,7 @@ args = parser.parse_args()
 # Then in your set_password call:
 
 def update_admin_password():
+    app = create_app(views=False)
     with app.app_context():
         admin = User.query.filter_by(username='admin').first()
         if not admin:
@@ -2,7 +2,6 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
-from flask_ckeditor import CKEditor
 from sqlalchemy.orm import DeclarativeBase
 
 class Base(DeclarativeBase):
@@ -13,9 +12,8 @@ db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 csrf = CSRFProtect()
 migrate = Migrate()
-ckeditor = CKEditor()
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from utils.user_cache import load_user as load_cached_user
+    return load_cached_user(user_id)
@@ -1,10 +1,11 @@
 import logging
+import os
 import sys
-from app import app
+from app import create_app
 
 # Setup logging with more detailed format
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     stream=sys.stdout
 )
@@ -13,6 +14,10 @@ logger = logging.getLogger(__name__)
 if __name__ == "__main__":
     logger.info("Starting Event Services website...")
     try:
+        app = create_app()
+        # Database checks and default themes before accepting requests
+        app.extensions['startup'].run()
+        
         # Test template rendering before starting
         with app.app_context():
             logger.info("Testing template rendering...")
@@ -3,6 +3,7 @@ from logging.config import fileConfig
 
 from flask import current_app
 
+import sqlalchemy as sa
 from alembic import context
 
 # this is the Alembic Config object, which provides
@@ -14,6 +15,40 @@ config = context.config
 fileConfig(config.config_file_name)
 logger = logging.getLogger('alembic.env')
 
+# Revisions of the pre-squash chain, now replaced by the d4ef414d91e1 baseline.
+# A database stamped at any of them is unstamped before migrating so the
+# baseline (which only creates what is missing) brings it up to date.
+LEGACY_REVISIONS = frozenset((
+    '09b778cc3434', '148768650381', '14a240a685c9', '1525723eee1b',
+    '16870ecff414', '1c898c9ebe15', '2051792aeb80', '2f7f55efc255',
+    '3b64ecbfd0f6', '3da3f382be0b', '55630ec4e8e3', '57e6d432639c',
+    '5e6cd4a4e337', '6016e69bd8c0', '6702d49b27a8', '7041cafc7849',
+    '726c05a3e6a9', '75536e1216ad', '76655e9680a0', '848ae0ecc892',
+    '87f0cb635e1b', 'a126d0e825be', 'a3e6d98053b8', 'a925dc19aad9',
+    'a9ba79da5a62', 'bd74594d8fa4', 'c271749d7ecd', 'c7a9cee1bfb3',
+    'c7de625e87eb', 'c9fd72590d3b', 'cb269b386cb5', 'ccf5788e82f0',
+    'd2c2b8e3c3e8', 'd9c82cb5713c', 'd9eacc32a0c7', 'ddc844981fdd',
+    'e0cda8b028e8', 'e16d46cc11b6', 'e22d6a180b12', 'e89827dc267a',
+    'e8c85c4ad7e1', 'e9358a367971', 'eed074809237', 'f1e6fe19a44f',
+    'f45e716465b9', 'fbc4e552843c',
+))
+
+
+def unstamp_legacy_revisions(connection):
+    """Drop pre-squash revision ids from alembic_version."""
+    if sa.inspect(connection).has_table('alembic_version'):
+        current = {row[0] for row in connection.execute(sa.text("SELECT version_num FROM alembic_version"))}
+        legacy = current & LEGACY_REVISIONS
+        if legacy:
+            logger.info(f"Unstamping legacy revisions {sorted(legacy)}; the squashed baseline will be applied")
+            connection.execute(
+                sa.text("DELETE FROM alembic_version WHERE version_num IN :revisions")
+                .bindparams(sa.bindparam('revisions', expanding=True)),
+                {"revisions": sorted(legacy)}
+            )
+    # End the implicit transaction so alembic manages (and commits) its own
+    connection.commit()
+
 
 def get_engine():
     try:
@@ -97,6 +132,7 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        unstamp_legacy_revisions(connection)
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
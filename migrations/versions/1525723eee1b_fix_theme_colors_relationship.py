@@ -1,38 +0,0 @@
-"""Fix theme colors relationship
-
-Revision ID: 1525723eee1b
-Revises: 2f7f55efc255
-Create Date: 2024-12-10 15:58:06.479134
-
-"""
-from alembic import op
-import sqlalchemy as sa
-
-
-# revision identifiers, used by Alembic.
-revision = '1525723eee1b'
-down_revision = '2f7f55efc255'
-branch_labels = None
-depends_on = None
-
-
-def upgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    with op.batch_alter_table('event', schema=None) as batch_op:
-        batch_op.alter_column('sequence',
-               existing_type=sa.REAL(),
-               type_=sa.Float(precision=3),
-               existing_nullable=True)
-
-    # ### end Alembic commands ###
-
-
-def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    with op.batch_alter_table('event', schema=None) as batch_op:
-        batch_op.alter_column('sequence',
-               existing_type=sa.Float(precision=3),
-               type_=sa.REAL(),
-               existing_nullable=True)
-
-    # ### end Alembic commands ###
@@ -0,0 +1,26 @@
+"""Add event image variants
+
+Revision ID: 5b1f0c7e2a94
+Revises: adfe7f9e3ae8
+Create Date: 2026-10-17 17:42:09.371605
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c7e2a94'
+down_revision = 'adfe7f9e3ae8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.JSON(none_as_null=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
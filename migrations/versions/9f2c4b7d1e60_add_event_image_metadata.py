@@ -0,0 +1,32 @@
+"""Add event image metadata
+
+Revision ID: 9f2c4b7d1e60
+Revises: c3a7e95d1b28
+Create Date: 2026-10-17 21:12:48.305127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f2c4b7d1e60'
+down_revision = 'c3a7e95d1b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_color', sa.String(length=7), nullable=True))
+        batch_op.add_column(sa.Column('image_placeholder', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_column('image_placeholder')
+        batch_op.drop_column('image_color')
+        batch_op.drop_column('image_height')
+        batch_op.drop_column('image_width')
@@ -1,49 +0,0 @@
-"""Initial migration with complete schema
-
-Revision ID: a925dc19aad9
-Revises: 
-Create Date: 2024-12-08 00:04:00.574323
-
-"""
-from alembic import op
-import sqlalchemy as sa
-from sqlalchemy.dialects import postgresql
-
-# revision identifiers, used by Alembic.
-revision = 'a925dc19aad9'
-down_revision = None
-branch_labels = None
-depends_on = None
-
-
-def upgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_table('image')
-    with op.batch_alter_table('event', schema=None) as batch_op:
-        batch_op.alter_column('sequence',
-               existing_type=sa.REAL(),
-               type_=sa.Float(precision=3),
-               existing_nullable=True)
-
-    # ### end Alembic commands ###
-
-
-def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    with op.batch_alter_table('event', schema=None) as batch_op:
-        batch_op.alter_column('sequence',
-               existing_type=sa.Float(precision=3),
-               type_=sa.REAL(),
-               existing_nullable=True)
-
-    op.create_table('image',
-    sa.Column('id', sa.INTEGER(), autoincrement=True, nullable=False),
-    sa.Column('title', sa.VARCHAR(length=100), autoincrement=False, nullable=False),
-    sa.Column('description', sa.TEXT(), autoincrement=False, nullable=True),
-    sa.Column('image_data', sa.VARCHAR(length=500), autoincrement=False, nullable=False),
-    sa.Column('created_at', postgresql.TIMESTAMP(), autoincrement=False, nullable=True),
-    sa.Column('event_id', sa.INTEGER(), autoincrement=False, nullable=False),
-    sa.Column('image_sequence', sa.NUMERIC(precision=10, scale=2), autoincrement=False, nullable=False),
-    sa.PrimaryKeyConstraint('id', name='image_pkey')
-    )
-    # ### end Alembic commands ###
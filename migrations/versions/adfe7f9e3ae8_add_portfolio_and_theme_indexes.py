@@ -0,0 +1,44 @@
+"""Add portfolio and theme indexes
+
+Revision ID: adfe7f9e3ae8
+Revises: d4ef414d91e1
+Create Date: 2026-10-17 16:05:12.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'adfe7f9e3ae8'
+down_revision = 'd4ef414d91e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the lowest-id active theme so the unique index can be built
+    op.execute("""
+        UPDATE theme SET is_active = FALSE
+        WHERE is_active AND id <> (SELECT MIN(id) FROM theme WHERE is_active)
+    """)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index('ix_event_category_sequence_date',
+                              ['category_id', 'sequence', sa.text('date DESC')], unique=False)
+        batch_op.create_index('ix_event_sequence_date',
+                              ['sequence', sa.text('date DESC')], unique=False)
+
+    with op.batch_alter_table('theme', schema=None) as batch_op:
+        batch_op.create_index('uq_theme_single_active', ['is_active'], unique=True,
+                              postgresql_where=sa.text('is_active'),
+                              sqlite_where=sa.text('is_active'))
+
+
+def downgrade():
+    with op.batch_alter_table('theme', schema=None) as batch_op:
+        batch_op.drop_index('uq_theme_single_active')
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_sequence_date')
+        batch_op.drop_index('ix_event_category_sequence_date')
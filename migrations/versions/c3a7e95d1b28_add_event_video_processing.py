@@ -0,0 +1,28 @@
+"""Add event video processing
+
+Revision ID: c3a7e95d1b28
+Revises: 8e3d2a61c0f7
+Create Date: 2026-10-17 19:03:27.660412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a7e95d1b28'
+down_revision = '8e3d2a61c0f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('video_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('video_variants', sa.JSON(none_as_null=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_column('video_variants')
+        batch_op.drop_column('video_status')
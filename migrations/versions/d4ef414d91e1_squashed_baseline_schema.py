@@ -0,0 +1,151 @@
+"""Squashed baseline schema
+
+Replaces the original chain from a925dc19aad9 through the repeated
+"fix theme colors relationship" revisions up to e9358a367971. Databases
+stamped at any of those revisions are unstamped by migrations/env.py and
+then brought here by this revision, which only creates what is missing and
+converges schema drift left by the old chain.
+
+Revision ID: d4ef414d91e1
+Revises:
+Create Date: 2026-10-17 16:31:48.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4ef414d91e1'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Names unnamed foreign keys reflected by batch mode (SQLite)
+FK_NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    if 'user' not in existing:
+        op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=512), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+        )
+
+    if 'category' not in existing:
+        op.create_table('category',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('slug', sa.String(length=50), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('sequence', sa.Float(precision=3), nullable=True),
+        sa.Column('columns_per_row', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+        sa.UniqueConstraint('slug')
+        )
+
+    if 'event' not in existing:
+        op.create_table('event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.Column('image_path', sa.String(length=500), nullable=True),
+        sa.Column('video_path', sa.String(length=500), nullable=True),
+        sa.Column('sequence', sa.Float(precision=3), nullable=True),
+        sa.ForeignKeyConstraint(['category_id'], ['category.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'testimonial' not in existing:
+        op.create_table('testimonial',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_name', sa.String(length=100), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('event_type', sa.String(length=50), nullable=True),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'contact' not in existing:
+        op.create_table('contact',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'theme' not in existing:
+        op.create_table('theme',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('slug', sa.String(length=50), nullable=False),
+        sa.Column('is_custom', sa.Boolean(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+        sa.UniqueConstraint('slug')
+        )
+
+    if 'theme_colors' not in existing:
+        op.create_table('theme_colors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('theme_id', sa.Integer(), nullable=False),
+        sa.Column('primary_color', sa.String(length=7), nullable=False),
+        sa.Column('secondary_color', sa.String(length=7), nullable=False),
+        sa.Column('accent_color', sa.String(length=7), nullable=False),
+        sa.ForeignKeyConstraint(['theme_id'], ['theme.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    # Converge databases created by the pre-squash chain (a925dc19aad9,
+    # c7de625e87eb and a9ba79da5a62 were the only revisions that changed
+    # anything besides re-declaring event.sequence)
+    if 'image' in existing:
+        op.drop_table('image')
+
+    if 'category' in existing:
+        columns = {c['name']: c for c in inspector.get_columns('category')}
+        with op.batch_alter_table('category', schema=None) as batch_op:
+            if 'category_sequence' in columns:
+                batch_op.drop_column('category_sequence')
+            if columns.get('columns_per_row', {}).get('nullable'):
+                op.execute("UPDATE category SET columns_per_row = 3 WHERE columns_per_row IS NULL")
+                batch_op.alter_column('columns_per_row', existing_type=sa.Integer(), nullable=False)
+
+    if 'theme_colors' in existing:
+        # Matched by columns: SQLite reports the legacy constraint without a
+        # name, so the batch's naming convention gives it one to drop
+        for fk in inspector.get_foreign_keys('theme_colors'):
+            ondelete = (fk.get('options') or {}).get('ondelete') or ''
+            if (fk['constrained_columns'] == ['theme_id'] and fk['referred_table'] == 'theme'
+                    and fk['referred_columns'] == ['id'] and ondelete.upper() != 'CASCADE'):
+                with op.batch_alter_table('theme_colors', schema=None,
+                                          naming_convention=FK_NAMING_CONVENTION) as batch_op:
+                    batch_op.drop_constraint(fk.get('name') or 'fk_theme_colors_theme_id_theme',
+                                             type_='foreignkey')
+                    batch_op.create_foreign_key('theme_colors_theme_id_fkey', 'theme',
+                                                ['theme_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_table('theme_colors')
+    op.drop_table('theme')
+    op.drop_table('contact')
+    op.drop_table('testimonial')
+    op.drop_table('event')
+    op.drop_table('category')
+    op.drop_table('user')
@@ -0,0 +1,26 @@
+"""Add job heartbeat
+
+Revision ID: e1b7c4a9d352
+Revises: 9f2c4b7d1e60
+Create Date: 2026-10-17 18:04:11.482310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b7c4a9d352'
+down_revision = '9f2c4b7d1e60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
@@ -0,0 +1,38 @@
+"""Match the event ordering indexes to the keyset sort keys
+
+Revision ID: f6a2d8c5b913
+Revises: e1b7c4a9d352
+Create Date: 2026-10-17 18:42:07.531904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a2d8c5b913'
+down_revision = 'e1b7c4a9d352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_sequence_date')
+        batch_op.drop_index('ix_event_category_sequence_date')
+        batch_op.create_index('ix_event_category_sequence_date',
+                              ['category_id', 'sequence', 'date', 'id'], unique=False,
+                              postgresql_ops={'date': 'DESC NULLS LAST'})
+        batch_op.create_index('ix_event_sequence_date',
+                              ['sequence', 'date', 'id'], unique=False,
+                              postgresql_ops={'date': 'DESC NULLS LAST'})
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_sequence_date')
+        batch_op.drop_index('ix_event_category_sequence_date')
+        batch_op.create_index('ix_event_category_sequence_date',
+                              ['category_id', 'sequence', sa.text('date DESC')], unique=False)
+        batch_op.create_index('ix_event_sequence_date',
+                              ['sequence', sa.text('date DESC')], unique=False)
@@ -31,13 +31,20 @@ class Category(db.Model):
     def __repr__(self):
         return f'<Category {self.name}>'
 
-import os
 from werkzeug.utils import secure_filename
+from utils.media_index import media_exists, media_url
+from utils.pagination import SortKey
 
 ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'wmv'}  # Extended video formats
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 MAX_VIDEO_SIZE = 50 * 1024 * 1024  # 50MB
+VIDEO_MIME_TYPES = {
+    'mp4': 'video/mp4',
+    'mov': 'video/quicktime',
+    'avi': 'video/x-msvideo',
+    'wmv': 'video/x-ms-wmv',
+}
 
 def allowed_file(filename, allowed_extensions):
     if not filename or '.' not in filename:
@@ -54,17 +61,74 @@ class Event(db.Model):
     image_path = db.Column(db.String(500))
     video_path = db.Column(db.String(500))
     sequence = db.Column(db.Float(precision=3), nullable=True)
+    # Manifest of responsive variants, see utils/image_variants.py
+    image_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
+    # Displayed size, average colour (#rrggbb) and a tiny blurred JPEG data
+    # URI, recorded with the variants so pages can reserve space up front
+    image_width = db.Column(db.Integer, nullable=True)
+    image_height = db.Column(db.Integer, nullable=True)
+    image_color = db.Column(db.String(7), nullable=True)
+    image_placeholder = db.Column(db.Text, nullable=True)
+    # Web MP4 and poster built from the upload, see utils/video_processing.py;
+    # status is pending, ready, failed or unavailable (no encoder installed)
+    video_status = db.Column(db.String(20), nullable=True)
+    video_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
     
     @property
     def image_url(self):
         if self.image_path and self.image_path.strip():
             # Ensure path is relative to static folder
-            full_path = os.path.join(current_app.static_folder, self.image_path.lstrip('/'))
-            if os.path.exists(full_path):
-                return url_for('static', filename=self.image_path.lstrip('/'))
-            current_app.logger.warning(f"Image not found at {full_path}")
+            image_path = self.image_path.lstrip('/')
+            if media_exists(image_path, default=True):
+                return media_url(image_path)
+            current_app.logger.warning(f"Image not found at {image_path}")
         return url_for('static', filename='images/placeholder.svg')
 
+    @property
+    def image_aspect_ratio(self):
+        """Width / height of the image as displayed, or None until known."""
+        if self.image_width and self.image_height:
+            return self.image_width / self.image_height
+        return None
+
+    def image_srcset(self, mime='image/jpeg'):
+        """``srcset`` for the ``mime`` variants of the image, or '' if none."""
+        entries = (self.image_variants or {}).get('sources', {}).get(mime, [])
+        return ', '.join(f"{media_url(path)} {width}w" for path, width in entries)
+
+    @property
+    def image_sources(self):
+        """(mime, srcset) pairs for the modern formats, best first, for <picture>."""
+        sources = (self.image_variants or {}).get('sources', {})
+        return [(mime, self.image_srcset(mime)) for mime in sources if mime != 'image/jpeg']
+
+    @property
+    def thumbnail_url(self):
+        """URL of the smallest JPEG variant wide enough for a grid tile."""
+        entries = (self.image_variants or {}).get('sources', {}).get('image/jpeg')
+        if not entries:
+            return self.image_url
+        path = next((p for p, width in entries if width >= 640), entries[-1][0])
+        return media_url(path)
+
+    @property
+    def video_url(self):
+        """The faststart MP4 once processed, else the original upload."""
+        path = (self.video_variants or {}).get('mp4') or self.video_path
+        return media_url(path) if path else None
+
+    @property
+    def video_mime_type(self):
+        if (self.video_variants or {}).get('mp4'):
+            return 'video/mp4'
+        extension = self.video_path.rsplit('.', 1)[-1].lower() if self.video_path and '.' in self.video_path else ''
+        return VIDEO_MIME_TYPES.get(extension, 'application/octet-stream')
+
+    @property
+    def video_poster_url(self):
+        poster = (self.video_variants or {}).get('poster')
+        return media_url(poster) if poster else self.thumbnail_url
+
     @staticmethod
     def validate_image(file):
         if not file:
@@ -85,6 +149,25 @@ class Event(db.Model):
             raise ValueError(f"Video file size exceeds maximum limit of {MAX_VIDEO_SIZE // (1024*1024)}MB")
         return True
 
+# Match the portfolio/dashboard ordering EVENT_SORT_KEYS below, optionally
+# within a category: sequence ASC (NULLS LAST is the PostgreSQL default for
+# ASC), date DESC NULLS LAST, then id. SQLite can't declare NULLS LAST in an
+# index, so only PostgreSQL gets the date ordering.
+db.Index('ix_event_category_sequence_date', Event.category_id, Event.sequence, Event.date, Event.id,
+         postgresql_ops={'date': 'DESC NULLS LAST'})
+db.Index('ix_event_sequence_date', Event.sequence, Event.date, Event.id,
+         postgresql_ops={'date': 'DESC NULLS LAST'})
+
+# Keyset pagination over that ordering (see utils/pagination.py). Listings of
+# every category put the category name first; the id keeps rows with equal
+# sort values in a stable order across pages.
+EVENT_CATEGORY_SORT_KEY = SortKey(Category.name, lambda event: event.category.name)
+EVENT_SORT_KEYS = (
+    SortKey(Event.sequence, lambda event: event.sequence, nullable=True),
+    SortKey(Event.date, lambda event: event.date, descending=True, nullable=True),
+    SortKey(Event.id, lambda event: event.id),
+)
+
 class Testimonial(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_name = db.Column(db.String(100), nullable=False)
@@ -101,6 +184,13 @@ class Contact(db.Model):
 
 
 class Theme(db.Model):
+    __table_args__ = (
+        # At most one active theme; also serves the active theme lookup
+        db.Index('uq_theme_single_active', 'is_active', unique=True,
+                 postgresql_where=db.text('is_active'),
+                 sqlite_where=db.text('is_active')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
     slug = db.Column(db.String(50), unique=True, nullable=False)
@@ -134,4 +224,28 @@ class ThemeColors(db.Model):
     def __repr__(self):
         return f'<ThemeColors for theme_id={self.theme_id}>'
 
+class Job(db.Model):
+    """A unit of background work, see utils/jobs.py."""
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # Refreshed by the worker while the job runs; a stale one means it was lost
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
 ORMmetadata = db.metadata
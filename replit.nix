@@ -13,5 +13,6 @@
     pkgs.freetype
     pkgs.postgresql
     pkgs.openssl
+    pkgs.ffmpeg
   ];
 }
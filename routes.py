@@ -1,79 +1,174 @@
 import os
-from flask import render_template, request, flash, redirect, url_for, current_app
+from flask import render_template, request, flash, redirect, url_for, current_app, abort, jsonify
 from extensions import db
-from app import app
-from models import Event, Testimonial, Contact, Category, Theme, ThemeColors 
-from utils.theme_manager import get_theme_colors
+from models import Event, Testimonial, Contact, Category, Theme, ThemeColors, EVENT_SORT_KEYS, EVENT_CATEGORY_SORT_KEY
+from sqlalchemy.orm import joinedload, contains_eager
+from utils.theme_manager import get_theme_stylesheet, THEME_CHANNEL
+from utils.query_counter import query_budget
+from utils.media_index import media_exists, media_version, is_media_path, MEDIA_CHANNEL
+from utils.page_cache import cached_page, conditional_page, EVENTS_CHANNEL, CATEGORIES_CHANNEL, TESTIMONIALS_CHANNEL
+from utils.pagination import InvalidCursor, keyset_page
 
-@app.route('/')
+# Upper bound on ?limit= for the portfolio page and /api/events
+PORTFOLIO_MAX_PAGE_SIZE = 100
+# Query arguments the portfolio page and /api/events read (page cache key)
+PORTFOLIO_ARGS = ('category_id', 'after', 'limit')
+
+# (rule, view, options) for every public route, added to the app by init_app
+_routes = []
+
+def route(rule, **options):
+    """Like ``app.route``, but recorded until ``init_app`` is called."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+def init_app(app):
+    """Register the public routes on ``app``."""
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+@route('/')
+@query_budget(4)
+@conditional_page(EVENTS_CHANNEL, CATEGORIES_CHANNEL, TESTIMONIALS_CHANNEL, THEME_CHANNEL, MEDIA_CHANNEL)
+@cached_page(EVENTS_CHANNEL, CATEGORIES_CHANNEL, TESTIMONIALS_CHANNEL, THEME_CHANNEL, MEDIA_CHANNEL)
 def index():
-    featured_events = Event.query.limit(6).all()
+    featured_events = Event.query.options(joinedload(Event.category)).limit(6).all()
     testimonials = Testimonial.query.limit(3).all()
     
-    return render_template('index.html', events=featured_events, testimonials=testimonials,theme_colors = get_theme_colors())
+    return render_template('index.html', events=featured_events, testimonials=testimonials)
 
 def ensure_image_exists(image_path):
-    if image_path:
-        full_path = os.path.join(current_app.static_folder, image_path)
-        return os.path.exists(full_path)
-    return False
+    return media_exists(image_path)
 
-@app.route('/portfolio')
-def portfolio():
-    categories = Category.query.all()
-    category_id = request.args.get('category_id', 'all')
-    
-    # Get events based on category and sort by both category and event sequence
+def log_portfolio_events(category_id, events):
+    """Dump every event on the portfolio page; enabled with PORTFOLIO_DEBUG_LOG."""
+    current_app.logger.debug(f"Category filter: {category_id}")
+    current_app.logger.debug(f"Number of events found: {len(events)}")
+    for event in events:
+        current_app.logger.debug(
+            f"Event ID: {event.id}, Title: {event.title}, Category: {event.category.name}, "
+            f"Image path: {event.image_path}, File exists: {media_exists(event.image_path)}"
+        )
+
+def _portfolio_query(category_id):
+    """Events for the portfolio and the keys they are ordered by.
+
+    ``category_id`` is 'all' or an id; returns (query, keys, category_id)
+    with unparsable ids treated as 'all'.
+    """
     query = Event.query
-    
     if category_id != 'all':
         try:
             category_id = int(category_id)
-            query = query.filter_by(category_id=category_id).order_by(Event.sequence.nullslast(), Event.date.desc())
+            query = query.filter_by(category_id=category_id) \
+                .options(joinedload(Event.category))
+            return query, EVENT_SORT_KEYS, category_id
         except (ValueError, TypeError):
             category_id = 'all'
-    else:
-        # If 'all' is selected, sort by category name then sequence
-        query = query.join(Category).order_by(Category.name, Event.sequence.nullslast(), Event.date.desc())
-    
-    events = query.all()
+    # If 'all' is selected, sort by category name then sequence;
+    # the join already fetches each event's category
+    query = query.join(Category).options(contains_eager(Event.category))
+    return query, (EVENT_CATEGORY_SORT_KEY,) + EVENT_SORT_KEYS, category_id
+
+def _page_size():
+    limit = request.args.get('limit', current_app.config['PORTFOLIO_PAGE_SIZE'], type=int)
+    return min(max(limit, 1), PORTFOLIO_MAX_PAGE_SIZE)
+
+def event_json(event):
+    """Public JSON for one portfolio item, with precomputed media URLs."""
+    return {
+        'id': event.id,
+        'title': event.title,
+        'description': event.description,
+        'date': event.date.isoformat() if event.date else None,
+        'sequence': event.sequence,
+        'category': {'id': event.category.id, 'name': event.category.name},
+        'image': {
+            'url': event.image_url,
+            'thumbnail_url': event.thumbnail_url,
+            'srcset': event.image_srcset(),
+            'sources': [{'type': mime, 'srcset': srcset} for mime, srcset in event.image_sources],
+            'width': event.image_width,
+            'height': event.image_height,
+            'aspect_ratio': event.image_aspect_ratio,
+            'color': event.image_color,
+            'placeholder': event.image_placeholder,
+        } if event.image_path else None,
+        'video': {
+            'url': event.video_url,
+            'type': event.video_mime_type,
+            'poster_url': event.video_poster_url,
+        } if event.video_path else None,
+    }
+
+@route('/portfolio')
+@query_budget(4)
+@conditional_page(EVENTS_CHANNEL, CATEGORIES_CHANNEL, THEME_CHANNEL, MEDIA_CHANNEL)
+@cached_page(EVENTS_CHANNEL, CATEGORIES_CHANNEL, THEME_CHANNEL, MEDIA_CHANNEL, args=PORTFOLIO_ARGS)
+def portfolio():
+    categories = Category.query.all()
+    query, keys, category_id = _portfolio_query(request.args.get('category_id', 'all'))
     
-    # Log query results for debugging
-    current_app.logger.info(f"Category filter: {category_id}")
-    current_app.logger.info(f"Number of events found: {len(events)}")
-    for event in events:
-        current_app.logger.info(f"Event: {event.title}, Category: {event.category.name}")
+    # Only the first page is rendered; gallery.js fetches the rest from
+    # /api/events as the visitor scrolls (?after= serves it without JS)
+    try:
+        page = keyset_page(query, keys, request.args.get('after'), _page_size())
+    except InvalidCursor:
+        abort(400)
+    events = page.items
     
-    # Debug log for each event's image path
-    for event in events:
-        current_app.logger.info(f"Event ID: {event.id}")
-        current_app.logger.info(f"Event Title: {event.title}")
-        current_app.logger.info(f"Category: {event.category.name}")
-        current_app.logger.info(f"Image path: {event.image_path}")
-        if event.image_path:
-            full_path = os.path.join(current_app.static_folder, event.image_path.lstrip('/'))
-            current_app.logger.info(f"Full path: {full_path}")
-            current_app.logger.info(f"File exists: {os.path.exists(full_path)}")
-        current_app.logger.info("---")
+    if current_app.config.get('PORTFOLIO_DEBUG_LOG'):
+        log_portfolio_events(category_id, events)
     
-    theme_colors = get_theme_colors()
+    next_url = next_api_url = None
+    if page.next_cursor:
+        next_url = url_for('portfolio', category_id=category_id, after=page.next_cursor)
+        next_api_url = url_for('api_events', category_id=category_id, after=page.next_cursor,
+                               limit=_page_size())
     return render_template('portfolio.html',
                          events=events,
                          categories=categories,
                          active_category=category_id,
-                         theme_colors=theme_colors)
+                         next_url=next_url,
+                         next_api_url=next_api_url)
+
+@route('/api/events')
+@query_budget(2)
+@conditional_page(EVENTS_CHANNEL, CATEGORIES_CHANNEL, MEDIA_CHANNEL)
+@cached_page(EVENTS_CHANNEL, CATEGORIES_CHANNEL, MEDIA_CHANNEL, args=PORTFOLIO_ARGS)
+def api_events():
+    """One cursor-paginated page of portfolio events as JSON.
 
-@app.route('/about')
+    Query parameters: ``category_id`` ('all' or an id), ``after`` (the
+    ``next_cursor`` of the previous page) and ``limit``.
+    """
+    query, keys, category_id = _portfolio_query(request.args.get('category_id', 'all'))
+    try:
+        page = keyset_page(query, keys, request.args.get('after'), _page_size())
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'events': [event_json(event) for event in page.items],
+        'next_cursor': page.next_cursor,
+        'next': url_for('api_events', category_id=category_id, after=page.next_cursor,
+                        limit=_page_size()) if page.next_cursor else None,
+    })
+
+@route('/about')
+@cached_page(THEME_CHANNEL)
 def about():
-    theme_colors = get_theme_colors()
-    return render_template('about.html', theme_colors=theme_colors)
+    return render_template('about.html')
 
-@app.route('/services')
+@route('/services')
+@cached_page(THEME_CHANNEL)
 def services():
-    theme_colors = get_theme_colors()
-    return render_template('services.html', theme_colors=theme_colors)
+    return render_template('services.html')
 
-@app.route('/contact', methods=['GET', 'POST'])
+@route('/contact', methods=['GET', 'POST'])
+@cached_page(THEME_CHANNEL)
 def contact():
     if request.method == 'POST':
         contact = Contact(
@@ -85,5 +180,42 @@ def contact():
         db.session.commit()
         flash('Thank you for your message! We will get back to you soon.')
         return redirect(url_for('contact'))
-    theme_colors=get_theme_colors()
-    return render_template('contact.html',theme_colors=theme_colors)
+    return render_template('contact.html')
+
+@route('/theme/<version>.css')
+def theme_stylesheet(version):
+    """Serve the active theme's stylesheet under a content-hashed URL."""
+    css, current_version = get_theme_stylesheet()
+    if version != current_version:
+        # Stale link from a cached page; point the client at the current theme
+        return redirect(url_for('theme_stylesheet', version=current_version))
+
+    response = current_app.response_class(css, mimetype='text/css')
+    response.set_etag(current_version)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+@route('/media/<version>/<path:filename>')
+def media(version, filename):
+    """Serve an upload under a content-hashed URL."""
+    path = os.path.join('uploads', filename)
+    if not is_media_path(path):
+        abort(404)
+    current_version = media_version(path)
+    if current_version is None:
+        if not media_exists(path):
+            abort(404)
+        # Legacy file whose fingerprint is still being computed; serve it,
+        # but not as immutable
+        return current_app.extensions['storage'].send(path.replace(os.sep, '/'), False, 0)
+    if version != current_version:
+        # Stale link from a cached page; point the client at the current file
+        return redirect(url_for('media', version=current_version, filename=filename))
+
+    # Local files are streamed with Range support; object stores get a redirect
+    response = current_app.extensions['storage'].send(path.replace(os.sep, '/'), current_version, 31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,162 @@
+// Resumable chunked uploads for the event form.
+//
+// Each file input with a data-upload-kind attribute is sent to the upload
+// session endpoint in Content-Range chunks before the form is submitted.
+// Interrupted chunks are retried from the offset the server reports, and the
+// form then carries only the stored path in a hidden <kind>_upload field.
+//
+// When the form has data-direct-upload="true", the file's SHA-256 is sent
+// instead and the server answers with a presigned request: the file goes
+// straight to the object store (or is skipped if the store already has it).
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.querySelector('form[data-upload-endpoint]');
+    if (!form) {
+        return;
+    }
+
+    const endpoint = form.dataset.uploadEndpoint;
+    const direct = form.dataset.directUpload === 'true' && window.crypto && crypto.subtle;
+    const token = form.querySelector('input[name="csrf_token"]').value;
+    const MAX_RETRIES = 5;
+
+    const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+    async function send(url, options) {
+        const response = await fetch(url, Object.assign({ credentials: 'same-origin' }, options));
+        const body = await response.json().catch(() => ({}));
+        return { status: response.status, ok: response.ok, body: body };
+    }
+
+    async function resumeOffset(session) {
+        const result = await send(`${endpoint}/${session.id}`, { headers: { 'X-CSRFToken': token } });
+        if (!result.ok) {
+            throw new Error(result.body.error || `Upload failed (${result.status})`);
+        }
+        return result.body.offset;
+    }
+
+    async function sha256(file) {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function uploadDirect(upload, file) {
+        for (let retries = 0; ; retries++) {
+            try {
+                const response = await fetch(upload.url, { method: upload.method, headers: upload.headers, body: file });
+                if (response.ok) {
+                    return;
+                }
+                throw new Error(`Upload failed (${response.status})`);
+            } catch (error) {
+                if (retries >= MAX_RETRIES) {
+                    throw error;
+                }
+                await sleep(1000 * (retries + 1));
+            }
+        }
+    }
+
+    async function uploadFile(kind, file, onProgress) {
+        const request = { kind: kind, filename: file.name, size: file.size };
+        if (direct) {
+            request.sha256 = await sha256(file);
+        }
+        const opened = await send(endpoint, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': token },
+            body: JSON.stringify(request)
+        });
+        if (!opened.ok) {
+            throw new Error(opened.body.error || `Upload failed (${opened.status})`);
+        }
+
+        if ('upload' in opened.body) {
+            if (opened.body.upload) {
+                await uploadDirect(opened.body.upload, file);
+            }
+            onProgress(1);
+            return opened.body.path;
+        }
+
+        const session = opened.body;
+        let offset = session.offset;
+        let retries = 0;
+        while (true) {
+            const end = Math.min(offset + session.chunk_size, file.size);
+            let result;
+            try {
+                result = await send(`${endpoint}/${session.id}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`,
+                        'X-CSRFToken': token
+                    },
+                    body: file.slice(offset, end)
+                });
+            } catch (error) {
+                // Network failure: wait, then resume from the server's offset
+                if (++retries > MAX_RETRIES) {
+                    throw error;
+                }
+                await sleep(1000 * retries);
+                offset = await resumeOffset(session);
+                continue;
+            }
+
+            if (result.status === 409) {
+                offset = result.body.offset;
+                continue;
+            }
+            if (!result.ok) {
+                throw new Error(result.body.error || `Upload failed (${result.status})`);
+            }
+
+            retries = 0;
+            offset = result.body.offset;
+            onProgress(offset / file.size);
+            if (result.body.complete) {
+                return result.body.path;
+            }
+        }
+    }
+
+    form.addEventListener('submit', async function(event) {
+        const inputs = Array.from(form.querySelectorAll('input[type="file"][data-upload-kind]'))
+            .filter((input) => input.files.length);
+        if (!inputs.length) {
+            return;
+        }
+
+        event.preventDefault();
+        const buttons = document.querySelectorAll(`button[type="submit"][form="${form.id}"], #${form.id} button[type="submit"]`);
+        buttons.forEach((button) => { button.disabled = true; });
+
+        try {
+            for (const input of inputs) {
+                const kind = input.dataset.uploadKind;
+                const progress = document.getElementById(`${kind}Progress`);
+                const bar = progress ? progress.querySelector('.progress-bar') : null;
+                if (progress) {
+                    progress.style.display = 'flex';
+                }
+
+                const path = await uploadFile(kind, input.files[0], (fraction) => {
+                    if (bar) {
+                        bar.style.width = `${Math.round(fraction * 100)}%`;
+                    }
+                });
+                form.querySelector(`input[name="${kind}_upload"]`).value = path;
+                // The file is stored; don't send it again with the form
+                input.disabled = true;
+            }
+            form.submit();
+        } catch (error) {
+            console.error('Upload failed:', error);
+            alert(`Upload failed: ${error.message}`);
+            inputs.forEach((input) => { input.disabled = false; });
+            buttons.forEach((button) => { button.disabled = false; });
+        }
+    });
+});
@@ -15,34 +15,39 @@ document.addEventListener('DOMContentLoaded', function() {
         const masonryInstances = [];
 
         grids.forEach((grid, index) => {
-            try {
-                if (typeof Masonry !== 'function') {
-                    throw new Error('Masonry library not loaded');
-                }
-
-                console.log(`Initializing Masonry for grid ${index + 1}`);
-                const masonry = new Masonry(grid, {
-                    itemSelector: '.gallery-item',
-                    columnWidth: '.gallery-item',
-                    gutter: 10,
-                    fitWidth: true,
-                    transitionDuration: '0.3s'
-                });
-
+            console.log(`Initializing Masonry for grid ${index + 1}`);
+            const masonry = createMasonry(grid);
+            if (masonry) {
                 masonryInstances.push(masonry);
-                console.log(`Masonry initialized successfully for grid ${index + 1}`);
-            } catch (error) {
-                console.error(`Gallery initialization error for grid ${index + 1}:`, error);
-                // Fallback to basic flex layout
-                grid.style.display = 'flex';
-                grid.style.flexWrap = 'wrap';
-                grid.style.justifyContent = 'space-between';
             }
         });
 
         return masonryInstances;
     };
 
+    const createMasonry = function(grid) {
+        try {
+            if (typeof Masonry !== 'function') {
+                throw new Error('Masonry library not loaded');
+            }
+
+            return new Masonry(grid, {
+                itemSelector: '.gallery-item',
+                columnWidth: '.gallery-item',
+                gutter: 10,
+                fitWidth: true,
+                transitionDuration: '0.3s'
+            });
+        } catch (error) {
+            console.error('Gallery initialization error:', error);
+            // Fallback to basic flex layout
+            grid.style.display = 'flex';
+            grid.style.flexWrap = 'wrap';
+            grid.style.justifyContent = 'space-between';
+            return null;
+        }
+    };
+
     // Initialize filtering functionality
     const initializeFilters = function(masonryInstances) {
         const filterButtons = document.querySelectorAll('.filter-btn');
@@ -126,6 +131,163 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log('Lazy loading initialized');
     };
 
+    // Load further pages from /api/events as the visitor scrolls. Each page
+    // is appended to the last category section when it continues it, or
+    // starts a new section, and handed to that section's Masonry instance.
+    const initializeInfiniteScroll = function(masonryInstances) {
+        const more = document.querySelector('.portfolio-more');
+        if (!more || !more.dataset.nextUrl) return;
+
+        const placeholder = more.dataset.placeholder;
+        const sizes = '(max-width: 576px) 100vw, (max-width: 992px) 50vw, 33vw';
+        let loading = false;
+
+        const createElement = function(tag, attributes, children) {
+            const element = document.createElement(tag);
+            Object.entries(attributes || {}).forEach(([name, value]) => {
+                if (value !== null && value !== undefined && value !== '') {
+                    element.setAttribute(name, value);
+                }
+            });
+            (children || []).forEach(child => element.append(child));
+            return element;
+        };
+
+        const buildPicture = function(event) {
+            const image = event.image;
+            const img = createElement('img', {
+                src: image.thumbnail_url,
+                srcset: image.srcset,
+                sizes: image.srcset ? sizes : null,
+                width: image.width,
+                height: image.height,
+                alt: event.title,
+                class: 'img-fluid',
+                loading: 'lazy'
+            });
+            if (image.placeholder) {
+                img.style.background = `${image.color || 'transparent'} url('${image.placeholder}') center / cover no-repeat`;
+            }
+            img.addEventListener('error', function onError() {
+                img.removeEventListener('error', onError);
+                img.removeAttribute('srcset');
+                img.src = placeholder;
+            });
+            const sources = image.sources.map(source =>
+                createElement('source', {type: source.type, srcset: source.srcset, sizes: sizes}));
+            return createElement('picture', {}, [...sources, img]);
+        };
+
+        const buildItem = function(event) {
+            const item = createElement('div', {class: 'gallery-item', 'data-sequence': event.sequence || 0});
+            if (event.image && event.video) {
+                const overlay = createElement('div', {class: 'play-overlay'}, [createElement('i', {class: 'fas fa-play'})]);
+                const video = createElement('video', {controls: '', preload: 'none', poster: event.video.poster_url},
+                    [createElement('source', {src: event.video.url, type: event.video.type})]);
+                item.append(createElement('div', {class: 'video-container'}, [
+                    createElement('div', {class: 'video-thumbnail'}, [buildPicture(event), overlay]),
+                    video
+                ]));
+            } else if (event.image) {
+                item.append(createElement('a', {href: event.image.url, class: 'glightbox'}, [buildPicture(event)]));
+            }
+            const date = event.date
+                ? new Date(event.date).toLocaleDateString('en-US', {month: 'long', year: 'numeric'})
+                : '';
+            const title = createElement('h4');
+            title.textContent = event.title;
+            const description = createElement('p');
+            description.textContent = event.description || '';
+            const dateLabel = createElement('span', {class: 'event-date'});
+            dateLabel.textContent = date;
+            item.append(createElement('div', {class: 'gallery-caption'}, [title, description, dateLabel]));
+            return item;
+        };
+
+        const sectionFor = function(category) {
+            const sections = document.querySelectorAll('.category-section');
+            const last = sections[sections.length - 1];
+            if (last && last.dataset.categoryId === String(category.id)) {
+                return last;
+            }
+            const heading = createElement('h3', {class: 'category-title mt-4 mb-3'});
+            heading.textContent = category.name;
+            const section = createElement('div', {class: 'category-section mb-5', 'data-category-id': category.id},
+                [heading, createElement('div', {class: 'gallery-grid'})]);
+            more.before(section);
+            return section;
+        };
+
+        const appendEvents = function(events) {
+            const added = new Map();
+            events.forEach(event => {
+                const grid = sectionFor(event.category).querySelector('.gallery-grid');
+                const item = buildItem(event);
+                grid.append(item);
+                if (!added.has(grid)) added.set(grid, []);
+                added.get(grid).push(item);
+            });
+
+            added.forEach((items, grid) => {
+                const masonry = typeof Masonry === 'function' ? Masonry.data(grid) : null;
+                if (masonry) {
+                    masonry.appended(items);
+                    // Images without known dimensions change height as they load
+                    const unsized = items.some(item => item.querySelector('img:not([width])'));
+                    if (unsized && typeof imagesLoaded === 'function') {
+                        imagesLoaded(items, () => masonry.layout());
+                    }
+                } else {
+                    const created = createMasonry(grid);
+                    if (created) masonryInstances.push(created);
+                }
+            });
+            if (typeof window.initializeVideoPlayers === 'function') {
+                window.initializeVideoPlayers();
+            }
+        };
+
+        const loadNextPage = function() {
+            if (loading || !more.dataset.nextUrl) return;
+            loading = true;
+            fetch(more.dataset.nextUrl, {headers: {'Accept': 'application/json'}})
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(page => {
+                    appendEvents(page.events);
+                    if (page.next) {
+                        more.dataset.nextUrl = page.next;
+                    } else {
+                        observer.disconnect();
+                        more.remove();
+                    }
+                })
+                .catch(error => {
+                    // Leave the "Load more" link as a fallback
+                    console.error('Could not load more events:', error);
+                    observer.disconnect();
+                })
+                .finally(() => {
+                    loading = false;
+                });
+        };
+
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, {rootMargin: '600px'});
+        observer.observe(more);
+
+        more.querySelector('a').addEventListener('click', function(e) {
+            e.preventDefault();
+            loadNextPage();
+        });
+        console.log('Infinite scroll initialized');
+    };
+
     // Wait for images to load before initializing
     const grids = document.querySelectorAll('.gallery-grid');
     if (!grids.length) {
@@ -133,17 +295,30 @@ document.addEventListener('DOMContentLoaded', function() {
         return;
     }
 
-    if (typeof imagesLoaded === 'function') {
+    // Images rendered with their dimensions already take their final size,
+    // so the grid can be laid out without waiting for them to download
+    const allSized = Array.from(document.querySelectorAll('.gallery-grid img'))
+        .every(img => img.hasAttribute('width') && img.hasAttribute('height'));
+
+    if (allSized) {
+        console.log('All image dimensions known, initializing immediately');
+        const masonryInstances = initializeMasonry();
+        initializeFilters(masonryInstances);
+        initializeLazyLoading(masonryInstances);
+        initializeInfiniteScroll(masonryInstances);
+    } else if (typeof imagesLoaded === 'function') {
         console.log('Using imagesLoaded for initialization');
         imagesLoaded(grids, function() {
             const masonryInstances = initializeMasonry();
             initializeFilters(masonryInstances);
             initializeLazyLoading(masonryInstances);
+            initializeInfiniteScroll(masonryInstances);
         });
     } else {
         console.warn('imagesLoaded not available, falling back to direct initialization');
         const masonryInstances = initializeMasonry();
         initializeFilters(masonryInstances);
         initializeLazyLoading(masonryInstances);
+        initializeInfiniteScroll(masonryInstances);
     }
 });
@@ -1,14 +1,19 @@
 document.addEventListener('DOMContentLoaded', function() {
+    let playerCount = 0;
+
+    // Safe to call again after gallery.js appends items; containers that
+    // already have a player are skipped
     const initializeVideoPlayers = function() {
         console.log('Initializing video players...');
-        const videoContainers = document.querySelectorAll('.video-container');
+        const videoContainers = document.querySelectorAll('.video-container:not([data-player-initialized])');
         
-        videoContainers.forEach((container, index) => {
+        videoContainers.forEach(container => {
             const thumbnail = container.querySelector('.video-thumbnail');
             const video = container.querySelector('video');
-            const playerId = `video-${index}`;
+            const playerId = `video-${playerCount++}`;
             
             if (!thumbnail || !video) return;
+            container.dataset.playerInitialized = 'true';
             
             // Set unique ID for the video element
             video.id = playerId;
@@ -71,5 +76,6 @@ document.addEventListener('DOMContentLoaded', function() {
     };
 
     // Initialize video players
+    window.initializeVideoPlayers = initializeVideoPlayers;
     initializeVideoPlayers();
 });
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('app')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{directory / 'test.db'}",
+        'INVALIDATION_BACKEND': 'local',
+        # Render every request so each one is measured
+        'PAGE_CACHE_BACKEND': 'null',
+        'JOBS_WORKERS': 0,
+        'REQUEST_LOG_ENABLED': False,
+        'WTF_CSRF_ENABLED': False,
+    })
+    with app.app_context():
+        db.create_all()
+    app.extensions['startup'].run()
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,31 @@
+"""Uploaded media must only ever be served from under ``uploads/``."""
+import pytest
+
+from utils.media_index import MediaIndex, is_media_path
+
+TRAVERSALS = ('/media/x/../../app.py', '/media/x/..%2F..%2Fapp.py',
+              '/media/x/images/..%2F..%2F..%2Fapp.py')
+
+@pytest.mark.parametrize('url', TRAVERSALS)
+@pytest.mark.parametrize('ready', (True, False))
+def test_media_rejects_traversal(client, monkeypatch, url, ready):
+    # Before the index is ready presence checks fall through to storage
+    monkeypatch.setattr(MediaIndex, 'ready', property(lambda self: ready))
+    response = client.get(url)
+    assert response.status_code == 404
+    assert b'create_app' not in response.data
+
+def test_storage_stays_under_its_root(app):
+    storage = app.extensions['storage']
+    assert not storage.exists('../app.py')
+    assert not storage.exists('uploads/../../app.py')
+
+@pytest.mark.parametrize('path, expected', [
+    ('uploads/images/a.jpg', True),
+    ('/uploads/images/a.jpg', True),
+    ('uploads/../app.py', False),
+    ('images/placeholder.svg', False),
+    ('uploads', False),
+])
+def test_is_media_path(path, expected):
+    assert is_media_path(path) is expected
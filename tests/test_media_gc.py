@@ -0,0 +1,57 @@
+"""The media GC must never mistake an empty database for a tree of orphans."""
+import os
+import time
+
+import pytest
+
+from extensions import db
+from models import Category, Event
+from utils.media_gc import MediaGCError, collect_garbage, media_gc_job
+from utils.storage import LocalStorage
+
+OLD = time.time() - 7 * 24 * 60 * 60
+
+@pytest.fixture
+def storage(app, tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setitem(app.extensions, 'storage', storage)
+    return storage
+
+def store(storage, path):
+    full_path = os.path.join(storage.root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as f:
+        f.write(b'media')
+    os.utime(full_path, (OLD, OLD))
+
+def clear_events():
+    Event.query.delete()
+    Category.query.delete()
+    db.session.commit()
+
+def test_refuses_to_delete_when_nothing_is_referenced(app, storage):
+    store(storage, 'uploads/images/a.jpg')
+    with app.app_context():
+        clear_events()
+        with pytest.raises(MediaGCError):
+            collect_garbage()
+        with pytest.raises(MediaGCError):
+            media_gc_job()
+    assert storage.exists('uploads/images/a.jpg')
+
+def test_deletes_only_unreferenced_files(app, storage):
+    store(storage, 'uploads/images/kept.jpg')
+    store(storage, 'uploads/images/orphan.jpg')
+    with app.app_context():
+        clear_events()
+        category = Category(name='GC', slug='gc')
+        db.session.add(category)
+        db.session.flush()
+        db.session.add(Event(title='GC', description='GC', category_id=category.id,
+                             image_path='/uploads/images/kept.jpg'))
+        db.session.commit()
+        stats = collect_garbage()
+        clear_events()
+    assert stats['orphans'] == ['uploads/images/orphan.jpg']
+    assert storage.exists('uploads/images/kept.jpg')
+    assert not storage.exists('uploads/images/orphan.jpg')
@@ -0,0 +1,69 @@
+"""Public pages must issue a fixed number of queries however much data there is.
+
+Each page is requested with a growing number of events spread across
+categories; the statement count has to stay within the view's
+``query_budget``, cold or warm, and must not grow with the data (an N+1
+regression).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import Category, Event
+from utils.page_cache import invalidate_pages, EVENTS_CHANNEL, CATEGORIES_CHANNEL, TESTIMONIALS_CHANNEL
+from utils.query_counter import count_queries
+
+EVENT_COUNTS = (1, 10, 60)
+PAGES = ('/', '/portfolio', '/portfolio?category_id={category_id}',
+         '/api/events', '/api/events?category_id={category_id}')
+
+def seed(app, events, categories=4):
+    # Imported here so pytest doesn't try to collect it as a test class
+    from models import Testimonial
+
+    with app.app_context():
+        Event.query.delete()
+        Category.query.delete()
+        Testimonial.query.delete()
+        category_ids = []
+        for i in range(categories):
+            category = Category(name=f"Category {i}", slug=f"category-{i}", sequence=i)
+            db.session.add(category)
+            db.session.flush()
+            category_ids.append(category.id)
+        started = datetime(2024, 1, 1)
+        for i in range(events):
+            db.session.add(Event(
+                title=f"Event {i}",
+                category_id=category_ids[i % categories],
+                description=f"Description {i}",
+                date=started + timedelta(days=i),
+                sequence=i if i % 3 else None,
+                image_path=f"uploads/images/{i:02x}/{i:064x}.jpg" if i % 2 else None,
+                video_path=f"uploads/videos/{i:02x}/{i:064x}.mp4" if i % 5 == 0 else None,
+            ))
+        for i in range(3):
+            db.session.add(Testimonial(client_name=f"Client {i}", content=f"Testimonial {i}", event_type="Wedding"))
+        db.session.commit()
+        invalidate_pages(EVENTS_CHANNEL, CATEGORIES_CHANNEL, TESTIMONIALS_CHANNEL)
+        return category_ids[0]
+
+def measure(app, client, url):
+    with count_queries() as counter:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    view = app.view_functions[app.url_map.bind('localhost').match(url.partition('?')[0])[0]]
+    return counter['count'], view.query_budget
+
+@pytest.mark.parametrize('page', PAGES)
+def test_page_stays_within_query_budget(app, client, page):
+    counts = []
+    for events in EVENT_COUNTS:
+        url = page.format(category_id=seed(app, events))
+        # The first request may also fill per-process caches (theme, media index)
+        for _ in range(2):
+            count, budget = measure(app, client, url)
+            assert count <= budget, f"{url} issued {count} queries with {events} events (budget {budget})"
+        counts.append(count)
+    assert len(set(counts)) == 1, f"{page} query count grows with the number of events: {counts}"
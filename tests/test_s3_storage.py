@@ -0,0 +1,62 @@
+"""S3Storage against moto's in-process stand-in for S3."""
+import base64
+import hashlib
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+requests = pytest.importorskip('requests')
+
+from utils.storage import S3Storage
+
+BUCKET = 'media'
+PATH = 'uploads/images/ab/abc.jpg'
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        yield S3Storage(BUCKET, region='us-east-1', public_url='https://cdn.example.com/media')
+
+def test_save_exists_send_delete(app, storage, tmp_path):
+    source = tmp_path / 'upload.jpg'
+    source.write_bytes(b'jpeg bytes')
+
+    storage.save(str(source), PATH)
+    assert not source.exists()
+    assert storage.exists(PATH)
+    assert [stored.path for stored in storage.iter_files('uploads')] == [PATH]
+    with storage.local_copy(PATH) as local_path:
+        with open(local_path, 'rb') as f:
+            assert f.read() == b'jpeg bytes'
+
+    head = storage.client.head_object(Bucket=BUCKET, Key=PATH)
+    assert head['ContentType'] == 'image/jpeg'
+    assert 'immutable' in head['CacheControl']
+
+    with app.test_request_context():
+        response = storage.send(PATH, 'v1', 31536000)
+    assert response.status_code == 302
+    assert response.location == f'https://cdn.example.com/media/{PATH}?v=v1'
+
+    storage.delete(PATH)
+    assert not storage.exists(PATH)
+    with pytest.raises(FileNotFoundError):
+        storage.mtime(PATH)
+
+def test_presigned_upload(storage):
+    body = b'direct upload'
+    digest = hashlib.sha256(body).hexdigest()
+    upload = storage.presign_upload(PATH, len(body), digest)
+    assert upload['method'] == 'PUT'
+    assert upload['headers']['x-amz-checksum-sha256'] == base64.b64encode(bytes.fromhex(digest)).decode()
+
+    response = requests.put(upload['url'], data=body, headers=upload['headers'])
+    assert response.status_code == 200
+    assert storage.exists(PATH)
+    with storage.local_copy(PATH) as local_path:
+        with open(local_path, 'rb') as f:
+            assert f.read() == body
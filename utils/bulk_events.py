@@ -0,0 +1,371 @@
+"""Bulk import and export of events.
+
+``flask events import MANIFEST --media PATH`` reads a CSV, JSON Lines or
+JSON array manifest one row at a time. ``--media`` is a directory or a zip
+archive holding the files the rows name. Rows are inserted in batches of
+``--batch-size``, one transaction per batch. The batch's media is copied
+into content-addressed storage by ``--workers`` threads first, so a batch
+either commits with all of its files or not at all. Variants, poster frames
+and image metadata are queued as the usual background jobs and processed by
+the job workers in parallel.
+
+Manifest columns: ``title`` (required), ``category`` (name or slug),
+``description``, ``date`` (ISO 8601), ``sequence``, ``image`` and ``video``
+(paths inside ``--media``, or content-addressed ``uploads/`` paths already
+in storage). Invalid rows are reported and skipped. If a batch fails to
+commit, the import stops and prints the ``--skip`` value that resumes after
+the last committed row.
+
+``flask events export OUTPUT`` streams every event to CSV or JSON Lines in
+the same columns (``-`` writes to stdout). ``--media-zip`` also writes the
+referenced files, so the pair can be imported elsewhere as a backup.
+"""
+import csv
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from extensions import db
+from models import Event, Category
+from utils.jobs import enqueue
+from utils.media_index import media_exists
+from utils.page_cache import invalidate_pages, EVENTS_CHANNEL, CATEGORIES_CHANNEL
+from utils.storage import get_storage
+from utils.uploads import UploadError, is_upload_path, store_stream
+
+MANIFEST_FIELDS = ('title', 'category', 'description', 'date', 'sequence', 'image', 'video')
+READ_SIZE = 64 * 1024
+
+class ImportRowError(ValueError):
+    pass
+
+def _iter_json_array(f):
+    """Yield the items of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer, started, eof = '', False, False
+    while not eof:
+        chunk = f.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise click.ClickException("JSON manifest must be an array of objects")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise click.ClickException("Malformed JSON manifest")
+                # The item continues in the next chunk
+                break
+            yield item
+        buffer = buffer[pos:]
+    raise click.ClickException("Malformed JSON manifest: unterminated array")
+
+def _iter_json_lines(f):
+    for line in f:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                # Reported against its row like any other invalid row
+                yield ImportRowError(f"Malformed JSON: {str(e)}")
+
+def iter_manifest(path):
+    """Yield (row number, dict) for each row of a CSV, JSON Lines or JSON manifest."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as f:
+        if extension == '.csv':
+            rows = csv.DictReader(f)
+        elif extension in ('.jsonl', '.ndjson'):
+            rows = _iter_json_lines(f)
+        elif extension == '.json':
+            rows = _iter_json_array(f)
+        else:
+            raise click.ClickException(f"Unsupported manifest type: {extension or path}")
+        for number, row in enumerate(rows, start=1):
+            yield number, row
+
+class MediaSource:
+    """Files named by manifest rows, in a directory or a zip archive."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if path and zipfile.is_zipfile(path) else None
+
+    def close(self):
+        if self._zip:
+            self._zip.close()
+
+    def _member(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        if '..' in name.split('/'):
+            raise ImportRowError(f"Media path escapes the media source: {name}")
+        return name
+
+    def contains(self, name):
+        if not self.path:
+            return False
+        name = self._member(name)
+        if self._zip:
+            try:
+                self._zip.getinfo(name)
+                return True
+            except KeyError:
+                return False
+        return os.path.isfile(os.path.join(self.path, name))
+
+    @contextmanager
+    def open(self, name):
+        name = self._member(name)
+        if self._zip:
+            with self._zip.open(name) as f:
+                yield f
+        else:
+            with open(os.path.join(self.path, name), 'rb') as f:
+                yield f
+
+def _store_media(app, source, name, kind):
+    """Thread task: store one manifest file and return its storage path."""
+    with app.app_context():
+        if source.contains(name):
+            with source.open(name) as f:
+                return store_stream(f, os.path.basename(name), kind)
+        # Already in storage, e.g. restoring an export on the same server. Only
+        # uploads qualify: releasing the event later may delete the file.
+        path = name.replace('\\', '/').lstrip('/')
+        if is_upload_path(kind, path) and (media_exists(path) or get_storage().exists(path)):
+            return path
+        raise ImportRowError(f"{kind.capitalize()} not found: {name}")
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+class CategoryResolver:
+    """Map manifest category names or slugs to ids, creating them if allowed."""
+
+    def __init__(self, create):
+        self.create = create
+        self.created = 0
+        self._ids = {}
+        for category in Category.query.all():
+            self._ids[category.name.lower()] = category.id
+            self._ids[category.slug.lower()] = category.id
+
+    def resolve(self, value):
+        if not value:
+            raise ImportRowError("Category is required")
+        category_id = self._ids.get(value.lower())
+        if category_id is not None:
+            return category_id
+        if not self.create:
+            raise ImportRowError(f"Unknown category: {value} (use --create-categories)")
+        category = Category(name=value, slug=value.lower().replace(' ', '-'))
+        db.session.add(category)
+        db.session.flush()
+        self._ids[category.name.lower()] = self._ids[category.slug.lower()] = category.id
+        self.created += 1
+        return category.id
+
+def _parse_row(row):
+    """Validate a manifest row and return the Event fields it sets."""
+    if isinstance(row, ImportRowError):
+        raise row
+    if not isinstance(row, dict):
+        raise ImportRowError("Row is not an object")
+    title = _text(row, 'title')
+    if not title:
+        raise ImportRowError("Title is required")
+    fields = {'title': title, 'description': _text(row, 'description')}
+    date = _text(row, 'date')
+    if date:
+        try:
+            fields['date'] = datetime.fromisoformat(date)
+        except ValueError:
+            raise ImportRowError(f"Invalid date: {date}")
+    sequence = _text(row, 'sequence')
+    try:
+        fields['sequence'] = float(sequence) if sequence else None
+    except ValueError:
+        raise ImportRowError(f"Invalid sequence: {sequence}")
+    return fields
+
+def _import_batch(app, batch, source, categories, executor, report):
+    """Insert one batch of (row number, row) in a single transaction.
+
+    Returns the number of events created. Row errors are reported and the
+    row skipped; a commit failure is raised.
+    """
+    # Copy each distinct file once, in parallel
+    media = {}
+    for _, row in batch:
+        for kind, field in (('image', 'image'), ('video', 'video')):
+            name = _text(row, field) if isinstance(row, dict) else None
+            if name and (kind, name) not in media:
+                media[(kind, name)] = executor.submit(_store_media, app, source, name, kind)
+
+    created = []
+    for number, row in batch:
+        try:
+            fields = _parse_row(row)
+            fields['category_id'] = categories.resolve(_text(row, 'category'))
+            for kind in ('image', 'video'):
+                name = _text(row, kind)
+                fields[f'{kind}_path'] = media[(kind, name)].result() if name else None
+        except (ImportRowError, UploadError, OSError) as e:
+            report(f"Row {number}: {str(e)}")
+            continue
+        event = Event(**fields)
+        if event.video_path:
+            event.video_status = 'pending'
+        created.append(event)
+
+    db.session.add_all(created)
+    db.session.flush()
+    for event in created:
+        if event.image_path:
+            enqueue('image_variants', event_id=event.id, image_path=event.image_path)
+        if event.video_path:
+            enqueue('video_variants', event_id=event.id, video_path=event.video_path)
+    db.session.commit()
+    return len(created)
+
+events_cli = AppGroup('events', help='Bulk event import and export.')
+
+@events_cli.command('import')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--media', type=click.Path(exists=True), help='Directory or zip archive with the media files.')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Rows per transaction.')
+@click.option('--workers', type=int, default=4, show_default=True, help='Threads copying media.')
+@click.option('--create-categories', is_flag=True, help='Create categories the manifest names.')
+@click.option('--skip', type=int, default=0, help='Skip this many rows, to resume an import.')
+def import_command(manifest, media, batch_size, workers, create_categories, skip):
+    """Create events from a CSV, JSON Lines or JSON manifest."""
+    app = current_app._get_current_object()
+    source = MediaSource(media)
+    categories = CategoryResolver(create_categories)
+    rows = islice(iter_manifest(manifest), skip, None)
+    imported, failed, done = 0, 0, skip
+
+    def report(message):
+        nonlocal failed
+        failed += 1
+        click.echo(message, err=True)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                try:
+                    imported += _import_batch(app, batch, source, categories, executor, report)
+                except Exception as e:
+                    db.session.rollback()
+                    raise click.ClickException(
+                        f"Batch starting at row {batch[0][0]} failed: {str(e)}. "
+                        f"Resume with --skip {done}")
+                done = batch[-1][0]
+                click.echo(f"Imported {imported} event(s) through row {done}")
+    finally:
+        source.close()
+        if imported:
+            invalidate_pages(EVENTS_CHANNEL)
+        if categories.created:
+            invalidate_pages(CATEGORIES_CHANNEL)
+
+    click.echo(f"Imported {imported} event(s), skipped {failed} row(s), "
+               f"created {categories.created} categor{'y' if categories.created == 1 else 'ies'}")
+    if imported:
+        click.echo("Media processing is queued; run `flask jobs worker` if no web process runs jobs")
+
+def _export_rows():
+    """Yield one manifest row per event, streamed from the database."""
+    statement = (
+        select(Event.title, Category.name, Event.description, Event.date, Event.sequence,
+               Event.image_path, Event.video_path)
+        .join(Category, Event.category_id == Category.id)
+        .order_by(Event.id)
+        .execution_options(yield_per=1000)
+    )
+    for title, category, description, date, sequence, image, video in db.session.execute(statement):
+        yield {
+            'title': title,
+            'category': category,
+            'description': description,
+            'date': date.isoformat() if date else None,
+            'sequence': sequence,
+            'image': image,
+            'video': video,
+        }
+
+@contextmanager
+def _open_output(path):
+    if path == '-':
+        yield sys.stdout
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            yield f
+
+@events_cli.command('export')
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'output_format', type=click.Choice(('csv', 'jsonl')),
+              help='Defaults to the OUTPUT extension, else csv.')
+@click.option('--media-zip', type=click.Path(dir_okay=False), help='Also write the media files to this zip.')
+def export_command(output, output_format, media_zip):
+    """Write every event to a manifest that `flask events import` accepts."""
+    output_format = output_format or ('jsonl' if output.endswith(('.jsonl', '.ndjson')) else 'csv')
+    paths, exported = set(), 0
+    with _open_output(output) as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS) if output_format == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for row in _export_rows():
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + '\n')
+            paths.update(path for path in (row['image'], row['video']) if path)
+            exported += 1
+    click.echo(f"Exported {exported} event(s)", err=output == '-')
+
+    if media_zip:
+        storage = get_storage()
+        written = 0
+        # Media is already compressed, so files are stored as they are
+        with zipfile.ZipFile(media_zip, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for path in sorted(paths):
+                if not storage.exists(path):
+                    click.echo(f"Missing media, not exported: {path}", err=True)
+                    continue
+                with storage.local_copy(path) as local_path:
+                    archive.write(local_path, path)
+                written += 1
+        click.echo(f"Wrote {written} media file(s) to {media_zip}", err=output == '-')
+
+def init_app(app):
+    app.cli.add_command(events_cli)
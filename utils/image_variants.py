@@ -0,0 +1,253 @@
+"""Responsive variants of uploaded event images.
+
+When an event image is saved, the original is resized to each width in
+``VARIANT_WIDTHS`` that is smaller than the original. Each width is encoded
+as JPEG plus every modern format this Pillow build can write (WebP, AVIF).
+Variants are stored next to the original under ``uploads/images/variants``.
+The manifest returned by ``generate_variants`` is stored in
+``Event.image_variants``, and templates use it to build ``srcset`` and
+``<picture>`` sources.
+
+The admin queues an ``image_variants`` job after saving an image. Until the
+job has run, templates fall back to the original. Uploads are stored by
+content hash, so variant names are too, and an event that shares its image
+with another event reuses that event's manifest. Variant names also carry a
+short hash of the encoder settings: variant URLs are cached as immutable, so
+retuning an encoder must write new files rather than new bytes under old
+names. Existing images are processed with ``flask images build-variants``.
+
+The same job records the image's dimensions, average colour and a tiny
+blurred JPEG (``Event.image_width``, ``image_height``, ``image_color`` and
+``image_placeholder``). Templates then reserve the right space and show the
+placeholder before the image loads, so the gallery can lay out at once.
+``flask images backfill-metadata`` fills them in for existing images.
+"""
+import base64
+import hashlib
+import io
+import os
+import tempfile
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from PIL import Image, ImageOps, features
+
+from utils.jobs import job_handler
+from utils.media_index import register_media, unregister_media, media_exists
+from utils.page_cache import invalidate_pages, EVENTS_CHANNEL
+from utils.storage import get_storage
+
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+VARIANT_DIR = os.path.join('uploads', 'images', 'variants')
+
+# mime type -> (Pillow format, extension, Pillow feature, save options)
+VARIANT_FORMATS = {
+    'image/avif': ('AVIF', 'avif', 'avif', {'quality': 55, 'speed': 8}),
+    'image/webp': ('WEBP', 'webp', 'webp', {'quality': 78, 'method': 4}),
+    'image/jpeg': ('JPEG', 'jpg', None, {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Longest side of the inline placeholder, in pixels
+PLACEHOLDER_SIZE = 16
+EXIF_ORIENTATION = 0x0112
+
+def available_formats():
+    """Mime types, best first, that this Pillow build can encode."""
+    return [mime for mime, (_, _, feature, _) in VARIANT_FORMATS.items()
+            if feature is None or features.check(feature)]
+
+def _encoder_tag(pil_format, options):
+    """Short hash of the encoder settings a variant is written with."""
+    settings = f"{pil_format}:{sorted(options.items())}"
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()[:8]
+
+def _variant_path(image_path, width, extension, tag):
+    return f"{VARIANT_DIR}/{os.path.basename(image_path)}-{width}w-{tag}.{extension}".replace(os.sep, '/')
+
+def _save(image, relative_path, pil_format, options):
+    storage = get_storage()
+    fd, tmp_path = tempfile.mkstemp(dir=storage.staging_dir(relative_path), prefix='.variant-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, format=pil_format, **options)
+        storage.save(tmp_path, relative_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def generate_variants(image_path, widths=VARIANT_WIDTHS):
+    """Write resized variants of the stored ``image_path`` and return the manifest."""
+    with get_storage().local_copy(image_path) as source, Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        width, height = image.size
+
+        targets = sorted({w for w in widths if w < width} | {min(width, max(widths))})
+        manifest = {'width': width, 'height': height, 'sources': {}}
+        for target in targets:
+            resized = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.Resampling.LANCZOS)
+            for mime in available_formats():
+                pil_format, extension, _, options = VARIANT_FORMATS[mime]
+                frame = resized.convert('RGB') if pil_format == 'JPEG' and resized.mode != 'RGB' else resized
+                relative_path = _variant_path(image_path, target, extension, _encoder_tag(pil_format, options))
+                _save(frame, relative_path, pil_format, options)
+                manifest['sources'].setdefault(mime, []).append([relative_path, target])
+    # One announcement for the whole set rather than one per file
+    register_media(*(path for entries in manifest['sources'].values() for path, _ in entries))
+
+    current_app.logger.info(f"Generated {sum(len(v) for v in manifest['sources'].values())} variants for {image_path}")
+    return manifest
+
+def read_image_metadata(image_path):
+    """Return the stored image's displayed size, average colour and placeholder.
+
+    Only a reduced version of the image is decoded, so this is cheap even for
+    large JPEGs.
+    """
+    with get_storage().local_copy(image_path) as source, Image.open(source) as original:
+        width, height = original.size
+        if original.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+            # Rotated a quarter turn when displayed
+            width, height = height, width
+        original.draft('RGB', (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.LANCZOS)
+
+        color = '#{:02x}{:02x}{:02x}'.format(*image.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=60)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    return {'width': width, 'height': height, 'color': color, 'placeholder': placeholder}
+
+def apply_image_metadata(event, metadata):
+    """Copy ``read_image_metadata`` results (or None to clear) onto ``event``."""
+    metadata = metadata or {}
+    event.image_width = metadata.get('width')
+    event.image_height = metadata.get('height')
+    event.image_color = metadata.get('color')
+    event.image_placeholder = metadata.get('placeholder')
+
+def remove_variants(manifest):
+    """Delete the files listed in a manifest from ``generate_variants``."""
+    paths = [path for entries in (manifest or {}).get('sources', {}).values() for path, _ in entries]
+    for path in paths:
+        get_storage().delete(path)
+    if paths:
+        unregister_media(*paths)
+
+def refresh_event_variants(event):
+    """Regenerate ``event.image_variants`` for its current image.
+
+    Files of the previous manifest that the new one doesn't reuse are deleted.
+    """
+    old_manifest = event.image_variants
+    event.image_variants = generate_variants(event.image_path) if event.image_path else None
+    if old_manifest:
+        keep = {path for entries in (event.image_variants or {}).get('sources', {}).values()
+                for path, _ in entries}
+        remove_variants({'sources': {mime: [e for e in entries if e[0] not in keep]
+                                     for mime, entries in old_manifest['sources'].items()}})
+    return event.image_variants
+
+def shared_manifest(model, path_column, variants_column, path, exclude_id):
+    """Variants manifest already built for ``path`` by another row, or None."""
+    from extensions import db
+
+    return db.session.execute(
+        db.select(variants_column)
+        .where(path_column == path, variants_column.isnot(None), model.id != exclude_id)
+        .limit(1)
+    ).scalar()
+
+@job_handler('image_variants', max_attempts=3, concurrency=2)
+def build_event_variants(event_id, image_path):
+    """Job: build variants for an event image saved by the admin.
+
+    Replaced images are released by the admin once no event uses them.
+    """
+    from extensions import db
+    from models import Event
+
+    event = db.session.get(Event, event_id)
+    if event is None or event.image_path != image_path:
+        # Deleted or replaced since the job was queued
+        return
+    manifest = shared_manifest(Event, Event.image_path, Event.image_variants, image_path, event_id)
+    if manifest and all(media_exists(path) for entries in manifest['sources'].values() for path, _ in entries):
+        event.image_variants = manifest
+    else:
+        event.image_variants = generate_variants(image_path)
+    if event.image_width is None:
+        apply_image_metadata(event, read_image_metadata(image_path))
+    db.session.commit()
+    invalidate_pages(EVENTS_CHANNEL)
+
+images_cli = AppGroup('images', help='Event image maintenance.')
+
+@images_cli.command('build-variants')
+@click.option('--force', is_flag=True, help='Rebuild variants that already exist.')
+def build_variants_command(force):
+    """Generate responsive variants for event images."""
+    from extensions import db
+    from models import Event
+
+    query = Event.query.filter(Event.image_path.isnot(None))
+    if not force:
+        query = query.filter(Event.image_variants.is_(None))
+    built = 0
+    for event in query.all():
+        try:
+            refresh_event_variants(event)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            click.echo(f"Skipping event {event.id} ({event.image_path}): {str(e)}", err=True)
+            db.session.rollback()
+            continue
+        db.session.commit()
+        built += 1
+    if built:
+        invalidate_pages(EVENTS_CHANNEL)
+    click.echo(f"Built variants for {built} event image(s)")
+
+@images_cli.command('backfill-metadata')
+@click.option('--force', is_flag=True, help='Recompute metadata that already exists.')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='Events per commit.')
+def backfill_metadata_command(force, batch_size):
+    """Record dimensions, colour and placeholder for existing event images."""
+    from extensions import db
+    from models import Event
+
+    query = Event.query.filter(Event.image_path.isnot(None))
+    if not force:
+        query = query.filter(Event.image_width.is_(None))
+    # Walk by id so each batch is a fresh, bounded query
+    last_id, updated = 0, 0
+    while True:
+        events = query.filter(Event.id > last_id).order_by(Event.id).limit(batch_size).all()
+        if not events:
+            break
+        for event in events:
+            try:
+                apply_image_metadata(event, read_image_metadata(event.image_path))
+                updated += 1
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                click.echo(f"Skipping event {event.id} ({event.image_path}): {str(e)}", err=True)
+        last_id = events[-1].id
+        db.session.commit()
+        click.echo(f"Updated {updated} event image(s), last id {last_id}")
+    if updated:
+        invalidate_pages(EVENTS_CHANNEL)
+    click.echo(f"Recorded metadata for {updated} event image(s)")
+
+def init_app(app):
+    app.cli.add_command(images_cli)
@@ -0,0 +1,417 @@
+"""Cross-process cache invalidation.
+
+Process-local caches stamp their contents with a per-channel generation
+number. Writers bump the generation after committing a change and readers
+compare it with the generation their cached copy was built under. The
+backend decides how a bump made in one worker reaches the others:
+
+- ``local``: an in-process counter, for single-process servers and scripts.
+- ``file``: one small counter file per channel on a shared directory. Works
+  for any number of workers on one host without an external service; other
+  workers notice a bump within ``INVALIDATION_POLL_INTERVAL`` seconds.
+- ``redis``: publishes bumps on a pub/sub broker. Any client exposing the
+  redis-py ``publish``/``pubsub`` API can be passed to
+  :class:`BrokerInvalidationBackend`.
+
+Generations only tell a process that something changed: the local and
+broker counters are per process and file counters restart if the directory
+is wiped. Anything shared between processes or with clients (ETags,
+entries in a shared page cache) uses ``get_version`` instead: a random token
+and timestamp written to the shared backend on every bump, so two different
+states of a channel never have the same version. The timestamp backs
+``Last-Modified`` headers without querying the data itself.
+
+A bump can carry a small JSON-serialisable ``change`` describing what
+changed. ``get_changes`` returns the changes made since a generation, so a
+cache that holds a lot of data can apply them instead of rebuilding; it
+returns None when any change in between is unknown (not recorded, dropped
+from the bounded log, or missed by a reconnecting listener), and the cache
+must then rebuild.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Changes kept per channel for get_changes
+CHANGE_LOG_SIZE = 1000
+
+# A globally unique token for one state of a channel, and when it began
+ChannelVersion = namedtuple('ChannelVersion', 'token modified')
+
+def _now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+def _new_version():
+    return ChannelVersion(uuid.uuid4().hex, _now())
+
+def _format_version(version):
+    return f"{version.token} {int(version.modified.timestamp())}"
+
+def _parse_version(value):
+    """Parse ``_format_version`` output; raises ValueError if malformed."""
+    if isinstance(value, bytes):
+        value = value.decode()
+    token, timestamp = value.split()
+    return ChannelVersion(token, datetime.fromtimestamp(int(timestamp), timezone.utc))
+
+def _changes_between(entries, since, generation):
+    """Changes of ``entries`` after ``since`` up to ``generation``, or None if any are missing."""
+    if since is None or generation < since:
+        return None
+    changes = [change for entry_generation, change in entries if since < entry_generation <= generation]
+    if len(changes) != generation - since or any(change is None for change in changes):
+        return None
+    return changes
+
+class InvalidationBackend:
+    """Base class for invalidation backends."""
+
+    def get_generation(self, channel):
+        raise NotImplementedError
+
+    def get_version(self, channel):
+        """Return the ``ChannelVersion`` of the current state of ``channel``."""
+        raise NotImplementedError
+
+    def bump(self, channel, change=None):
+        raise NotImplementedError
+
+    def get_changes(self, channel, since):
+        """Return the changes made to ``channel`` after generation ``since``, or None."""
+        return None
+
+class LocalInvalidationBackend(InvalidationBackend):
+    """Generation counters that only live in the current process."""
+
+    def __init__(self):
+        self._generations = {}
+        self._versions = {}
+        self._changes = {}
+        # Channels not bumped yet are as of process start
+        self._initial = _new_version()
+        self._lock = threading.Lock()
+
+    def get_generation(self, channel):
+        return self._generations.get(channel, 0)
+
+    def get_version(self, channel):
+        return self._versions.get(channel, self._initial)
+
+    def bump(self, channel, change=None):
+        with self._lock:
+            generation = self._generations.get(channel, 0) + 1
+            self._generations[channel] = generation
+            self._versions[channel] = _new_version()
+            self._changes.setdefault(channel, deque(maxlen=CHANGE_LOG_SIZE)).append((generation, change))
+            return generation
+
+    def get_changes(self, channel, since):
+        with self._lock:
+            return _changes_between(self._changes.get(channel, ()), since, self.get_generation(channel))
+
+class FileInvalidationBackend(InvalidationBackend):
+    """Generation counters stored in files on a directory shared by all workers.
+
+    Each channel's file holds its generation and version. A channel with no
+    version yet (new, or its file was lost) is given one under the channel
+    lock, so every worker agrees on it.
+    """
+
+    def __init__(self, directory, poll_interval=1.0):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._cache = {}  # channel -> (generation, version, checked_at)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, channel):
+        return os.path.join(self.directory, f"{channel}.gen")
+
+    def _log_path(self, channel):
+        return os.path.join(self.directory, f"{channel}.log")
+
+    def _read_log(self, channel):
+        entries = []
+        try:
+            with open(self._log_path(channel)) as f:
+                for line in f:
+                    generation, _, change = line.rstrip('\n').partition(' ')
+                    try:
+                        entries.append((int(generation), json.loads(change)))
+                    except ValueError:
+                        # Torn or foreign line; the gap makes readers rebuild
+                        continue
+        except OSError:
+            pass
+        return entries
+
+    def _append_log(self, channel, generation, change):
+        """Append a change to the channel's log; called with the channel locked."""
+        path = self._log_path(channel)
+        with open(path, 'a') as f:
+            f.write(f"{generation} {json.dumps(change, separators=(',', ':'))}\n")
+        entries = self._read_log(channel) if os.path.getsize(path) > CHANGE_LOG_SIZE * 256 else None
+        if entries and len(entries) > CHANGE_LOG_SIZE:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                for entry_generation, entry in entries[-CHANGE_LOG_SIZE // 2:]:
+                    f.write(f"{entry_generation} {json.dumps(entry, separators=(',', ':'))}\n")
+            os.replace(tmp_path, path)
+
+    def _read(self, channel):
+        """Return (generation, version); version is None if the channel has none."""
+        try:
+            with open(self._path(channel)) as f:
+                fields = f.read().split()
+        except OSError:
+            return 0, None
+        try:
+            generation = int(fields[0]) if fields else 0
+            version = _parse_version(' '.join(fields[1:3])) if len(fields) >= 3 else None
+        except ValueError:
+            return 0, None
+        return generation, version
+
+    def _write(self, channel, generation, version):
+        tmp_path = f"{self._path(channel)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(f"{generation} {_format_version(version)}")
+        os.replace(tmp_path, self._path(channel))
+
+    @contextmanager
+    def _locked(self, channel):
+        with self._lock:
+            with open(self._path(channel) + '.lock', 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _initialize(self, channel):
+        with self._locked(channel):
+            generation, version = self._read(channel)
+            if version is None:
+                version = _new_version()
+                self._write(channel, generation, version)
+        return generation, version
+
+    def _poll(self, channel):
+        cached = self._cache.get(channel)
+        now = time.monotonic()
+        if cached and now - cached[2] < self.poll_interval:
+            return cached
+        generation, version = self._read(channel)
+        if version is None:
+            generation, version = self._initialize(channel)
+        self._cache[channel] = (generation, version, now)
+        return self._cache[channel]
+
+    def get_generation(self, channel):
+        return self._poll(channel)[0]
+
+    def get_version(self, channel):
+        return self._poll(channel)[1]
+
+    def bump(self, channel, change=None):
+        with self._locked(channel):
+            generation = self._read(channel)[0] + 1
+            version = _new_version()
+            self._write(channel, generation, version)
+            self._append_log(channel, generation, change)
+        # The bumping worker sees its own change immediately
+        self._cache[channel] = (generation, version, time.monotonic())
+        return generation
+
+    def get_changes(self, channel, since):
+        # Read the counter afresh: a reader may be told to apply more than it polled
+        generation = self._read(channel)[0]
+        return _changes_between(self._read_log(channel), since, generation)
+
+class BrokerInvalidationBackend(InvalidationBackend):
+    """Generation counters kept in sync through a pub/sub broker.
+
+    Each worker keeps local counters; a bump increments the local counter and
+    publishes the channel name (and the change, if any), and a listener
+    thread increments the counter in every other worker when the message
+    arrives. Versions are stored in the broker itself (``GET``/``SET`` of
+    ``<topic>:<channel>``) and reloaded whenever the local counter moves.
+    If the connection drops, the listener resubscribes with
+    exponential backoff (up to ``max_backoff`` seconds) and then bumps every
+    channel it has seen, since messages published in between are lost. A
+    forked worker (gunicorn ``--preload``) doesn't inherit the thread, so it
+    starts its own listener the same way.
+    """
+
+    def __init__(self, client, topic='cache-invalidation', max_backoff=30.0):
+        self.client = client
+        self.topic = topic
+        self.max_backoff = max_backoff
+        self._local = LocalInvalidationBackend()
+        self._versions = {}  # channel -> (local generation, version)
+        self._channels = set()
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self._origin = f"{os.getpid()}-{id(self)}"
+
+    def _listening(self):
+        return self._listener_pid == os.getpid() and self._listener.is_alive()
+
+    def _ensure_listener(self):
+        """Start the listener, again in a forked worker or if it died."""
+        if self._listener and self._listening():
+            return
+        with self._listener_lock:
+            if self._listener and self._listening():
+                return
+            # A restart missed whatever was published since the last listener
+            restarted = self._listener is not None
+            self._origin = f"{os.getpid()}-{id(self)}"
+            self._listener_pid = os.getpid()
+            self._listener = threading.Thread(target=self._run, args=(restarted,),
+                                              name='invalidation-listener', daemon=True)
+            self._listener.start()
+
+    def _run(self, connected_before=False):
+        backoff = 0
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.topic)
+                if connected_before:
+                    # Bumps published while we were away were missed
+                    for channel in list(self._channels):
+                        self._local.bump(channel)
+                    logger.warning(f"Resubscribed to {self.topic}; invalidated {len(self._channels)} channel(s)")
+                connected_before = True
+                backoff = 0
+                self._listen(pubsub)
+            except Exception as e:
+                backoff = min(self.max_backoff, backoff * 2 or 0.5)
+                logger.error(f"Invalidation listener lost its connection, retrying in {backoff}s: {str(e)}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+
+    def _listen(self, pubsub):
+        for message in pubsub.listen():
+            data = message.get('data')
+            if isinstance(data, bytes):
+                data = data.decode()
+            origin, _, data = (data or '').partition(':')
+            channel, _, change = data.partition(':')
+            if channel and origin != self._origin:
+                try:
+                    change = json.loads(change) if change else None
+                except ValueError:
+                    change = None
+                self._channels.add(channel)
+                self._local.bump(channel, change)
+        raise ConnectionError("Subscription ended")
+
+    def get_generation(self, channel):
+        self._ensure_listener()
+        self._channels.add(channel)
+        return self._local.get_generation(channel)
+
+    def _version_key(self, channel):
+        return f"{self.topic}:{channel}"
+
+    def get_version(self, channel):
+        generation = self.get_generation(channel)
+        cached = self._versions.get(channel)
+        if cached and cached[0] == generation:
+            return cached[1]
+        try:
+            value = self.client.get(self._version_key(channel))
+            if value is None:
+                self.client.set(self._version_key(channel), _format_version(_new_version()), nx=True)
+                value = self.client.get(self._version_key(channel))
+            version = _parse_version(value)
+        except Exception as e:
+            logger.error(f"Could not load the version of {channel}: {str(e)}")
+            # Unique, so it can't match anything a client has cached
+            return _new_version()
+        self._versions[channel] = (generation, version)
+        return version
+
+    def bump(self, channel, change=None):
+        self._ensure_listener()
+        self._channels.add(channel)
+        version = _new_version()
+        self.client.set(self._version_key(channel), _format_version(version))
+        generation = self._local.bump(channel, change)
+        self._versions[channel] = (generation, version)
+        message = f"{self._origin}:{channel}"
+        if change is not None:
+            message += ':' + json.dumps(change, separators=(',', ':'))
+        self.client.publish(self.topic, message)
+        return generation
+
+    def get_changes(self, channel, since):
+        return self._local.get_changes(channel, since)
+
+def create_backend(app):
+    """Build the invalidation backend selected by ``INVALIDATION_BACKEND``."""
+    kind = app.config.get('INVALIDATION_BACKEND', 'file')
+    if kind == 'local':
+        return LocalInvalidationBackend()
+    if kind == 'file':
+        directory = app.config.get('INVALIDATION_DIR') or os.path.join(app.instance_path, 'invalidation')
+        return FileInvalidationBackend(directory, app.config.get('INVALIDATION_POLL_INTERVAL', 1.0))
+    if kind == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("INVALIDATION_BACKEND=redis requires the 'redis' package")
+        return BrokerInvalidationBackend(redis.Redis.from_url(app.config['INVALIDATION_BROKER_URL']))
+    raise ValueError(f"Unknown invalidation backend: {kind}")
+
+def init_app(app):
+    """Attach the configured invalidation backend to the app."""
+    backend = create_backend(app)
+    app.extensions['invalidation'] = backend
+    app.logger.info(f"Cache invalidation backend: {type(backend).__name__}")
+    return backend
+
+def get_generation(channel):
+    """Return the current generation of ``channel``."""
+    return current_app.extensions['invalidation'].get_generation(channel)
+
+def get_version(channel):
+    """Return the globally unique ``ChannelVersion`` of ``channel``."""
+    return current_app.extensions['invalidation'].get_version(channel)
+
+def get_changes(channel, since):
+    """Return the changes made to ``channel`` after generation ``since``, or None."""
+    return current_app.extensions['invalidation'].get_changes(channel, since)
+
+def bump_generation(channel, change=None):
+    """Invalidate every cache built from ``channel``; call after committing.
+
+    ``change`` optionally describes the change for ``get_changes``.
+    """
+    return current_app.extensions['invalidation'].bump(channel, change)
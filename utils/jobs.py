@@ -0,0 +1,316 @@
+"""Database-backed background jobs.
+
+Media work (resizing, poster frames, transcoding, hashing) runs outside the
+request that uploaded the file. ``enqueue`` adds a ``Job`` row to the current
+session, so the job is committed together with the change that needs it, and
+wakes this process's workers after the commit. Workers claim queued jobs with
+a conditional UPDATE. Web processes and ``flask jobs worker`` processes can
+therefore share one queue, and queued jobs survive restarts.
+
+- ``JOBS_WORKERS``: worker threads per web process, started on the first
+  request. 0 leaves all work to ``flask jobs worker``. Other commands and
+  scripts only enqueue; their jobs run in those processes.
+- ``JOBS_POLL_INTERVAL``: seconds between queue polls when idle.
+- ``JOBS_RETRY_DELAY``: seconds before the first retry, doubled per attempt.
+- ``JOBS_HEARTBEAT_INTERVAL``: seconds between heartbeats of a running job.
+  A job's worker stamps ``heartbeat_at`` while the handler runs, however
+  long it takes.
+- ``JOBS_TIMEOUT``: seconds without a heartbeat after which a running job is
+  presumed lost (its worker died) and is requeued.
+
+Handlers are registered with ``@job_handler(kind, max_attempts, concurrency)``.
+``concurrency`` caps how many jobs of that kind run at once across all workers.
+A handler that records failures on its own rows checks ``is_final_attempt()``
+first, so a failure that will be retried isn't reported as final.
+``every`` names a config key holding an interval in seconds; such a job is
+scheduled when the workers start and again that long after each run, with at
+most one queued at a time.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, g, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event as sa_event, func, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Job
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+JOB_HANDLERS = {}
+
+def job_handler(kind, max_attempts=3, concurrency=None, every=None):
+    """Register ``func(**payload)`` as the handler for jobs of ``kind``."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = {'func': func, 'max_attempts': max_attempts,
+                              'concurrency': concurrency, 'every': every}
+        return func
+    return decorator
+
+def enqueue(kind, **payload):
+    """Add a job to the current session; it is queued when the session commits."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(kind=kind, payload=payload, max_attempts=JOB_HANDLERS[kind]['max_attempts'])
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+def schedule_job(kind, delay=0, **payload):
+    """Queue a job to run in ``delay`` seconds unless one of ``kind`` is already queued.
+
+    Commits the current session. Returns the new job, or None.
+    """
+    pending = db.session.query(Job.query.filter(Job.kind == kind, Job.status == 'queued').exists()).scalar()
+    if pending:
+        return None
+    job = enqueue(kind, **payload)
+    job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.commit()
+    return job
+
+def schedule_periodic_jobs():
+    """Make sure every periodic job kind has a run queued."""
+    for kind, handler in JOB_HANDLERS.items():
+        interval = current_app.config.get(handler['every']) if handler['every'] else None
+        if interval:
+            running = db.session.query(Job.query.filter(Job.kind == kind, Job.status == 'running').exists()).scalar()
+            if not running:
+                schedule_job(kind)
+
+@sa_event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('jobs_enqueued', False) and has_app_context():
+        # Only wakes workers already running here; a CLI command that enqueues
+        # must not start daemon workers that die with it mid-job
+        pool = current_app.extensions.get('jobs')
+        if pool is not None:
+            pool.wake()
+
+def requeue_lost_jobs(now):
+    """Requeue (or fail) running jobs whose worker stopped reporting."""
+    cutoff = now - timedelta(seconds=current_app.config['JOBS_TIMEOUT'])
+    lost = (Job.status == 'running', func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff)
+    failed = db.session.execute(update(Job).where(*lost, Job.attempts >= Job.max_attempts)
+                                .values(status='failed', finished_at=now, error='Worker lost')).rowcount
+    requeued = db.session.execute(update(Job).where(*lost).values(status='queued', run_at=now)).rowcount
+    db.session.commit()
+    if failed or requeued:
+        current_app.logger.warning(f"Lost jobs: {requeued} requeued, {failed} failed")
+
+def claim_next_job(worker):
+    """Mark the next runnable job as ours and return it, or None."""
+    now = datetime.utcnow()
+    requeue_lost_jobs(now)
+
+    candidates = db.session.execute(
+        select(Job.id, Job.kind)
+        .where(Job.status == 'queued', Job.run_at <= now, Job.kind.in_(list(JOB_HANDLERS)))
+        .order_by(Job.run_at, Job.id)
+        .limit(10)
+    ).all()
+    for job_id, kind in candidates:
+        claim = update(Job).where(Job.id == job_id, Job.status == 'queued')
+        limit = JOB_HANDLERS[kind]['concurrency']
+        if limit:
+            running = select(func.count()).select_from(Job) \
+                .where(Job.kind == kind, Job.status == 'running').scalar_subquery()
+            claim = claim.where(running < limit)
+        claimed = db.session.execute(
+            claim.values(status='running', worker=worker, started_at=now, heartbeat_at=now,
+                         attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+class Heartbeat:
+    """Stamp a running job's ``heartbeat_at`` from a side thread until stopped."""
+
+    def __init__(self, app, job_id, interval):
+        self.app = app
+        self.job_id = job_id
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{self.job_id}', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    db.session.execute(update(Job).where(Job.id == self.job_id, Job.status == 'running')
+                                       .values(heartbeat_at=datetime.utcnow()))
+                    db.session.commit()
+            except Exception as e:
+                # The next beat may get through; only a long silence loses the job
+                self.app.logger.warning(f"Job {self.job_id} heartbeat failed: {str(e)}")
+
+def is_final_attempt():
+    """True inside a job handler running its last attempt (no retry will follow)."""
+    return g.get('job_final_attempt', True)
+
+def run_next_job(worker):
+    """Claim and run one job. Returns False if there was nothing to run."""
+    job = claim_next_job(worker)
+    if job is None:
+        return False
+
+    job_id, kind, payload = job.id, job.kind, dict(job.payload or {})
+    g.job_final_attempt = job.attempts >= job.max_attempts
+    started = time.perf_counter()
+    heartbeat = Heartbeat(current_app._get_current_object(), job_id, current_app.config['JOBS_HEARTBEAT_INTERVAL'])
+    try:
+        with heartbeat:
+            JOB_HANDLERS[kind]['func'](**payload)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.error = f"{type(e).__name__}: {str(e)}"
+        if job.attempts < job.max_attempts:
+            delay = current_app.config['JOBS_RETRY_DELAY'] * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+            current_app.logger.warning(f"Job {job_id} ({kind}) failed, retrying in {delay}s: {job.error}")
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            current_app.logger.error(f"Job {job_id} ({kind}) failed after {job.attempts} attempts: {job.error}")
+    else:
+        job = db.session.get(Job, job_id)
+        job.status = 'succeeded'
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        current_app.logger.info(f"Job {job_id} ({kind}) finished in {(time.perf_counter() - started) * 1000:.0f}ms")
+    db.session.commit()
+
+    every = JOB_HANDLERS[kind]['every']
+    interval = current_app.config.get(every) if every else None
+    if interval:
+        # No-op while a retry or continuation of this kind is queued
+        schedule_job(kind, delay=interval)
+    return True
+
+def job_summary(limit=10):
+    """Counts per status and the most recent unfinished or failed jobs."""
+    counts = dict.fromkeys(JOB_STATUSES, 0)
+    counts.update(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+    recent = Job.query.filter(Job.status != 'succeeded').order_by(Job.id.desc()).limit(limit).all()
+    return {'counts': counts, 'recent': recent}
+
+class WorkerPool:
+    """Threads that run queued jobs in this process."""
+
+    def __init__(self, app, workers, poll_interval):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Start the threads once per process (again in a forked child)."""
+        if self.workers <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+            self.app.logger.info(f"Started {self.workers} job worker(s) in process {self._pid}")
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _run(self):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        if threading.current_thread().name == 'job-worker-0':
+            try:
+                with self.app.app_context():
+                    schedule_periodic_jobs()
+            except Exception:
+                self.app.logger.exception("Could not schedule periodic jobs")
+        while not self._stopping.is_set():
+            ran = False
+            try:
+                with self.app.app_context():
+                    ran = run_next_job(worker)
+            except Exception:
+                self.app.logger.exception("Job worker error")
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+
+@jobs_cli.command('worker')
+@click.option('--workers', type=int, default=2, show_default=True, help='Worker threads.')
+def worker_command(workers):
+    """Run jobs until interrupted."""
+    pool = WorkerPool(current_app._get_current_object(), workers, current_app.config['JOBS_POLL_INTERVAL'])
+    # Jobs enqueued by handlers wake these workers
+    current_app.extensions['jobs'] = pool
+    pool.start()
+    click.echo(f"Running {workers} job worker(s), press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(JOB_STATUSES))
+@click.option('--limit', type=int, default=20, show_default=True)
+def list_command(status, limit):
+    """Show recent jobs."""
+    query = Job.query.order_by(Job.id.desc())
+    if status:
+        query = query.filter_by(status=status)
+    for job in query.limit(limit):
+        click.echo(f"{job.id:>6} {job.kind:<20} {job.status:<10} attempts={job.attempts} {job.error or ''}")
+
+@jobs_cli.command('retry')
+@click.argument('job_id', type=int)
+def retry_command(job_id):
+    """Requeue a failed job."""
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'failed':
+        raise click.ClickException(f"Job {job_id} is not a failed job")
+    job.status = 'queued'
+    job.attempts = 0
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    click.echo(f"Requeued job {job_id}")
+
+def init_app(app):
+    app.config.setdefault('JOBS_WORKERS', 2)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 5.0)
+    app.config.setdefault('JOBS_RETRY_DELAY', 30)
+    app.config.setdefault('JOBS_HEARTBEAT_INTERVAL', 30)
+    app.config.setdefault('JOBS_TIMEOUT', 5 * 60)
+    pool = WorkerPool(app, app.config['JOBS_WORKERS'], app.config['JOBS_POLL_INTERVAL'])
+    app.extensions['jobs'] = pool
+    app.before_request(pool.start)
+    app.cli.add_command(jobs_cli)
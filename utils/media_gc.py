@@ -0,0 +1,210 @@
+"""Garbage collection of uploaded media that no event references.
+
+Files under ``uploads/`` in the storage backend are compared with the paths ``Event`` refers
+to: ``image_path``, ``video_path`` and every file in their variant manifests.
+The tree is walked in path order, ``MEDIA_GC_BATCH_SIZE`` files at a time.
+After each batch the walk can stop and later resume from the last path it
+saw (the cursor), so a large tree is never held in memory. References are
+loaded once per pass; a file that gains a reference during the pass is
+either new or was touched when it was reused, so the grace period keeps it.
+
+A file is only an orphan if nothing references it and it was last modified
+more than ``MEDIA_GC_GRACE_PERIOD`` seconds ago. The grace period protects
+uploads that are stored but not yet saved on an event, and variants that a
+job is still writing.
+
+- ``flask media usage`` reports bytes per directory and how much is reclaimable.
+- ``flask media gc`` deletes orphans; ``--dry-run`` only lists them.
+- The ``media_gc`` job runs a whole pass, pausing ``MEDIA_GC_PAUSE`` seconds
+  between batches. A new pass starts every ``MEDIA_GC_INTERVAL`` seconds
+  (0, the default, disables it).
+
+Deleting refuses to start if no event references any media while uploads
+exist: that is what an empty or wrong database looks like, and every upload
+would be an orphan.
+"""
+import os
+import re
+import time
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from extensions import db
+from models import Event
+from utils.jobs import job_handler
+from utils.media_index import unregister_media
+from utils.storage import get_storage
+
+MEDIA_GC_ROOT = 'uploads'
+IGNORED_NAMES = frozenset({'.gitkeep', '.gitignore'})
+_FAN_OUT_DIR = re.compile(r'^[0-9a-f]{2}$')
+
+class MediaGCError(RuntimeError):
+    pass
+
+def iter_media_files(after=None):
+    """Stored files under ``uploads/`` whose path sorts after ``after``."""
+    for stored in get_storage().iter_files(MEDIA_GC_ROOT, after):
+        if os.path.basename(stored.path) not in IGNORED_NAMES:
+            yield stored
+
+def referenced_paths():
+    """Every upload path an event uses, variants included."""
+    paths = set()
+    rows = db.session.execute(
+        db.select(Event.image_path, Event.video_path, Event.image_variants, Event.video_variants)
+        .execution_options(yield_per=1000)
+    )
+    for image_path, video_path, image_variants, video_variants in rows:
+        paths.update(p for p in (image_path, video_path) if p)
+        for entries in (image_variants or {}).get('sources', {}).values():
+            paths.update(path for path, _ in entries)
+        paths.update((video_variants or {}).get(key) for key in ('mp4', 'poster'))
+    paths.discard(None)
+    # Stored the way the storage backend lists them (legacy rows may start with /)
+    return {p.replace(os.sep, '/').lstrip('/') for p in paths}
+
+def checked_references():
+    """``referenced_paths()``, or MediaGCError if none exist but uploads do."""
+    referenced = referenced_paths()
+    if not referenced and next(iter_media_files(), None) is not None:
+        raise MediaGCError("No event references any media but uploads exist; "
+                           "refusing to delete them (is DATABASE_URL right?)")
+    return referenced
+
+def scan_batch(cursor=None, batch_size=None, grace=None, referenced=None):
+    """Classify the next batch of files after ``cursor``.
+
+    ``referenced`` is the result of ``referenced_paths()``, loaded if not
+    given; pass it in when scanning several batches. Returns
+    ``(entries, cursor)``. Entries are ``(path, size, orphan)``; the returned
+    cursor is None once the walk has reached the end of the tree.
+    """
+    batch_size = batch_size or current_app.config['MEDIA_GC_BATCH_SIZE']
+    grace = current_app.config['MEDIA_GC_GRACE_PERIOD'] if grace is None else grace
+    files = list(islice(iter_media_files(cursor), batch_size))
+    if referenced is None:
+        referenced = referenced_paths()
+    cutoff = time.time() - grace
+    entries = [(f.path, f.size, f.path not in referenced and f.mtime < cutoff) for f in files]
+    next_cursor = files[-1].path if len(files) == batch_size else None
+    return entries, next_cursor
+
+def delete_orphans(paths):
+    """Delete orphaned files and drop them from the media index."""
+    storage = get_storage()
+    for path in paths:
+        storage.delete(path)
+    if paths:
+        unregister_media(*paths)
+
+def collect_garbage(cursor=None, batch_size=None, grace=None, dry_run=False, referenced=None):
+    """Process one batch; returns counts, byte totals and the next cursor."""
+    if referenced is None and not dry_run:
+        referenced = checked_references()
+    entries, next_cursor = scan_batch(cursor, batch_size, grace, referenced)
+    orphans = [(path, size) for path, size, orphan in entries if orphan]
+    if not dry_run:
+        delete_orphans([path for path, _ in orphans])
+    return {
+        'scanned': len(entries),
+        'bytes': sum(size for _, size, _ in entries),
+        'orphans': [path for path, _ in orphans],
+        'orphan_bytes': sum(size for _, size in orphans),
+        'cursor': next_cursor,
+    }
+
+def _group(path):
+    """Directory of ``path`` without content-hash fan-out levels, for reports."""
+    parts = [p for p in path.split('/')[1:-1] if not _FAN_OUT_DIR.match(p)]
+    return '/'.join(parts) or '.'
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+@job_handler('media_gc', max_attempts=1, concurrency=1, every='MEDIA_GC_INTERVAL')
+def media_gc_job(cursor=None, deleted=0, freed=0):
+    """Job: delete the orphans of a whole pass (from ``cursor``), batch by batch."""
+    referenced = checked_references()
+    while True:
+        stats = collect_garbage(cursor, referenced=referenced)
+        deleted += len(stats['orphans'])
+        freed += stats['orphan_bytes']
+        cursor = stats['cursor']
+        if cursor is None:
+            break
+        time.sleep(current_app.config['MEDIA_GC_PAUSE'])
+    current_app.logger.info(f"Media GC pass finished: deleted {deleted} file(s), freed {_format_bytes(freed)}")
+
+media_cli = AppGroup('media', help='Uploaded media maintenance.')
+
+@media_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='List orphans without deleting them.')
+@click.option('--batch-size', type=int, help='Files per batch.  [default: MEDIA_GC_BATCH_SIZE]')
+@click.option('--grace', type=int, help='Minimum age in seconds of a deletable file.  [default: MEDIA_GC_GRACE_PERIOD]')
+@click.option('--cursor', help='Resume after this path, as printed by an interrupted run.')
+@click.option('--max-batches', type=int, help='Stop after this many batches.')
+@click.option('--pause', type=float, default=0, show_default=True, help='Seconds to wait between batches.')
+def gc_command(dry_run, batch_size, grace, cursor, max_batches, pause):
+    """Delete uploaded files that no event references."""
+    scanned = scanned_bytes = orphans = orphan_bytes = batches = 0
+    try:
+        referenced = referenced_paths() if dry_run else checked_references()
+    except MediaGCError as e:
+        raise click.ClickException(str(e))
+    while True:
+        stats = collect_garbage(cursor, batch_size, grace, dry_run=dry_run, referenced=referenced)
+        batches += 1
+        scanned += stats['scanned']
+        scanned_bytes += stats['bytes']
+        orphans += len(stats['orphans'])
+        orphan_bytes += stats['orphan_bytes']
+        for path in stats['orphans']:
+            click.echo(f"{'Would delete' if dry_run else 'Deleted'} {path}")
+        cursor = stats['cursor']
+        if cursor is None or (max_batches and batches >= max_batches):
+            break
+        if pause:
+            time.sleep(pause)
+
+    action = 'reclaimable' if dry_run else 'freed'
+    click.echo(f"Scanned {scanned} file(s), {_format_bytes(scanned_bytes)}; "
+               f"{orphans} orphan(s), {_format_bytes(orphan_bytes)} {action}")
+    if cursor:
+        click.echo(f"Stopped early, resume with --cursor {cursor}")
+
+@media_cli.command('usage')
+@click.option('--grace', type=int, help='Minimum age in seconds of a reclaimable file.  [default: MEDIA_GC_GRACE_PERIOD]')
+def usage_command(grace):
+    """Report storage used per upload directory and how much is reclaimable."""
+    totals = {}
+    cursor = None
+    referenced = referenced_paths()
+    while True:
+        entries, cursor = scan_batch(cursor, grace=grace, referenced=referenced)
+        for path, size, orphan in entries:
+            group = totals.setdefault(_group(path), [0, 0, 0])
+            group[0] += 1
+            group[1] += size
+            group[2] += size if orphan else 0
+        if cursor is None:
+            break
+
+    click.echo(f"{'Directory':<20} {'Files':>7} {'Size':>10} {'Reclaimable':>12}")
+    for name, (count, size, reclaimable) in sorted(totals.items()):
+        click.echo(f"{name:<20} {count:>7} {_format_bytes(size):>10} {_format_bytes(reclaimable):>12}")
+    count, size, reclaimable = (sum(column) for column in zip(*totals.values())) if totals else (0, 0, 0)
+    click.echo(f"{'Total':<20} {count:>7} {_format_bytes(size):>10} {_format_bytes(reclaimable):>12}")
+
+def init_app(app):
+    app.config.setdefault('MEDIA_GC_BATCH_SIZE', 500)
+    app.config.setdefault('MEDIA_GC_GRACE_PERIOD', 24 * 60 * 60)
+    app.config.setdefault('MEDIA_GC_INTERVAL', 0)
+    app.config.setdefault('MEDIA_GC_PAUSE', 1.0)
+    app.cli.add_command(media_cli)
@@ -0,0 +1,305 @@
+"""In-memory index of uploaded media present in the storage backend.
+
+``Event.image_url`` used to stat the static folder on every read. The index
+is built with one listing of the storage backend by a background thread
+started at boot (once per process), so neither startup nor the first request
+waits for the walk. Until it is ready a presence check is "unknown": callers
+that need the truth ask the storage backend, and rendering assumes the file
+is there and marks the page so it isn't cached (see
+:mod:`utils.page_cache`). After that the index is kept current by the admin
+upload and delete paths, so a presence check is a set lookup. Each change is
+announced on the ``media`` invalidation channel with the paths added or
+removed, and other workers apply those paths when they see a new generation.
+They only rescan if changes were missed. An optional periodic reconciliation
+scan (``MEDIA_INDEX_RECONCILE_INTERVAL`` seconds) picks up changes made
+outside the app.
+
+``media_url`` puts a content fingerprint in the file's URL (the ``/media``
+endpoint for local storage) so responses can be cached as immutable. Uploads
+are named after their content hash, so the fingerprint comes from the name;
+only files with legacy names are hashed, once, by a background thread.
+"""
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+from flask import current_app, g, url_for
+
+from utils.invalidation import get_generation, get_changes, bump_generation
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CHANNEL = 'media'
+MEDIA_ROOTS = ('uploads',)
+# Content-addressed names (and variants) start with the SHA-256 of the upload
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{64})\.')
+
+def _normalize(path):
+    return path.replace(os.sep, '/').lstrip('/') if path else ''
+
+def is_media_path(path):
+    """True if ``path`` is under a media root and can't climb out of it."""
+    path = _normalize(path)
+    parts = path.split('/')
+    return parts[0] in MEDIA_ROOTS and len(parts) > 1 and '..' not in parts
+
+class MediaIndex:
+    def __init__(self, storage, roots=MEDIA_ROOTS):
+        self.storage = storage
+        self.roots = roots
+        self._paths = frozenset()
+        self._versions = {}
+        self._generation = None
+        self._scanned_at = None
+        self._builder_pid = None
+        self._rescanning = False
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._fingerprint_queue = queue.Queue()
+        self._fingerprinter = None
+
+    @property
+    def ready(self):
+        return self._scanned_at is not None
+
+    def start(self, app=None):
+        """Build the index in a background thread, once per process.
+
+        Called again in a forked worker whose parent was still building.
+        """
+        app = app or current_app._get_current_object()
+        if self.ready or self._builder_pid == os.getpid():
+            return
+        with self._lock:
+            if self.ready or self._builder_pid == os.getpid():
+                return
+            self._builder_pid = os.getpid()
+        threading.Thread(target=self._build, args=(app,), name='media-index-builder', daemon=True).start()
+
+    def _build(self, app, retry_delay=5):
+        while True:
+            try:
+                with app.app_context():
+                    # Read before listing, so changes made during the walk
+                    # are applied after it
+                    generation = get_generation(MEDIA_CHANNEL)
+                count = self.scan(generation)
+                logger.info(f"Media index built with {count} files")
+                return
+            except Exception as e:
+                logger.error(f"Could not build the media index, retrying in {retry_delay}s: {str(e)}")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 300)
+
+    def _rescan(self, generation):
+        """Rescan in the background, serving the current index meanwhile."""
+        with self._lock:
+            if self._rescanning:
+                return
+            self._rescanning = True
+
+        def run():
+            try:
+                self.scan(generation)
+            except Exception as e:
+                logger.error(f"Media index rescan failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._rescanning = False
+
+        threading.Thread(target=run, name='media-index-rescan', daemon=True).start()
+
+    def scan(self, generation=None):
+        """Rebuild the index from the storage backend."""
+        paths = set()
+        for root in self.roots:
+            paths.update(stored.path for stored in self.storage.iter_files(root))
+        with self._lock:
+            self._paths = frozenset(paths)
+            if generation is not None:
+                # Changes were missed, so legacy files may have new content
+                self._versions = {}
+                self._generation = generation
+            else:
+                self._versions = {p: v for p, v in self._versions.items() if p in self._paths}
+            self._scanned_at = time.monotonic()
+        return len(paths)
+
+    def apply(self, change):
+        """Apply a change: the ``added`` and ``removed`` paths."""
+        added = {_normalize(path) for path in change.get('added', ())}
+        removed = {_normalize(path) for path in change.get('removed', ())}
+        with self._lock:
+            self._paths = (self._paths - removed) | added
+            for path in added | removed:
+                self._versions.pop(path, None)
+
+    def sync(self, generation):
+        """Apply changes other workers announced since the index was built."""
+        if self.ready and generation != self._generation:
+            since = self._generation
+            changes = get_changes(MEDIA_CHANNEL, since)
+            if changes is None:
+                current_app.logger.info("Media changes were missed, rescanning the media index")
+                self._rescan(generation)
+                return
+            for change in changes:
+                self.apply(change)
+            with self._lock:
+                if self._generation == since:
+                    self._generation = since + len(changes)
+
+    def exists(self, path):
+        """True or False, or None while the index is being built."""
+        if not self.ready:
+            return None
+        return _normalize(path) in self._paths
+
+    def version(self, path):
+        """Short content fingerprint of a known file, or None until computed.
+
+        Uploads are named after the SHA-256 of their content, and so are
+        their variants, so the name is the fingerprint. Files with legacy
+        names are hashed once by a background thread. Before the index is
+        ready, content names are trusted to exist.
+        """
+        path = _normalize(path)
+        match = _CONTENT_NAME.match(path.rpartition('/')[2])
+        if match and (not self.ready or path in self._paths):
+            return match.group(1)[:16]
+        if path not in self._paths:
+            return None
+        digest = self._versions.get(path)
+        if digest is None:
+            self._queue_fingerprint(path)
+        return digest
+
+    def _queue_fingerprint(self, path):
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+            if self._fingerprinter is None or not self._fingerprinter.is_alive():
+                self._fingerprinter = threading.Thread(
+                    target=self._fingerprint_files, name='media-index-fingerprinter', daemon=True)
+                self._fingerprinter.start()
+        self._fingerprint_queue.put(path)
+
+    def _fingerprint_files(self):
+        while True:
+            path = self._fingerprint_queue.get()
+            try:
+                digest = self.storage.fingerprint(path)[:16]
+                with self._lock:
+                    if path in self._paths:
+                        self._versions[path] = digest
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Could not fingerprint {path}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+
+    def add(self, *paths):
+        self.apply({'added': paths})
+
+    def discard(self, *paths):
+        self.apply({'removed': paths})
+
+    def __len__(self):
+        return len(self._paths)
+
+def _start_reconciler(app, index, interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                if index.ready:
+                    index.scan()
+            except Exception as e:
+                app.logger.error(f"Media index reconciliation failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name='media-index-reconciler', daemon=True)
+    thread.start()
+    return thread
+
+def init_app(app):
+    """Attach a media index to ``app``, start building it and start periodic
+    reconciliation if configured."""
+    index = MediaIndex(app.extensions['storage'])
+    app.extensions['media_index'] = index
+    index.start(app)
+    app.before_request(index.start)
+
+    interval = app.config.get('MEDIA_INDEX_RECONCILE_INTERVAL', 0)
+    if interval:
+        _start_reconciler(app, index, interval)
+    return index
+
+def _index():
+    index = current_app.extensions['media_index']
+    index.sync(get_generation(MEDIA_CHANNEL))
+    return index
+
+def _mark_incomplete():
+    # The page guessed at media the index doesn't know yet; don't cache it
+    g.page_incomplete = True
+
+def media_exists(path, default=None):
+    """Return True if ``path`` (relative to the static folder) is a known file.
+
+    While the index is being built the storage backend is asked instead, or
+    ``default`` is returned if given (rendering passes True rather than stat
+    every image on the page).
+    """
+    if not path or not is_media_path(path):
+        return False
+    found = _index().exists(path)
+    if found is None:
+        if default is not None:
+            _mark_incomplete()
+            return default
+        return current_app.extensions['storage'].exists(_normalize(path))
+    return found
+
+def media_version(path):
+    """Content hash of ``path`` for cache-busting URLs, or None if unknown."""
+    if not path:
+        return None
+    index = _index()
+    try:
+        version = index.version(path)
+    except FileNotFoundError:
+        return None
+    if version is None and not index.ready:
+        _mark_incomplete()
+    return version
+
+def media_url(path):
+    """Immutable, content-versioned URL of an uploaded file.
+
+    Files outside ``uploads/`` or missing from the index get a plain static
+    URL.
+    """
+    path = _normalize(path)
+    root = path.partition('/')[0]
+    version = media_version(path) if root in MEDIA_ROOTS else None
+    if version is None:
+        return url_for('static', filename=path)
+    return current_app.extensions['storage'].url(path, version)
+
+def register_media(*paths):
+    """Record files saved to storage and announce them to other workers."""
+    paths = [_normalize(path) for path in paths]
+    current_app.extensions['media_index'].add(*paths)
+    bump_generation(MEDIA_CHANNEL, {'added': paths})
+
+def unregister_media(*paths):
+    """Record files removed from storage and announce it to other workers."""
+    paths = [_normalize(path) for path in paths]
+    current_app.extensions['media_index'].discard(*paths)
+    bump_generation(MEDIA_CHANNEL, {'removed': paths})
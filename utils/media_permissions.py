@@ -0,0 +1,83 @@
+"""Permission repair for locally stored uploads.
+
+Startup used to chmod every upload. That is now ``flask media
+fix-permissions``, which sets files to 0644 and their directories to 0755.
+Like ``flask media gc`` it walks the tree in path order in batches and
+prints a cursor after each one, so an interrupted run can continue with
+``--cursor``. Only entries with the wrong mode are changed.
+"""
+import os
+import stat
+import time
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from utils.media_gc import MEDIA_GC_ROOT, media_cli
+from utils.storage import LocalStorage, get_storage
+
+FILE_MODE = 0o644
+DIRECTORY_MODE = 0o755
+
+def _ensure_mode(path, mode, dry_run):
+    current = stat.S_IMODE(os.stat(path).st_mode)
+    if current == mode:
+        return False
+    if not dry_run:
+        os.chmod(path, mode)
+    return True
+
+def fix_permissions_batch(cursor=None, batch_size=500, dry_run=False, seen_dirs=None):
+    """Fix the next batch of files after ``cursor`` and the directories above them.
+
+    Returns ``(changed paths, next cursor)``; the cursor is None at the end.
+    """
+    storage = get_storage()
+    seen_dirs = set() if seen_dirs is None else seen_dirs
+    files = list(islice(storage.iter_files(MEDIA_GC_ROOT, cursor), batch_size))
+    changed = []
+    for stored in files:
+        directory = os.path.dirname(stored.path)
+        while directory and directory not in seen_dirs:
+            seen_dirs.add(directory)
+            if _ensure_mode(os.path.join(storage.root, directory), DIRECTORY_MODE, dry_run):
+                changed.append(directory + '/')
+            directory = os.path.dirname(directory)
+        try:
+            if _ensure_mode(os.path.join(storage.root, stored.path), FILE_MODE, dry_run):
+                changed.append(stored.path)
+        except FileNotFoundError:
+            # Deleted since it was listed
+            pass
+    return changed, files[-1].path if len(files) == batch_size else None
+
+@click.command('fix-permissions')
+@click.option('--dry-run', is_flag=True, help='List entries with the wrong mode without changing them.')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Files per batch.')
+@click.option('--cursor', help='Resume after this path, as printed by an interrupted run.')
+@click.option('--pause', type=float, default=0, show_default=True, help='Seconds to wait between batches.')
+@with_appcontext
+def fix_permissions_command(dry_run, batch_size, cursor, pause):
+    """Set uploaded files to 0644 and their directories to 0755."""
+    if not isinstance(get_storage(), LocalStorage):
+        raise click.ClickException("Permissions only apply to the local storage backend")
+
+    seen_dirs = set()
+    total = 0
+    while True:
+        changed, cursor = fix_permissions_batch(cursor, batch_size, dry_run, seen_dirs)
+        total += len(changed)
+        for path in changed:
+            click.echo(f"{'Would fix' if dry_run else 'Fixed'} {path}")
+        if cursor is None:
+            break
+        click.echo(f"Checked up to {cursor}")
+        if pause:
+            time.sleep(pause)
+    click.echo(f"{'Would fix' if dry_run else 'Fixed'} {total} entr{'y' if total == 1 else 'ies'}")
+    current_app.logger.info(f"Media permissions: {total} entries {'to fix' if dry_run else 'fixed'}")
+
+def init_app(app):
+    media_cli.add_command(fix_permissions_command)
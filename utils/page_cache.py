@@ -0,0 +1,305 @@
+"""Full-page response cache for the public site.
+
+Public pages only change when an admin edits the data they are built from,
+so anonymous GET responses are cached by path and the query arguments the
+view reads (its ``args`` allow-list; anything else in the query string is
+ignored, so random arguments can't fill the cache). Each cached view
+declares the invalidation channels it depends on; an entry is stamped with
+the versions of those channels when it is rendered and is served only while
+they are unchanged. Versions are globally unique tokens (see
+:mod:`utils.invalidation`), so an entry shared through the disk cache can't
+be mistaken for another worker's render of different data. Admin write paths
+bump the channel they touched (see :func:`invalidate_pages`), which
+invalidates exactly the pages that depend on it in every worker.
+
+Backends, chosen with ``PAGE_CACHE_BACKEND``:
+
+- ``memory`` (default): a per-process LRU of ``PAGE_CACHE_MAX_ENTRIES``.
+- ``disk``: the memory LRU in front of a directory shared by all workers
+  (``PAGE_CACHE_DIR``), so a page rendered by one worker serves all of them.
+  Writing an entry deletes the key's entries from older versions, and the
+  oldest keys are evicted beyond ``PAGE_CACHE_DISK_MAX_ENTRIES``.
+- ``null``: caching disabled.
+
+:func:`conditional_page` uses the same channel versions to answer
+conditional GETs: the ETag is derived from the version tokens and
+``Last-Modified`` from when the channels last changed, so a ``304 Not
+Modified`` costs no query and no rendering.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from utils.invalidation import get_version, bump_generation
+
+EVENTS_CHANNEL = 'events'
+CATEGORIES_CHANNEL = 'categories'
+TESTIMONIALS_CHANNEL = 'testimonials'
+
+# Response headers that belong to a single client or are recomputed on send
+UNCACHED_HEADERS = {'set-cookie', 'content-length', 'date'}
+
+class MemoryPageCache:
+    """Thread-safe LRU of rendered pages."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        """Return the entry for ``key`` if it was built under ``versions``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['versions'] != versions:
+                # Stale for good; free the slot
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class DiskPageCache:
+    """Rendered pages stored as files, shared by every worker on the host.
+
+    Each key has a directory holding one file per version stamp, so a
+    lookup never reads a stale entry and writing a fresh one removes the
+    stale ones. Every ``max_entries // 10`` writes a worker counts the keys
+    and evicts the least recently written beyond ``max_entries``.
+    """
+
+    def __init__(self, directory, memory=None, max_entries=4096):
+        self.directory = directory
+        self.memory = memory or MemoryPageCache()
+        self.max_entries = max_entries
+        self._writes = 0
+        self._prune_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _key_dir(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _stamp(self, versions):
+        return hashlib.sha256(repr(versions).encode('utf-8')).hexdigest()[:16] + '.page'
+
+    def get(self, key, versions):
+        entry = self.memory.get(key, versions)
+        if entry is not None:
+            return entry
+        try:
+            with open(os.path.join(self._key_dir(key), self._stamp(versions)), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self.memory.set(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self.memory.set(key, entry)
+        directory = self._key_dir(key)
+        name = self._stamp(entry['versions'])
+        path = os.path.join(directory, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            # Entries from older versions can never be served again
+            for other in os.listdir(directory):
+                if other != name and other.endswith('.page'):
+                    os.remove(os.path.join(directory, other))
+        except OSError as e:
+            current_app.logger.warning(f"Could not write page cache entry {path}: {str(e)}")
+            return
+        self._writes += 1
+        if self._writes >= max(1, self.max_entries // 10):
+            self._writes = 0
+            self.prune()
+
+    def prune(self):
+        """Evict the least recently written keys beyond ``max_entries``."""
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            with os.scandir(self.directory) as it:
+                keys = [entry for entry in it if entry.is_dir(follow_symlinks=False)]
+            if len(keys) <= self.max_entries:
+                return
+            keys.sort(key=lambda entry: entry.stat(follow_symlinks=False).st_mtime)
+            for entry in keys[:len(keys) - self.max_entries]:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError as e:
+            current_app.logger.warning(f"Could not prune page cache {self.directory}: {str(e)}")
+        finally:
+            self._prune_lock.release()
+
+    def clear(self):
+        self.memory.clear()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                elif entry.name.endswith('.page'):
+                    os.remove(entry.path)
+
+def create_cache(app):
+    """Build the page cache selected by ``PAGE_CACHE_BACKEND``."""
+    kind = app.config.get('PAGE_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('PAGE_CACHE_MAX_ENTRIES', 256)
+    if kind == 'null':
+        return None
+    if kind == 'memory':
+        return MemoryPageCache(max_entries)
+    if kind == 'disk':
+        directory = app.config.get('PAGE_CACHE_DIR') or os.path.join(app.instance_path, 'page_cache')
+        return DiskPageCache(directory, MemoryPageCache(max_entries),
+                             app.config.get('PAGE_CACHE_DISK_MAX_ENTRIES', 4096))
+    raise ValueError(f"Unknown page cache backend: {kind}")
+
+def _templates_fingerprint(app):
+    """Hash template mtimes, so deploying new templates changes every ETag."""
+    digest = hashlib.sha256()
+    for dirpath, _, filenames in os.walk(os.path.join(app.root_path, app.template_folder)):
+        for name in sorted(filenames):
+            digest.update(f"{name}:{os.stat(os.path.join(dirpath, name)).st_mtime_ns}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def init_app(app):
+    """Attach the configured page cache to the app."""
+    cache = create_cache(app)
+    app.extensions['page_cache'] = cache
+    if not app.config.get('CONTENT_ETAG_SALT'):
+        app.config['CONTENT_ETAG_SALT'] = _templates_fingerprint(app)
+    app.logger.info(f"Page cache backend: {type(cache).__name__ if cache else 'disabled'}")
+    return cache
+
+def _cache_key(allowed=None):
+    """Path plus the query arguments in ``allowed`` (all of them if None)."""
+    args = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True))
+                    if allowed is None or k in allowed)
+    return f"{request.path}?{args}"
+
+def _is_cacheable_request():
+    # Pages show admin controls to logged in users and flashed messages once
+    return (
+        request.method in ('GET', 'HEAD')
+        and not current_user.is_authenticated
+        and '_flashes' not in session
+    )
+
+def _is_cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.direct_passthrough
+        and 'Set-Cookie' not in response.headers
+        # Rendered while the media index was still being built
+        and not g.get('page_incomplete')
+    )
+
+def cached_page(*channels, args=()):
+    """Cache a view's anonymous responses until one of ``channels`` changes.
+
+    ``args`` names the query arguments the view reads; the rest of the query
+    string is left out of the cache key.
+    """
+    allowed = frozenset(args)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('page_cache')
+            if cache is None or not _is_cacheable_request():
+                g.page_cache = 'bypass'
+                return view(*args, **kwargs)
+
+            key = _cache_key(allowed)
+            # Read versions before rendering so a change made mid-render
+            # leaves the entry stale rather than wrongly fresh.
+            versions = tuple(get_version(channel).token for channel in channels)
+            entry = cache.get(key, versions)
+            if entry is not None:
+                g.page_cache = 'hit'
+                return current_app.response_class(
+                    entry['body'], status=entry['status'], headers=entry['headers'])
+
+            g.page_cache = 'miss'
+            response = make_response(view(*args, **kwargs))
+            if _is_cacheable_response(response):
+                cache.set(key, {
+                    'versions': versions,
+                    'status': response.status_code,
+                    'headers': [(k, v) for k, v in response.headers.items()
+                                if k.lower() not in UNCACHED_HEADERS],
+                    'body': response.get_data(),
+                })
+            return response
+        wrapper.cache_channels = channels
+        wrapper.cache_args = allowed
+        return wrapper
+    return decorator
+
+def conditional_page(*channels):
+    """Answer conditional GETs for a view from the versions of ``channels``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flashed messages are shown once, so those pages are never
+            # "unchanged"
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            versions = [get_version(channel) for channel in channels]
+            last_modified = max(version.modified for version in versions)
+            # Logged in users see admin controls, so their pages version
+            # separately
+            fingerprint = '|'.join([
+                current_app.config['CONTENT_ETAG_SALT'],
+                _cache_key(),
+                current_user.get_id() or 'anonymous',
+                ','.join(version.token for version in versions),
+            ])
+            etag = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:32]
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                g.conditional_get = 'not_modified'
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.get('page_incomplete'):
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if current_user.is_authenticated:
+                response.cache_control.private = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+def invalidate_pages(*channels):
+    """Invalidate pages built from ``channels``; call after committing."""
+    for channel in channels:
+        bump_generation(channel)
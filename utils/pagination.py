@@ -0,0 +1,150 @@
+"""Keyset (seek) pagination and cheap row-count estimates.
+
+Offset pagination makes the database walk and discard every row before the
+page, so deep pages get slower as the table grows. Keyset pagination instead
+filters on the sort key of the last row already shown: each page costs an
+index seek plus ``per_page`` rows whatever its position. Cursors are opaque
+tokens holding those sort values, so a page stays stable while rows are
+added or deleted elsewhere.
+
+A listing declares its ordering as a sequence of :class:`SortKey`; the last
+key must be unique (usually the primary key). Nullable keys always sort
+their NULLs last, on every database, so the cursor comparison is the same
+everywhere.
+
+:func:`estimate_count` answers "how many rows" without a full count on every
+request: PostgreSQL's planner estimate is used where available, otherwise an
+exact count cached until the given invalidation channel changes.
+"""
+import base64
+import binascii
+import json
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, and_, cast, false, literal, or_, text
+
+from extensions import db
+from utils.invalidation import get_generation
+
+class InvalidCursor(ValueError):
+    pass
+
+class SortKey(namedtuple('SortKey', 'column value descending nullable')):
+    """One ordering column and how to read its value from a result row.
+
+    ``value`` is a callable taking a row (an ORM instance) and returning the
+    column's value for it.
+    """
+
+    def __new__(cls, column, value, descending=False, nullable=False):
+        return super().__new__(cls, column, value, descending, nullable)
+
+    def order_by(self):
+        clause = self.column.desc() if self.descending else self.column.asc()
+        return clause.nullslast() if self.nullable else clause
+
+    def bind(self, value):
+        """``value`` as a parameter of the column's type.
+
+        Floats are cast: a REAL column compared with a double-precision
+        parameter never equals the value it was read from.
+        """
+        if isinstance(self.column.type, Float):
+            return cast(value, self.column.type)
+        return literal(value, self.column.type)
+
+    def equals(self, value):
+        return self.column.is_(None) if value is None else self.column == self.bind(value)
+
+    def after(self, value):
+        """Rows that sort strictly after ``value`` on this key alone."""
+        if value is None:
+            # NULLs sort last, so nothing follows them
+            return false()
+        value = self.bind(value)
+        clause = self.column < value if self.descending else self.column > value
+        return or_(clause, self.column.is_(None)) if self.nullable else clause
+
+Page = namedtuple('Page', 'items next_cursor')
+
+def encode_cursor(keys, row):
+    """Return the opaque cursor pointing just after ``row``."""
+    values = []
+    for key in keys:
+        value = key.value(row)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(keys, cursor):
+    """Return the sort values stored in ``cursor``; raises InvalidCursor."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor(f"Malformed cursor: {str(e)}")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor("Cursor does not match this listing")
+    decoded = []
+    for key, value in zip(keys, values):
+        if value is not None and isinstance(key.column.type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise InvalidCursor(f"Malformed cursor value: {value!r}")
+        elif value is not None and not isinstance(value, (str, int, float)):
+            raise InvalidCursor(f"Malformed cursor value: {value!r}")
+        decoded.append(value)
+    return decoded
+
+def seek_after(keys, values):
+    """Filter for rows after ``values`` in the lexicographic order of ``keys``."""
+    clauses = []
+    for i, key in enumerate(keys):
+        prefix = [keys[j].equals(values[j]) for j in range(i)]
+        clauses.append(and_(*prefix, key.after(values[i])))
+    return or_(*clauses)
+
+def keyset_page(query, keys, cursor=None, per_page=50):
+    """Return the page of ``query`` that follows ``cursor`` (the first page if None).
+
+    ``query`` must not be ordered yet; the ordering comes from ``keys``.
+    """
+    if cursor:
+        query = query.filter(seek_after(keys, decode_cursor(keys, cursor)))
+    rows = query.order_by(*(key.order_by() for key in keys)).limit(per_page + 1).all()
+    if len(rows) > per_page:
+        return Page(rows[:per_page], encode_cursor(keys, rows[per_page - 1]))
+    return Page(rows, None)
+
+# (key, generation) -> count, for databases without planner estimates
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+def _planner_estimate(query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    plan = db.session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def estimate_count(query, key, channel):
+    """Return (count, exact) for ``query``.
+
+    On PostgreSQL this is the planner's row estimate, which costs the same
+    for any table size. Elsewhere it is an exact count, cached under ``key``
+    until ``channel`` is bumped.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return _planner_estimate(query.order_by(None)), False
+
+    generation = get_generation(channel)
+    cached = _count_cache.get(key)
+    if cached and cached[0] == generation:
+        return cached[1], True
+    count = query.order_by(None).count()
+    with _count_cache_lock:
+        _count_cache[key] = (generation, count)
+    return count, True
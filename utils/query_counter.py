@@ -0,0 +1,69 @@
+"""Per-request SQL statement counting and query budgets.
+
+Every statement executed inside an app context is counted on ``g``. Views
+decorated with :func:`query_budget` declare how many statements a request may
+issue; a request over budget is logged, and raises when
+``QUERY_BUDGET_STRICT`` is set (it defaults to on under ``TESTING``), so an
+N+1 regression fails loudly instead of slowing pages down as data grows.
+"""
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_app_context, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def get_query_count():
+    """Return the number of statements issued so far in this app context."""
+    return g.get('query_count', 0)
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a view may issue."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+def _check_budget(response):
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        return response
+
+    count = get_query_count()
+    if count > budget:
+        message = f"{request.endpoint} issued {count} queries (budget {budget})"
+        current_app.logger.warning(message)
+        if current_app.config.get('QUERY_BUDGET_STRICT', current_app.testing):
+            raise QueryBudgetExceeded(message)
+    return response
+
+@contextmanager
+def count_queries():
+    """Count statements issued inside the block, e.g. ``with count_queries() as c: ...; c['count']``."""
+    counter = {'count': 0}
+
+    def listener(*args):
+        counter['count'] += 1
+
+    event.listen(Engine, 'before_cursor_execute', listener)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, 'before_cursor_execute', listener)
+
+def init_app(app):
+    """Start counting statements and enforce view query budgets."""
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+    app.after_request(_check_budget)
@@ -0,0 +1,59 @@
+"""Structured, sampled request logging.
+
+Emits one JSON record per request on the ``request`` logger with the route,
+status, timing, SQL statement count and page cache outcome. Records are
+sampled with ``REQUEST_LOG_SAMPLE_RATE`` (0.0-1.0); server errors and
+requests slower than ``REQUEST_LOG_SLOW_MS`` are always logged. The record
+level is ``REQUEST_LOG_LEVEL``.
+"""
+import json
+import logging
+import random
+import time
+
+from flask import g, request, current_app
+
+from utils.query_counter import get_query_count
+
+logger = logging.getLogger('request')
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+def _should_log(status, duration_ms):
+    config = current_app.config
+    if status >= 500 or duration_ms >= config.get('REQUEST_LOG_SLOW_MS', 1000):
+        return True
+    rate = config.get('REQUEST_LOG_SAMPLE_RATE', 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+def _log_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+
+    duration_ms = (time.perf_counter() - started) * 1000
+    if not _should_log(response.status_code, duration_ms):
+        return response
+
+    record = {
+        'method': request.method,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'endpoint': request.endpoint,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 2),
+        'queries': get_query_count(),
+        'cache': g.get('page_cache'),
+        'conditional': g.get('conditional_get'),
+    }
+    level = logging.getLevelName(current_app.config.get('REQUEST_LOG_LEVEL', 'INFO'))
+    logger.log(level, json.dumps(record, separators=(',', ':')))
+    return response
+
+def init_app(app):
+    """Log one structured record per request if ``REQUEST_LOG_ENABLED``."""
+    if not app.config.get('REQUEST_LOG_ENABLED', True):
+        return
+    app.before_request(_start_timer)
+    app.after_request(_log_request)
@@ -0,0 +1,295 @@
+"""Storage backends for uploaded media.
+
+Every upload path (``uploads/images/...``) is a key in the configured
+backend, chosen by ``STORAGE_BACKEND``:
+
+- ``local`` (default): files under the static folder, served by the
+  ``/media`` endpoint.
+- ``s3``: an S3-compatible bucket, so several app nodes can share media and
+  reads are served by the store or a CDN rather than the web tier. Requires
+  ``boto3`` (the ``s3`` extra). ``STORAGE_S3_ENDPOINT_URL`` points it at a
+  non-AWS store (MinIO, ``moto_server`` or another local stand-in).
+  ``STORAGE_S3_PUBLIC_URL`` is the public base URL of the bucket, defaulting
+  to ``<endpoint>/<bucket>``. Credentials come from the usual AWS
+  environment variables.
+
+Only the S3 backend supports direct uploads. The browser PUTs the file to a
+presigned URL for its content-addressed key, so the bytes never pass through
+a Flask worker. The URL signs the size and SHA-256 of the content, so the
+store rejects anything else. The bucket needs a CORS rule that allows PUT
+from the site's origin.
+
+Media processing jobs work on local files: ``local_copy`` yields a path to
+read from, and ``save`` publishes a finished temp file.
+"""
+import base64
+import errno
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import timezone
+
+from flask import current_app, redirect, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+BUFFER_SIZE = 64 * 1024
+
+StoredFile = namedtuple('StoredFile', 'path size mtime')
+
+class StorageError(RuntimeError):
+    pass
+
+def _content_type(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+class LocalStorage:
+    """Media stored under a directory on this node (the static folder)."""
+
+    supports_direct_upload = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, path):
+        # Paths can come from URLs; never resolve outside the root
+        resolved = safe_join(self.root, path)
+        if resolved is None:
+            raise StorageError(f"Unsafe storage path: {path}")
+        return resolved
+
+    def exists(self, path):
+        try:
+            return os.path.isfile(self._path(path))
+        except StorageError:
+            return False
+
+    def staging_dir(self, path):
+        """Directory for temp files that will be saved to ``path``."""
+        directory = os.path.dirname(self._path(path))
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def save(self, tmp_path, path):
+        """Atomically move the finished file ``tmp_path`` to ``path``."""
+        destination = self._path(path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.chmod(tmp_path, 0o644)
+        try:
+            os.replace(tmp_path, destination)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        # Temp file on another filesystem: stage next to the destination
+        fd, staged = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(tmp_path, 'rb') as src:
+                shutil.copyfileobj(src, out, BUFFER_SIZE)
+                out.flush()
+                os.fsync(out.fileno())
+            os.chmod(staged, 0o644)
+            os.replace(staged, destination)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        os.remove(tmp_path)
+
+    def delete(self, path):
+        try:
+            os.remove(self._path(path))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, path):
+        os.utime(self._path(path))
+
+    def mtime(self, path):
+        """Unix time the file was last written or touched."""
+        return os.path.getmtime(self._path(path))
+
+    @contextmanager
+    def local_copy(self, path):
+        yield self._path(path)
+
+    def fingerprint(self, path):
+        """SHA-256 of the file's content."""
+        hasher = hashlib.sha256()
+        with open(self._path(path), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def iter_files(self, prefix, after=None):
+        """``StoredFile`` for each file under ``prefix``, in path order, after ``after``."""
+        return self._walk(self._path(prefix), prefix.rstrip('/'), after)
+
+    def _walk(self, directory, relative, after):
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            return
+        # Sort directories as "name/" so the walk order matches string order
+        entries.sort(key=lambda e: e.name + '/' if e.is_dir(follow_symlinks=False) else e.name)
+        for entry in entries:
+            path = f"{relative}/{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                prefix = path + '/'
+                if after is None or prefix > after or after.startswith(prefix):
+                    yield from self._walk(entry.path, path, after)
+            elif entry.is_file(follow_symlinks=False) and (after is None or path > after):
+                st = entry.stat(follow_symlinks=False)
+                yield StoredFile(path, st.st_size, st.st_mtime)
+
+    def url(self, path, version):
+        _, _, filename = path.partition('/')
+        return url_for('media', version=version, filename=filename)
+
+    def send(self, path, version, max_age):
+        # conditional=True answers Range requests with 206 and If-None-Match
+        # with 304; the body goes through wsgi.file_wrapper (sendfile) or, with
+        # USE_X_SENDFILE, is left to the front-end server
+        directory, filename = os.path.split(self._path(path))
+        return send_from_directory(directory, filename, conditional=True, etag=version, max_age=max_age)
+
+class S3Storage:
+    """Media stored in an S3-compatible bucket."""
+
+    supports_direct_upload = True
+
+    def __init__(self, bucket, endpoint_url=None, region=None, public_url=None, presign_ttl=3600):
+        try:
+            import boto3
+        except ImportError:
+            raise StorageError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.public_url = (public_url or f"{self.client.meta.endpoint_url}/{bucket}").rstrip('/')
+        self.presign_ttl = presign_ttl
+
+    def _missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def _head(self, path):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=path)
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def exists(self, path):
+        return self._head(path) is not None
+
+    def staging_dir(self, path):
+        return None
+
+    def save(self, tmp_path, path):
+        content_type = _content_type(path)
+        self.client.upload_file(tmp_path, self.bucket, path, ExtraArgs={
+            'ContentType': content_type,
+            'CacheControl': 'public, max-age=31536000, immutable',
+        })
+        os.remove(tmp_path)
+
+    def delete(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=path)
+
+    def touch(self, path):
+        # Copying an object onto itself refreshes LastModified
+        self.client.copy_object(Bucket=self.bucket, Key=path, CopySource={'Bucket': self.bucket, 'Key': path},
+                                MetadataDirective='REPLACE', ContentType=_content_type(path),
+                                CacheControl='public, max-age=31536000, immutable')
+
+    def mtime(self, path):
+        head = self._head(path)
+        if head is None:
+            raise FileNotFoundError(path)
+        return head['LastModified'].astimezone(timezone.utc).timestamp()
+
+    @contextmanager
+    def local_copy(self, path):
+        fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, path, tmp_path)
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+    def fingerprint(self, path):
+        """The object's ETag, which changes whenever its content does."""
+        head = self._head(path)
+        if head is None:
+            raise FileNotFoundError(path)
+        return head['ETag'].strip('"').replace('-', '')
+
+    def iter_files(self, prefix, after=None):
+        paginator = self.client.get_paginator('list_objects_v2')
+        options = {'Bucket': self.bucket, 'Prefix': prefix.rstrip('/') + '/'}
+        if after:
+            options['StartAfter'] = after
+        # Keys are listed in byte order, like the local walk
+        for page in paginator.paginate(**options):
+            for item in page.get('Contents', []):
+                modified = item['LastModified'].astimezone(timezone.utc).timestamp()
+                yield StoredFile(item['Key'], item['Size'], modified)
+
+    def url(self, path, version):
+        return f"{self.public_url}/{path}?v={version}"
+
+    def send(self, path, version, max_age):
+        return redirect(self.url(path, version))
+
+    def presign_upload(self, path, size, digest):
+        """URL and headers for a browser PUT of ``size`` bytes with SHA-256 ``digest``."""
+        checksum = base64.b64encode(bytes.fromhex(digest)).decode()
+        params = {
+            'Bucket': self.bucket,
+            'Key': path,
+            'ContentLength': size,
+            'ContentType': _content_type(path),
+            'CacheControl': 'public, max-age=31536000, immutable',
+            'ChecksumSHA256': checksum,
+        }
+        url = self.client.generate_presigned_url('put_object', Params=params, ExpiresIn=self.presign_ttl)
+        return {
+            'url': url,
+            'method': 'PUT',
+            'headers': {
+                'Content-Type': params['ContentType'],
+                'Cache-Control': params['CacheControl'],
+                'x-amz-checksum-sha256': checksum,
+            },
+        }
+
+def create_storage(app):
+    backend = app.config['STORAGE_BACKEND']
+    if backend == 'local':
+        return LocalStorage(app.static_folder)
+    if backend == 's3':
+        if not app.config.get('STORAGE_S3_BUCKET'):
+            raise StorageError("STORAGE_S3_BUCKET is required for the s3 storage backend")
+        return S3Storage(app.config['STORAGE_S3_BUCKET'],
+                         endpoint_url=app.config.get('STORAGE_S3_ENDPOINT_URL'),
+                         region=app.config.get('STORAGE_S3_REGION'),
+                         public_url=app.config.get('STORAGE_S3_PUBLIC_URL'),
+                         presign_ttl=app.config['STORAGE_S3_PRESIGN_TTL'])
+    raise StorageError(f"Unknown storage backend: {backend}")
+
+def get_storage():
+    return current_app.extensions['storage']
+
+def init_app(app):
+    app.config.setdefault('STORAGE_BACKEND', 'local')
+    app.config.setdefault('STORAGE_S3_PRESIGN_TTL', 3600)
+    storage = create_storage(app)
+    app.extensions['storage'] = storage
+    app.logger.info(f"Media storage backend: {type(storage).__name__}")
+    return storage
@@ -1,8 +1,12 @@
+import hashlib
+import threading
+from collections import namedtuple
 from datetime import datetime
-from flask import current_app
+from flask import current_app, url_for
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text
 from extensions import db
+from utils.invalidation import get_generation, bump_generation
 from models import Theme, ThemeColors
 
 def get_active_theme():
@@ -22,65 +26,106 @@ def get_active_theme():
         current_app.logger.error(f"Unexpected error getting active theme: {str(e)}")
         return None
 
+# Process-local cache of the active theme, stamped with the theme generation
+# it was loaded under. Admin edits bump the generation through the configured
+# invalidation backend, so a render only has to compare two integers instead
+# of reloading the theme from the database. The snapshot is immutable and
+# replaced as a whole, so readers never pair one theme's stylesheet with
+# another's version.
+THEME_CHANNEL = 'theme'
+ThemeSnapshot = namedtuple('ThemeSnapshot', 'generation theme colors stylesheet stylesheet_version loaded_at')
+_theme_snapshot = None
+_theme_cache_lock = threading.Lock()
+
+def get_theme_generation():
+    """Return the current theme generation counter."""
+    return get_generation(THEME_CHANNEL)
+
+def bump_theme_generation():
+    """Invalidate the cached theme in every worker; call after committing any theme change."""
+    generation = bump_generation(THEME_CHANNEL)
+    current_app.logger.info(f"Theme generation bumped to {generation}")
+    return generation
+
+def _load_theme_snapshot():
+    """Load the active theme and its colors as plain values."""
+    active_theme = get_active_theme()
+    if not active_theme:
+        current_app.logger.error("No active theme found in database")
+        raise ValueError("No active theme found")
+    if not active_theme.colors:
+        current_app.logger.error(f"No colors found for active theme {active_theme.name}")
+        raise ValueError(f"No colors found for theme {active_theme.name}")
+
+    theme = {
+        'id': active_theme.id,
+        'name': active_theme.name,
+        'slug': active_theme.slug,
+        'is_custom': active_theme.is_custom,
+    }
+    colors = {
+        'primary': active_theme.colors.primary_color,
+        'secondary': active_theme.colors.secondary_color,
+        'accent': active_theme.colors.accent_color
+    }
+    return theme, colors
+
+def _build_stylesheet(colors):
+    """Render the theme stylesheet and return it with its content hash."""
+    css = current_app.jinja_env.get_template('theme.css').render(colors=colors)
+    return css, hashlib.sha256(css.encode('utf-8')).hexdigest()[:16]
+
+def _get_theme_snapshot():
+    """Return the ``ThemeSnapshot`` of the active theme, reloading only on a generation change."""
+    global _theme_snapshot
+    generation = get_theme_generation()
+    snapshot = _theme_snapshot
+    if snapshot is not None and snapshot.generation == generation:
+        return snapshot
+
+    with _theme_cache_lock:
+        # Another thread may have reloaded while we waited for the lock
+        snapshot = _theme_snapshot
+        if snapshot is not None and snapshot.generation == generation:
+            return snapshot
+
+        theme, colors = _load_theme_snapshot()
+        stylesheet, stylesheet_version = _build_stylesheet(colors)
+        snapshot = ThemeSnapshot(generation, theme, colors, stylesheet, stylesheet_version, datetime.now())
+        _theme_snapshot = snapshot
+        current_app.logger.info(f"Loaded theme colors for {theme['name']} (generation {generation}): {colors}")
+        return snapshot
+
+def get_cached_theme():
+    """Return (theme, colors) for the active theme, reloading only on a generation change."""
+    snapshot = _get_theme_snapshot()
+    return snapshot.theme, snapshot.colors
+
 def get_theme_colors():
-    """Get colors for the active theme with real-time updates."""
+    """Get colors for the active theme from the generation-stamped cache."""
     try:
-        # Force a fresh database query to get the latest theme colors
-        db.session.expire_all()
-        active_theme = get_active_theme()
-        
-        if active_theme and active_theme.colors:
-            theme_colors = {
-                'primary': active_theme.colors.primary_color,
-                'secondary': active_theme.colors.secondary_color,
-                'accent': active_theme.colors.accent_color
-            }
-            current_app.logger.info(f"Retrieved theme colors for {active_theme.name}: {theme_colors}")
-            return theme_colors
-            
-        current_app.logger.warning("No active theme found, check database")
-        raise ValueError("No active theme found")
+        _, colors = get_cached_theme()
+        return dict(colors)
     except Exception as e:
         current_app.logger.error(f"Error getting theme colors: {str(e)}")
         raise
 
+def get_theme_stylesheet():
+    """Return (css, version) for the active theme's precompiled stylesheet."""
+    snapshot = _get_theme_snapshot()
+    return snapshot.stylesheet, snapshot.stylesheet_version
+
 def inject_theme():
-    """Context processor to inject theme data into templates with real-time updates."""
+    """Context processor to inject theme data into templates."""
     try:
-        # Clear any cached theme data
-        db.session.expire_all()
-        
-        # Get active theme and colors
-        active_theme = get_active_theme()
-        if not active_theme:
-            current_app.logger.error("No active theme found in database")
-            raise ValueError("No active theme found")
-            
-        # Get theme colors
-        if not active_theme.colors:
-            current_app.logger.error(f"No colors found for active theme {active_theme.name}")
-            raise ValueError(f"No colors found for theme {active_theme.name}")
-            
-        # Log the actual color values
-        current_app.logger.info(f"""
-            Injecting theme colors for {active_theme.name}:
-            Primary: {active_theme.colors.primary_color}
-            Secondary: {active_theme.colors.secondary_color}
-            Accent: {active_theme.colors.accent_color}
-        """)
-        
-        colors = {
-            'primary': active_theme.colors.primary_color,
-            'secondary': active_theme.colors.secondary_color,
-            'accent': active_theme.colors.accent_color
-        }
-        
+        snapshot = _get_theme_snapshot()
         return {
-            'active_theme': active_theme,
-            'theme_colors': colors,
-            'theme_updated_at': datetime.now().isoformat()
+            'active_theme': snapshot.theme,
+            'theme_colors': dict(snapshot.colors),
+            'theme_stylesheet_url': url_for('theme_stylesheet', version=snapshot.stylesheet_version),
+            'theme_updated_at': snapshot.loaded_at.isoformat()
         }
-        
+
     except Exception as e:
         current_app.logger.error(f"Critical error in theme injection: {str(e)}")
         raise  # Let the error propagate so we can see it in the logs
@@ -105,6 +150,7 @@ def initialize_default_themes():
                         {"theme_id": first_theme.id}
                     )
                     db.session.commit()
+                    bump_theme_generation()
                     current_app.logger.info(f"Successfully activated theme: {first_theme.name}")
                 except Exception as e:
                     current_app.logger.error(f"Error activating initial theme: {str(e)}")
@@ -147,6 +193,7 @@ def initialize_default_themes():
         current_app.logger.info("Added dark theme")
 
         db.session.commit()
+        bump_theme_generation()
         current_app.logger.info("Default themes initialized successfully")
         
     except SQLAlchemyError as e:
@@ -0,0 +1,384 @@
+"""Streaming, resumable, content-addressed uploads for event images and videos.
+
+Uploads are copied in small blocks into a temporary file and moved into the
+storage backend (see ``utils.storage``) once complete. A worker never holds a whole
+file in memory, and readers never see a partial file. Size limits are
+enforced while the bytes arrive.
+
+Files are stored by the SHA-256 of their content, e.g.
+``uploads/images/3f/3fa2...c1.jpg``. Uploading the same bytes twice reuses
+the stored file, and different files can't overwrite each other. A stored
+file is shared by every event that points at it. ``release_event_media``
+deletes it, together with its variants, only when no event references it
+any more and it wasn't stored or reused within ``MEDIA_GC_GRACE_PERIOD``
+(a concurrent upload of the same bytes may not have committed yet); the
+media GC collects those later.
+
+Large files can be sent as a resumable session:
+
+1. ``POST /admin/uploads`` with ``{"kind", "filename", "size"}`` opens a session.
+2. ``PUT /admin/uploads/<id>`` with a ``Content-Range`` header appends a chunk
+   at the current offset. The chunk that completes the file moves it into place.
+3. ``GET /admin/uploads/<id>`` returns the offset to resume from.
+
+The form path hashes blocks as it copies them. A chunked session is hashed
+when its last chunk arrives, because the chunks may reach different workers.
+
+With a backend that supports direct uploads, ``POST /admin/uploads`` with
+``{"kind", "filename", "size", "sha256"}`` instead returns a presigned
+request. The browser sends the file straight to the store and the form
+submits the returned path.
+
+Session state lives on disk under ``UPLOAD_SESSION_DIR`` so any worker can
+continue a session. Sessions idle for ``UPLOAD_SESSION_TTL`` seconds are
+discarded.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import or_
+
+from extensions import db
+from models import Event, ALLOWED_IMAGE_EXTENSIONS, ALLOWED_VIDEO_EXTENSIONS, MAX_FILE_SIZE, MAX_VIDEO_SIZE, allowed_file
+from utils.image_variants import remove_variants
+from utils.media_index import register_media, unregister_media, media_exists
+from utils.storage import get_storage
+from utils.video_processing import remove_video_variants
+
+UPLOAD_KINDS = {
+    'image': {
+        'extensions': ALLOWED_IMAGE_EXTENSIONS,
+        'max_size': MAX_FILE_SIZE,
+        'directory': os.path.join('uploads', 'images'),
+    },
+    'video': {
+        'extensions': ALLOWED_VIDEO_EXTENSIONS,
+        'max_size': MAX_VIDEO_SIZE,
+        'directory': os.path.join('uploads', 'videos'),
+    },
+}
+
+BUFFER_SIZE = 64 * 1024
+_SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{2})/\1[0-9a-f]{62}\.[a-z0-9]+$')
+
+class UploadError(ValueError):
+    status = 400
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+class UploadNotFound(UploadError):
+    status = 404
+
+class UploadConflict(UploadError):
+    """A chunk did not start at the session's current offset."""
+    status = 409
+
+def _spec(kind):
+    try:
+        return UPLOAD_KINDS[kind]
+    except KeyError:
+        raise UploadError(f"Unknown upload kind: {kind}")
+
+def _limit_message(kind, spec):
+    return f"{kind.capitalize()} file size exceeds maximum limit of {spec['max_size'] // (1024*1024)}MB"
+
+def upload_extension(kind, filename):
+    """Validate ``filename`` for ``kind`` and return its lowercased extension."""
+    spec = _spec(kind)
+    if not allowed_file(filename, spec['extensions']):
+        raise UploadError(f"Invalid {kind} format. Allowed formats: {', '.join(sorted(spec['extensions']))}")
+    return filename.rsplit('.', 1)[1].lower()
+
+def content_path(kind, digest, extension):
+    """Storage path where content with ``digest`` is stored."""
+    return '/'.join((_spec(kind)['directory'].replace(os.sep, '/'), digest[:2], f"{digest}.{extension}"))
+
+def copy_stream(stream, fileobj, limit, written=0, message=None, hasher=None):
+    """Copy ``stream`` into ``fileobj`` block by block, never past ``limit`` bytes."""
+    while True:
+        block = stream.read(BUFFER_SIZE)
+        if not block:
+            return written
+        written += len(block)
+        if written > limit:
+            raise UploadTooLarge(message or f"Upload exceeds {limit} bytes")
+        if hasher is not None:
+            hasher.update(block)
+        fileobj.write(block)
+
+def _file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _session_dir():
+    return current_app.config['UPLOAD_SESSION_DIR']
+
+def _publish(tmp_path, relative_path):
+    """Move a finished temp file into storage at ``relative_path``."""
+    storage = get_storage()
+    if storage.exists(relative_path):
+        # Same content already stored; touch it so the media GC grace period
+        # covers the new reference until it is saved
+        os.remove(tmp_path)
+        storage.touch(relative_path)
+        register_media(relative_path)
+        current_app.logger.info(f"Upload deduplicated to {relative_path}")
+        return relative_path
+
+    storage.save(tmp_path, relative_path)
+    register_media(relative_path)
+    current_app.logger.info(f"Upload stored at {relative_path}")
+    return relative_path
+
+def save_upload(file, kind):
+    """Stream a ``FileStorage`` into storage and return its path."""
+    return store_stream(file.stream, file.filename, kind)
+
+def store_stream(stream, filename, kind):
+    """Stream a binary file object named ``filename`` into storage and return its path."""
+    spec = _spec(kind)
+    extension = upload_extension(kind, filename)
+    hasher = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=_session_dir(), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            copy_stream(stream, out, spec['max_size'], message=_limit_message(kind, spec), hasher=hasher)
+            out.flush()
+            os.fsync(out.fileno())
+        current_app.logger.info(f"Received {kind} {filename}")
+        return _publish(tmp_path, content_path(kind, hasher.hexdigest(), extension))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def is_upload_path(kind, path):
+    """True if ``path`` is a content-addressed upload name for ``kind``."""
+    directory = _spec(kind)['directory'].replace(os.sep, '/') + '/'
+    path = path.replace(os.sep, '/')
+    return path.startswith(directory) and bool(_CONTENT_NAME.match(path[len(directory):]))
+
+def claim_upload(kind, path):
+    """Return ``path`` if it names a finished upload of ``kind``, else None."""
+    if not path:
+        return None
+    path = path.replace(os.sep, '/')
+    if not is_upload_path(kind, path):
+        raise UploadError(f"Uploaded {kind} not found, please upload it again")
+    if not media_exists(path):
+        # Sent straight to the store, so the index hasn't seen it yet
+        if not get_storage().exists(path):
+            raise UploadError(f"Uploaded {kind} not found, please upload it again")
+        register_media(path)
+    return path
+
+def direct_upload(kind, filename, size, digest):
+    """Let the browser send a file straight to the storage backend.
+
+    Returns ``{'path', 'complete', 'upload'}``. ``upload`` is the presigned
+    request to make, or None if the content is already stored. Raises
+    UploadError if the backend can't take direct uploads.
+    """
+    storage = get_storage()
+    if not storage.supports_direct_upload:
+        raise UploadError("Direct uploads are not supported by this storage backend")
+    spec = _spec(kind)
+    extension = upload_extension(kind, filename)
+    if not isinstance(digest, str) or not _DIGEST.match(digest):
+        raise UploadError("A SHA-256 digest of the file is required")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("Upload size is required")
+    if size <= 0:
+        raise UploadError("Upload is empty")
+    if size > spec['max_size']:
+        raise UploadTooLarge(_limit_message(kind, spec))
+
+    path = content_path(kind, digest, extension)
+    if storage.exists(path):
+        storage.touch(path)
+        register_media(path)
+        current_app.logger.info(f"Direct upload of {filename} deduplicated to {path}")
+        return {'path': path, 'complete': True, 'upload': None}
+    current_app.logger.info(f"Presigned direct upload of {kind} {filename} to {path} ({size} bytes)")
+    return {'path': path, 'complete': False, 'upload': storage.presign_upload(path, size, digest)}
+
+def is_referenced(path, exclude_event_id=None):
+    """True if any event (other than ``exclude_event_id``) uses ``path``."""
+    query = Event.query.filter(or_(Event.image_path == path, Event.video_path == path))
+    if exclude_event_id is not None:
+        query = query.filter(Event.id != exclude_event_id)
+    return db.session.query(query.exists()).scalar()
+
+def _delete_media(path):
+    get_storage().delete(path)
+    unregister_media(path)
+
+def _recently_stored(path):
+    """True if ``path`` was written or reused within ``MEDIA_GC_GRACE_PERIOD``."""
+    try:
+        mtime = get_storage().mtime(path)
+    except FileNotFoundError:
+        return False
+    return mtime > time.time() - current_app.config['MEDIA_GC_GRACE_PERIOD']
+
+def release_event_media(event_id, image=None, video=None):
+    """Delete media an event no longer uses unless another event shares it.
+
+    ``image`` and ``video`` are ``(path, variants manifest)`` pairs the event
+    has dropped. Call after committing the change that dropped them. Files
+    stored or reused within the GC grace period are left to the media GC:
+    an upload of the same content may be about to reference them.
+    """
+    for entry, remove in ((image, remove_variants), (video, remove_video_variants)):
+        path, manifest = entry or (None, None)
+        if not path:
+            continue
+        if is_referenced(path, exclude_event_id=event_id):
+            current_app.logger.info(f"Keeping {path}, still used by another event")
+            continue
+        if _recently_stored(path):
+            current_app.logger.info(f"Keeping {path}, stored recently; the media GC will collect it if unused")
+            continue
+        _delete_media(path)
+        remove(manifest)
+        current_app.logger.info(f"Released {path}")
+
+def _session_paths(upload_id):
+    if not upload_id or not _SESSION_ID.match(upload_id):
+        raise UploadNotFound("Unknown upload")
+    base = os.path.join(_session_dir(), upload_id)
+    return base + '.json', base + '.part'
+
+def _load_session(upload_id):
+    meta_path, part_path = _session_paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            return json.load(f), meta_path, part_path
+    except FileNotFoundError:
+        raise UploadNotFound("Unknown or expired upload")
+
+def _status(meta, offset, complete=False):
+    return {
+        'id': meta['id'],
+        'kind': meta['kind'],
+        'path': meta['path'],
+        'size': meta['size'],
+        'offset': offset,
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+        'complete': complete,
+    }
+
+def _discard(meta_path, part_path):
+    for path in (meta_path, part_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def purge_stale_sessions():
+    """Remove sessions that have not received a chunk within the TTL."""
+    cutoff = time.time() - current_app.config['UPLOAD_SESSION_TTL']
+    removed = 0
+    for entry in os.scandir(_session_dir()):
+        if entry.name.endswith(('.json', '.part')) and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+def create_session(kind, filename, size):
+    """Open a resumable upload session for a file of ``size`` bytes."""
+    spec = _spec(kind)
+    extension = upload_extension(kind, filename)
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("Upload size is required")
+    if size <= 0:
+        raise UploadError("Upload is empty")
+    if size > spec['max_size']:
+        raise UploadTooLarge(_limit_message(kind, spec))
+
+    purge_stale_sessions()
+    meta = {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'extension': extension,
+        'path': None,
+        'size': size,
+        'created': time.time(),
+    }
+    meta_path, part_path = _session_paths(meta['id'])
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    current_app.logger.info(f"Opened upload session {meta['id']} for {kind} {filename} ({size} bytes)")
+    return _status(meta, 0)
+
+def session_status(upload_id):
+    meta, _, part_path = _load_session(upload_id)
+    return _status(meta, os.path.getsize(part_path))
+
+def append_chunk(upload_id, stream, start, stop, total):
+    """Append bytes ``[start, stop)`` of the file from ``stream``.
+
+    The chunk must start at the current offset; otherwise UploadConflict is
+    raised and the client resumes from ``session_status``. The chunk that
+    completes the file publishes it and closes the session.
+    """
+    meta, meta_path, part_path = _load_session(upload_id)
+    if total != meta['size'] or stop > total or start >= stop:
+        raise UploadError("Content-Range does not match the upload")
+
+    with open(part_path, 'ab') as out:
+        try:
+            fcntl.flock(out.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Another chunk of this upload is in progress")
+        offset = os.fstat(out.fileno()).st_size
+        if start != offset:
+            raise UploadConflict(f"Expected a chunk starting at byte {offset}")
+        try:
+            written = copy_stream(stream, out, stop, written=start,
+                                  message="Chunk is larger than its Content-Range")
+            if written != stop:
+                raise UploadError("Chunk is shorter than its Content-Range")
+            out.flush()
+        except BaseException:
+            out.truncate(offset)
+            raise
+        if written == total:
+            os.fsync(out.fileno())
+
+    os.utime(meta_path)
+    if written < total:
+        return _status(meta, written)
+
+    meta['path'] = _publish(part_path, content_path(meta['kind'], _file_digest(part_path), meta['extension']))
+    _discard(meta_path, part_path)
+    return _status(meta, written, complete=True)
+
+def init_app(app):
+    """Create the session directory (default ``instance/uploads``)."""
+    directory = app.config.get('UPLOAD_SESSION_DIR') or os.path.join(app.instance_path, 'uploads')
+    os.makedirs(directory, exist_ok=True)
+    app.config['UPLOAD_SESSION_DIR'] = directory
+    app.config.setdefault('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+    app.config.setdefault('UPLOAD_SESSION_TTL', 24 * 60 * 60)
@@ -0,0 +1,106 @@
+"""Short-lived cache of the logged-in user's identity.
+
+Flask-Login calls the user loader on every authenticated request, and every
+admin view then checks ``current_user.is_admin``. Instead of a primary-key
+lookup per request (and per Flask-Admin asset), the loader keeps a plain
+``CachedUser`` with the id, username and admin flag for ``USER_CACHE_TTL``
+seconds (0 disables the cache).
+
+Entries are also stamped with the ``users`` invalidation generation. A
+session listener calls ``invalidate_users`` after any commit that inserted,
+changed or deleted a ``User`` (password, admin flag, deletion), whichever
+code path made it, which drops the cached identities in every worker.
+Logging in always checks the password against the database.
+"""
+import threading
+import time
+from itertools import chain
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from utils.invalidation import get_generation, bump_generation
+
+USERS_CHANNEL = 'users'
+
+class CachedUser(UserMixin):
+    """Detached identity of a logged-in user; safe to share across requests."""
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+# user id (as stored in the session) -> (generation, expires_at, CachedUser)
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def load_user(user_id):
+    """Return the identity for ``user_id``, or None if the user is gone."""
+    from models import User
+
+    ttl = current_app.config.get('USER_CACHE_TTL', 60)
+    generation = get_generation(USERS_CHANNEL)
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] == generation and cached[1] > now:
+        return cached[2]
+
+    user = db.session.get(User, int(user_id))
+    if user is None:
+        forget_user(user_id)
+        return None
+    identity = CachedUser(user.id, user.username, bool(user.is_admin))
+    if ttl > 0:
+        with _user_cache_lock:
+            _user_cache[user_id] = (generation, now + ttl, identity)
+    return identity
+
+def forget_user(user_id):
+    """Drop one cached identity in this process, e.g. on logout."""
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+def invalidate_users():
+    """Drop cached identities in every worker.
+
+    Called by the session listeners after a commit that changed a user.
+    """
+    with _user_cache_lock:
+        _user_cache.clear()
+    generation = bump_generation(USERS_CHANNEL)
+    current_app.logger.info(f"User generation bumped to {generation}")
+    return generation
+
+@sa_event.listens_for(Session, 'after_flush')
+def _note_user_changes(session, flush_context):
+    from models import User
+
+    if any(isinstance(obj, User) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['users_changed'] = True
+
+@sa_event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_user_changes(orm_execute_state):
+    from models import User
+
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and \
+            orm_execute_state.bind_mapper is not None and orm_execute_state.bind_mapper.class_ is User:
+        orm_execute_state.session.info['users_changed'] = True
+
+@sa_event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    if session.info.pop('users_changed', False) and has_app_context():
+        invalidate_users()
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _forget_user_changes(session):
+    session.info.pop('users_changed', None)
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_TTL', 60)
@@ -0,0 +1,185 @@
+"""Poster frames and web-optimised MP4s for uploaded event videos.
+
+Uploads may be MOV, AVI or WMV, and even MP4 uploads often have their
+``moov`` atom at the end, which forces a full download before playback
+starts. After a video is saved, the admin queues a ``video_variants`` job
+that uses ffmpeg to write:
+
+- ``uploads/videos/web/<name>.mp4``: H.264/AAC with ``+faststart``. Sources
+  that are already H.264 (and AAC or silent) are only remuxed.
+- ``uploads/videos/posters/<name>.jpg``: a frame from ``VIDEO_POSTER_OFFSET``
+  seconds in.
+
+Outputs are named after the content-addressed upload, so events that share
+a video share its outputs and the job reuses them. The result is stored in
+``Event.video_variants`` and ``Event.video_status`` moves from ``pending`` to
+``ready``, or to ``failed`` once the job's last attempt fails. If ffmpeg is not
+installed, the status becomes ``unavailable`` and templates keep serving the
+original upload. ``VIDEO_FFMPEG_PATH`` and ``VIDEO_FFPROBE_PATH`` override
+the binaries found on PATH.
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from flask import current_app
+
+from utils.jobs import job_handler, is_final_attempt
+from utils.media_index import register_media, unregister_media, media_exists
+from utils.page_cache import invalidate_pages, EVENTS_CHANNEL
+from utils.storage import get_storage
+
+WEB_VIDEO_DIR = 'uploads/videos/web'
+POSTER_DIR = 'uploads/videos/posters'
+
+class VideoToolsUnavailable(RuntimeError):
+    pass
+
+def _binary(config_key, name):
+    path = current_app.config.get(config_key) or shutil.which(name)
+    if not path:
+        raise VideoToolsUnavailable(f"{name} is not installed")
+    return path
+
+def _run(args):
+    result = subprocess.run(args, capture_output=True, text=True,
+                            timeout=current_app.config['VIDEO_PROCESS_TIMEOUT'])
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(args[0])} exited with {result.returncode}: {result.stderr.strip()[-500:]}")
+    return result.stdout
+
+def probe(source):
+    """Codec, size and duration of a video file, from ffprobe."""
+    output = _run([_binary('VIDEO_FFPROBE_PATH', 'ffprobe'), '-v', 'error',
+                   '-show_entries', 'stream=codec_type,codec_name,width,height:format=duration',
+                   '-of', 'json', source])
+    data = json.loads(output)
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    duration = data.get('format', {}).get('duration')
+    return {
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'duration': float(duration) if duration else None,
+    }
+
+def _output(relative_path, suffix):
+    """Temp file that ``_publish`` can move to ``relative_path`` in storage."""
+    fd, tmp_path = tempfile.mkstemp(dir=get_storage().staging_dir(relative_path), prefix='.video-', suffix=suffix)
+    os.close(fd)
+    return tmp_path
+
+def _publish(tmp_path, relative_path):
+    get_storage().save(tmp_path, relative_path)
+
+def generate_video_variants(video_path):
+    """Write the faststart MP4 and poster for the stored ``video_path``; return the manifest."""
+    with get_storage().local_copy(video_path) as source:
+        return _generate(video_path, source)
+
+def _generate(video_path, source):
+    ffmpeg = _binary('VIDEO_FFMPEG_PATH', 'ffmpeg')
+    info = probe(source)
+    stem = os.path.basename(video_path)
+    web_path = f"{WEB_VIDEO_DIR}/{stem}.mp4"
+    poster_path = f"{POSTER_DIR}/{stem}.jpg"
+
+    remux = info['video_codec'] == 'h264' and info['audio_codec'] in (None, 'aac')
+    if remux:
+        codec_args = ['-c', 'copy']
+    else:
+        codec_args = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+                      '-vf', f"scale='min({current_app.config['VIDEO_MAX_WIDTH']},iw)':-2",
+                      '-c:a', 'aac', '-b:a', '128k']
+
+    tmp_video = _output(web_path, '.mp4')
+    tmp_poster = _output(poster_path, '.jpg')
+    try:
+        _run([ffmpeg, '-y', '-v', 'error', '-i', source, '-map', '0:v:0', '-map', '0:a:0?',
+              *codec_args, '-movflags', '+faststart', tmp_video])
+
+        offset = current_app.config['VIDEO_POSTER_OFFSET']
+        if info['duration'] is not None:
+            offset = min(offset, info['duration'] / 2)
+        _run([ffmpeg, '-y', '-v', 'error', '-ss', f"{offset:.2f}", '-i', source,
+              '-frames:v', '1', '-q:v', '3', tmp_poster])
+
+        _publish(tmp_video, web_path)
+        _publish(tmp_poster, poster_path)
+        register_media(web_path, poster_path)
+    finally:
+        for path in (tmp_video, tmp_poster):
+            if os.path.exists(path):
+                os.remove(path)
+
+    current_app.logger.info(f"Processed video {video_path} ({'remuxed' if remux else 'transcoded'})")
+    return {
+        'mp4': web_path,
+        'poster': poster_path,
+        'width': info['width'],
+        'height': info['height'],
+        'duration': info['duration'],
+        'remuxed': remux,
+    }
+
+def remove_video_variants(manifest):
+    """Delete the files listed in a manifest from ``generate_video_variants``."""
+    paths = [path for path in ((manifest or {}).get(key) for key in ('mp4', 'poster')) if path]
+    for path in paths:
+        get_storage().delete(path)
+    if paths:
+        unregister_media(*paths)
+
+@job_handler('video_variants', max_attempts=2, concurrency=1)
+def build_event_video_variants(event_id, video_path):
+    """Job: build the web MP4 and poster for an event video saved by the admin.
+
+    Replaced videos are released by the admin once no event uses them.
+    """
+    from extensions import db
+    from models import Event
+    from utils.image_variants import shared_manifest
+
+    event = db.session.get(Event, event_id)
+    if event is None or event.video_path != video_path:
+        # Deleted or replaced since the job was queued
+        return
+
+    manifest = shared_manifest(Event, Event.video_path, Event.video_variants, video_path, event_id)
+    if manifest and all(media_exists(manifest[key]) for key in ('mp4', 'poster')):
+        event.video_variants = manifest
+        event.video_status = 'ready'
+        db.session.commit()
+        invalidate_pages(EVENTS_CHANNEL)
+        return
+
+    try:
+        manifest = generate_video_variants(video_path)
+    except VideoToolsUnavailable as e:
+        current_app.logger.warning(f"Skipping video processing for {video_path}: {str(e)}")
+        event.video_status = 'unavailable'
+        db.session.commit()
+        return
+    except Exception:
+        # Until the last attempt the job will be retried; stay pending meanwhile
+        if is_final_attempt():
+            event.video_status = 'failed'
+            db.session.commit()
+        raise
+
+    event.video_variants = manifest
+    event.video_status = 'ready'
+    db.session.commit()
+    invalidate_pages(EVENTS_CHANNEL)
+
+def init_app(app):
+    app.config.setdefault('VIDEO_FFMPEG_PATH', None)
+    app.config.setdefault('VIDEO_FFPROBE_PATH', None)
+    app.config.setdefault('VIDEO_PROCESS_TIMEOUT', 15 * 60)
+    app.config.setdefault('VIDEO_MAX_WIDTH', 1920)
+    app.config.setdefault('VIDEO_POSTER_OFFSET', 1.0)